@@ -159,6 +159,13 @@ import os
 
 MEDIA_URL = '/media/'  # URL prefix for media files
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')  # Directory where uploaded files are stored
+DATASET_CACHE_ROOT = os.path.join(MEDIA_ROOT, 'dataset_cache')  # Columnar copies of uploads, keyed by dataset_hash
+# Store datasets with compact dtypes: downcast numbers, and text columns with at most
+# DATASET_CATEGORY_MAX_RATIO distinct values per row as pandas categoricals
+DATASET_COMPACT_DTYPES = os.environ.get('DATASET_COMPACT_DTYPES', '1') == '1'
+DATASET_CATEGORY_MAX_RATIO = 0.5
+# Rows per chunk when converting a CSV upload into the columnar cache
+DATASET_CACHE_CHUNK_ROWS = 100000
 
 REST_FRAMEWORK = {
 
@@ -192,6 +199,59 @@ CACHES = {
         "LOCATION": "cache_table",  # Name of the cache table
     }
 }
+
+# Training jobs run in a separate pool of worker processes
+TRAINING_WORKERS = int(os.environ.get('TRAINING_WORKERS', 2))
+# The web process touches the jobs it queued every TRAINING_JOB_HEARTBEAT_SECONDS; an unfinished
+# job untouched for TRAINING_JOB_STALE_SECONDS lost its process and is reported as failed
+TRAINING_JOB_HEARTBEAT_SECONDS = 30
+TRAINING_JOB_STALE_SECONDS = 300
+
+# Loaded model bundles kept in memory per web process for PredictionView
+MODEL_BUNDLE_CACHE_SIZE = 16
+MODEL_BUNDLE_CACHE_MAX_BYTES = 1024 * 1024 * 1024  # 1 GB of joblib artifacts
+
+# Fitted models of previous training runs, reused when the same dataset and config are trained again
+TRAINING_RESULT_CACHE_ROOT = os.path.join(MEDIA_ROOT, 'training_cache')
+TRAINING_RESULT_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # 2 GB
+
+# Encoded/scaled train-test splits, shared by runs that only change the model type or its parameters
+PREPROCESSED_SPLIT_CACHE_ROOT = os.path.join(MEDIA_ROOT, 'split_cache')
+PREPROCESSED_SPLIT_CACHE_MAX_BYTES = 4 * 1024 * 1024 * 1024  # 4 GB
+
+# Models fitted in parallel by one comparison job, and the most a single comparison may request
+MODEL_COMPARISON_WORKERS = int(os.environ.get('MODEL_COMPARISON_WORKERS', 4))
+MODEL_COMPARISON_MAX_MODELS = 10
+
+# Cross-validation limits: folds per run, and folds fitted in parallel by one training job
+CV_MAX_FOLDS = 20
+CV_MAX_JOBS = int(os.environ.get('CV_MAX_JOBS', 4))
+
+# Hyperparameter search limits: candidates per search, parallel fits per search, and wall-clock budget in seconds
+SEARCH_MAX_CANDIDATES = 200
+SEARCH_MAX_JOBS = int(os.environ.get('SEARCH_MAX_JOBS', 4))
+SEARCH_MAX_TIME_BUDGET = 600
+
+# Resumable uploads: partial files of open upload sessions, and the largest chunk one PUT may carry
+UPLOAD_SESSION_ROOT = os.path.join(MEDIA_ROOT, 'upload_sessions')
+UPLOAD_CHUNK_MAX_BYTES = 64 * 1024 * 1024  # 64 MB
+
+# Rows per chunk when profiling a dataset in the background
+PROFILE_CHUNK_ROWS = 100000
+
+# Rows in the random sample DatasetPreviewAPI computes stats on for files without a stored profile
+PREVIEW_SAMPLE_ROWS = 10000
+
+# Rows ColumnsView reads after the header to infer column dtypes
+COLUMNS_SAMPLE_ROWS = 100
+
+# Rows per chunk, and the most passes over them, for streaming (partial_fit) training
+STREAMING_CHUNK_ROWS = 50000
+STREAMING_MAX_EPOCHS = 50
+
+# Rows scored per predict call when streaming batch predictions
+BATCH_PREDICTION_CHUNK_SIZE = 50000
+
 #  session storage
 # SESSION_ENGINE = "django.contrib.sessions.backends.file"  # File-based session storage
 # SESSION_FILE_PATH = "backend_app\sessions"  # Path to store session files
\ No newline at end of file
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from backend_app.models import UploadedDataset, ModelConfig, SavedModel, SecretQuestion, UserSecretAnswer
+from backend_app.models import UploadedDataset, ModelConfig, SavedModel, SecretQuestion, UserSecretAnswer, TrainingJob, UploadSession
 # Register your models here.
 
 admin.site.register(UploadedDataset)
@@ -8,4 +8,6 @@ admin.site.register(ModelConfig)
 admin.site.register(SavedModel)
 admin.site.register(SecretQuestion)
 admin.site.register(UserSecretAnswer)
+admin.site.register(TrainingJob)
+admin.site.register(UploadSession)
 
@@ -0,0 +1,399 @@
+import json
+import logging
+import os
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_FILE = 'schema.json'
+SCHEMA_VERSION = 2
+
+
+def read_dataset_file(path, usecols=None, nrows=None):
+    """Parse a stored CSV/Excel upload directly, bypassing the columnar cache."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        return pd.read_csv(path, usecols=usecols, nrows=nrows)
+    elif ext in ('.xls', '.xlsx'):
+        return pd.read_excel(path, usecols=usecols, nrows=nrows)
+    else:
+        raise ValueError("Unsupported file type")
+
+
+def dataset_cache_dir(dataset_hash):
+    return os.path.join(settings.DATASET_CACHE_ROOT, dataset_hash)
+
+
+def memory_usage(df):
+    return int(df.memory_usage(index=False, deep=True).sum())
+
+
+def compact_dtypes(df, category_max_ratio=0.5):
+    """
+    Shrink the dtypes of a freshly parsed frame in place: integers to the
+    smallest type that holds their range, floats to float32 when that loses
+    nothing, and text columns with at most ``category_max_ratio`` distinct
+    values per non-null row to ``category``.
+    """
+    for col in df.columns:
+        series = df[col]
+        kind = series.dtype.kind
+        if kind == 'i':
+            df[col] = pd.to_numeric(series, downcast='integer')
+        elif kind == 'u':
+            df[col] = pd.to_numeric(series, downcast='unsigned')
+        elif kind == 'f':
+            compact = series.astype(np.float32)
+            if np.array_equal(compact.to_numpy(np.float64), series.to_numpy(), equal_nan=True):
+                df[col] = compact
+        elif series.dtype == 'O' and series.nunique() <= category_max_ratio * series.count():
+            df[col] = series.astype('category')
+    return df
+
+
+def write_column_store(df, path, memory=None):
+    """
+    Write ``df`` as one ``.npy`` file per column plus a schema.
+
+    Object and category columns are stored as the smallest integer codes
+    that fit and a JSON list of their distinct values, so every column loads
+    back with the dtype it was parsed with and without re-parsing any text.
+    """
+    columns = []
+    for i, col in enumerate(df.columns):
+        series = df[col]
+        entry = {'name': col, 'file': f'{i}.npy', 'dtype': str(series.dtype)}
+        if series.dtype == 'O' or isinstance(series.dtype, pd.CategoricalDtype):
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                codes, uniques = series.cat.codes.to_numpy(), series.cat.categories
+                entry['category'] = True
+            else:
+                codes, uniques = pd.factorize(series, use_na_sentinel=True)
+            np.save(os.path.join(path, entry['file']), codes.astype(np.min_scalar_type(-len(uniques) - 1)))
+            entry['categories'] = f'{i}.categories.json'
+            with open(os.path.join(path, entry['categories']), 'w') as f:
+                json.dump([v.item() if hasattr(v, 'item') else v for v in uniques], f, default=str)
+        else:
+            np.save(os.path.join(path, entry['file']), series.to_numpy())
+        columns.append(entry)
+
+    schema = {'version': SCHEMA_VERSION, 'rows': len(df), 'columns': columns, 'memory': memory}
+    with open(os.path.join(path, SCHEMA_FILE), 'w') as f:
+        json.dump(schema, f)
+    return schema
+
+
+def _integer_dtype(low, high, compact):
+    """Smallest signed integer type holding ``[low, high]`` (int64 unless ``compact``)."""
+    for dtype in ((np.int8, np.int16, np.int32, np.int64) if compact else (np.int64,)):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.uint64)
+
+
+class _ColumnScan:
+    """What the first pass over a CSV learns about one column, chunk by chunk."""
+
+    def __init__(self):
+        self.kinds = set()
+        self.gaps = False
+        self.low = self.high = None
+        self.float32_lossless = True
+        self.uniques = {}
+        self.count = 0
+
+    def update(self, series):
+        values = series.dropna()
+        # Integer and boolean columns with missing values parse as float and object
+        self.gaps = self.gaps or len(values) < len(series)
+        if values.empty:
+            return
+
+        kind = {'u': 'i'}.get(series.dtype.kind, series.dtype.kind)
+        if kind == 'O' and all(isinstance(value, (bool, np.bool_)) for value in values.unique()):
+            kind = 'b'
+        self.kinds.add(kind)
+        self.count += len(values)
+        if kind == 'i':
+            low, high = values.min(), values.max()
+            self.low = low if self.low is None else min(self.low, low)
+            self.high = high if self.high is None else max(self.high, high)
+        if kind in 'if' and self.float32_lossless:
+            as_float = values.to_numpy(np.float64)
+            self.float32_lossless = np.array_equal(as_float.astype(np.float32), as_float)
+        if kind not in 'if':
+            for value in values.unique():
+                self.uniques.setdefault(value, None)
+
+    def text_mixed(self):
+        """Text in some chunks and numbers or booleans in others: re-read as raw strings."""
+        return 'O' in self.kinds and len(self.kinds) > 1 or self.kinds == {'b', 'i'} or self.kinds == {'b', 'f'}
+
+    def dtype(self, compact, category_max_ratio):
+        if self.kinds == {'i'} and not self.gaps:
+            return _integer_dtype(self.low, self.high, compact)
+        if self.kinds <= {'i', 'f'}:
+            return np.dtype(np.float32 if compact and self.float32_lossless else np.float64)
+        if self.kinds == {'b'} and not self.gaps:
+            return np.dtype(bool)
+        if compact and len(self.uniques) <= category_max_ratio * self.count:
+            return pd.CategoricalDtype()
+        return np.dtype(object)
+
+
+def write_csv_column_store(path, out_dir, chunksize, compact=True, category_max_ratio=0.5):
+    """
+    ``write_column_store`` for a CSV file, without ever parsing all of it at
+    once: a first pass over ``chunksize`` rows at a time settles each
+    column's dtype and distinct text values, a second writes the rows into
+    memory-mapped ``.npy`` files. Only one chunk, plus the distinct values of
+    the text columns, is held in memory.
+    """
+    names = list(pd.read_csv(path, nrows=0).columns)
+    scans = {col: _ColumnScan() for col in names}
+    rows = parsed_bytes = 0
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        rows += len(chunk)
+        parsed_bytes += memory_usage(chunk)
+        for col in names:
+            scans[col].update(chunk[col])
+
+    # Columns parsed as text in some chunks and as numbers in others are
+    # read as raw strings throughout, and their distinct values re-collected
+    read_as_text = {col: object for col, scan in scans.items() if scan.text_mixed()}
+    if read_as_text:
+        for col in read_as_text:
+            scans[col] = _ColumnScan()
+        for chunk in pd.read_csv(path, usecols=list(read_as_text), dtype=read_as_text, chunksize=chunksize):
+            for col in read_as_text:
+                scans[col].update(chunk[col])
+
+    columns, outputs, lookups, text_columns = [], {}, {}, set()
+    compact_bytes = 0
+    for i, col in enumerate(names):
+        dtype = scans[col].dtype(compact, category_max_ratio) if rows else np.dtype(object)
+        entry = {'name': col, 'file': f'{i}.npy', 'dtype': str(dtype)}
+        if isinstance(dtype, pd.CategoricalDtype) or dtype == object:
+            uniques = list(scans[col].uniques)
+            if isinstance(dtype, pd.CategoricalDtype):
+                # The order astype('category') gives
+                try:
+                    uniques = sorted(uniques)
+                except TypeError:
+                    pass
+                entry['category'] = True
+                compact_bytes += int(pd.Index(uniques, dtype=object).memory_usage(deep=True))
+            else:
+                text_columns.add(col)
+            lookups[col] = pd.Index(uniques, dtype=object)
+            entry['categories'] = f'{i}.categories.json'
+            with open(os.path.join(out_dir, entry['categories']), 'w') as f:
+                json.dump([v.item() if hasattr(v, 'item') else v for v in uniques], f, default=str)
+            dtype = np.min_scalar_type(-len(uniques) - 1)
+        outputs[col] = np.lib.format.open_memmap(
+            os.path.join(out_dir, entry['file']), mode='w+', dtype=dtype, shape=(rows,)
+        )
+        if col not in text_columns:
+            compact_bytes += rows * outputs[col].dtype.itemsize
+        columns.append(entry)
+
+    start = 0
+    for chunk in pd.read_csv(path, chunksize=chunksize, dtype=read_as_text or None):
+        stop = start + len(chunk)
+        for col in names:
+            if col in lookups:
+                # Missing values map to code -1, as with pd.factorize
+                outputs[col][start:stop] = lookups[col].get_indexer(chunk[col].to_numpy(object))
+                if col in text_columns:
+                    compact_bytes += int(chunk[col].memory_usage(index=False, deep=True))
+            else:
+                outputs[col][start:stop] = chunk[col].to_numpy().astype(outputs[col].dtype)
+        start = stop
+    for output in outputs.values():
+        output.flush()
+
+    memory = {'parsed_bytes': parsed_bytes, 'compact_bytes': compact_bytes}
+    schema = {'version': SCHEMA_VERSION, 'rows': rows, 'columns': columns, 'memory': memory}
+    with open(os.path.join(out_dir, SCHEMA_FILE), 'w') as f:
+        json.dump(schema, f)
+    return schema
+
+
+def build_dataset_cache(dataset):
+    """
+    Convert an ``UploadedDataset`` into its columnar cache (once per
+    ``dataset_hash``). CSV files are converted in chunks; Excel files can't
+    be read incrementally and are parsed whole.
+    """
+    if not dataset.dataset_hash:
+        return None
+
+    final_dir = dataset_cache_dir(dataset.dataset_hash)
+    schema = read_schema(dataset.dataset_hash)
+    if schema is not None:
+        return schema
+
+    path = dataset.dataset.path
+    # Write into a scratch directory and rename so readers never see half a cache
+    tmp_dir = f'{final_dir}.{uuid.uuid4().hex[:8]}.tmp'
+    os.makedirs(tmp_dir)
+    try:
+        if os.path.splitext(path)[1].lower() == '.csv':
+            schema = write_csv_column_store(
+                path, tmp_dir, settings.DATASET_CACHE_CHUNK_ROWS,
+                settings.DATASET_COMPACT_DTYPES, settings.DATASET_CATEGORY_MAX_RATIO
+            )
+            memory = schema['memory']
+        else:
+            df = read_dataset_file(path)
+            memory = {'parsed_bytes': memory_usage(df)}
+            if settings.DATASET_COMPACT_DTYPES:
+                df = compact_dtypes(df, settings.DATASET_CATEGORY_MAX_RATIO)
+            memory['compact_bytes'] = memory_usage(df)
+            schema = write_column_store(df, tmp_dir, memory)
+            del df
+        logger.info(
+            "Dataset %s in memory: %d -> %d bytes",
+            dataset.dataset_hash[:12], memory['parsed_bytes'], memory['compact_bytes']
+        )
+
+        if os.path.isdir(final_dir) and read_schema(dataset.dataset_hash) is None:
+            # Left by an older schema version
+            shutil.rmtree(final_dir, ignore_errors=True)
+        try:
+            os.replace(tmp_dir, final_dir)
+        except OSError:
+            # Another process finished the same dataset first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return schema
+
+
+def read_schema(dataset_hash):
+    path = os.path.join(dataset_cache_dir(dataset_hash), SCHEMA_FILE)
+    try:
+        with open(path) as f:
+            schema = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return schema if schema.get('version') == SCHEMA_VERSION else None
+
+
+def ensure_dataset_cache(dataset):
+    """Return the cache schema, building the cache for datasets uploaded before it existed."""
+    if not dataset.dataset_hash:
+        return None
+    return read_schema(dataset.dataset_hash) or build_dataset_cache(dataset)
+
+
+def dataset_memory_usage(dataset):
+    """In-memory size of a dataset as parsed and as loaded from the cache, if it is cached."""
+    schema = read_schema(dataset.dataset_hash) if dataset.dataset_hash else None
+    return schema.get('memory') if schema is not None else None
+
+
+def _category_lookup(path, entry):
+    with open(os.path.join(path, entry['categories'])) as f:
+        categories = json.load(f)
+    if entry.get('category'):
+        return pd.CategoricalDtype(categories)
+    # Code -1 (missing) picks the trailing NaN
+    return np.array(categories + [np.nan], dtype=object)
+
+
+def _load_column(path, entry, nrows=None, start=0, lookup=None):
+    # Memory-map so a head-only or chunked read touches just the requested rows
+    values = np.load(os.path.join(path, entry['file']), mmap_mode='r', allow_pickle=False)
+    values = values[start:] if nrows is None else values[start:start + nrows]
+    values = np.array(values)
+
+    if 'categories' in entry:
+        if lookup is None:
+            lookup = _category_lookup(path, entry)
+        if isinstance(lookup, pd.CategoricalDtype):
+            values = pd.Categorical.from_codes(values, dtype=lookup)
+        else:
+            values = lookup[values]
+    return values
+
+
+def dataset_columns(dataset):
+    """Column names of a dataset, from the cache schema or else the file header; never builds the cache."""
+    schema = read_schema(dataset.dataset_hash) if dataset.dataset_hash else None
+    if schema is None:
+        return list(read_dataset_file(dataset.dataset.path, nrows=0).columns)
+    return [entry['name'] for entry in schema['columns']]
+
+
+def load_dataset(dataset, columns=None, nrows=None):
+    """
+    Load an ``UploadedDataset`` as a DataFrame, reading only ``columns``
+    (all when None) and the first ``nrows`` rows (all when None).
+
+    A head-only read of a dataset that isn't cached yet parses just those
+    rows from the file rather than building the cache first.
+    """
+    if nrows is not None and dataset.dataset_hash:
+        schema = read_schema(dataset.dataset_hash)
+    else:
+        schema = ensure_dataset_cache(dataset)
+    if schema is None:
+        return read_dataset_file(dataset.dataset.path, usecols=columns, nrows=nrows)
+
+    path = dataset_cache_dir(dataset.dataset_hash)
+    entries = {entry['name']: entry for entry in schema['columns']}
+    names = list(entries) if columns is None else list(dict.fromkeys(columns))
+
+    missing = [col for col in names if col not in entries]
+    if missing:
+        raise KeyError(f"Columns not found in dataset: {', '.join(map(str, missing))}")
+
+    return pd.DataFrame(
+        {col: _load_column(path, entries[col], nrows) for col in names},
+        columns=names
+    )
+
+
+def iter_dataset_chunks(dataset, chunksize, columns=None, build_cache=True):
+    """
+    Yield a dataset as DataFrames of at most ``chunksize`` rows, so a full
+    pass over it never holds more than one chunk in memory. With
+    ``build_cache=False`` an uncached dataset is read from the file instead.
+    """
+    if build_cache or not dataset.dataset_hash:
+        schema = ensure_dataset_cache(dataset)
+    else:
+        schema = read_schema(dataset.dataset_hash)
+    if schema is None:
+        yield from _iter_file_chunks(dataset.dataset.path, chunksize, columns)
+        return
+
+    path = dataset_cache_dir(dataset.dataset_hash)
+    entries = {entry['name']: entry for entry in schema['columns']}
+    names = list(entries) if columns is None else list(dict.fromkeys(columns))
+    # Decode tables are loaded once, not once per chunk
+    lookups = {col: _category_lookup(path, entries[col]) for col in names if 'categories' in entries[col]}
+    for start in range(0, schema['rows'], chunksize):
+        yield pd.DataFrame(
+            {col: _load_column(path, entries[col], chunksize, start=start, lookup=lookups.get(col)) for col in names},
+            columns=names
+        )
+
+
+def _iter_file_chunks(path, chunksize, columns=None):
+    if os.path.splitext(path)[1].lower() == '.csv':
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunksize)
+    else:
+        # Excel can't be read incrementally
+        df = read_dataset_file(path, usecols=columns)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import uuid
+
+import joblib
+from django.core.cache import cache
+
+
+def content_key(*parts):
+    """SHA-256 of the canonical JSON form of ``parts`` (dict key order doesn't matter)."""
+    payload = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class DiskCache:
+    """
+    Content-addressed joblib store shared by every process on the host.
+
+    Entries live at ``<root>/<key[:2]>/<key>.joblib``. Reads refresh the
+    file's mtime, and writes evict the least recently used entries once the
+    directory grows past ``max_bytes``. Hit/miss counters are kept in the
+    Django cache so they cover all web and worker processes.
+    """
+
+    def __init__(self, name, root, max_bytes):
+        self.name = name
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], f'{key}.joblib')
+
+    def _count(self, counter):
+        counter_key = f'disk_cache_{self.name}_{counter}'
+        cache.add(counter_key, 0, timeout=None)
+        try:
+            cache.incr(counter_key)
+        except ValueError:
+            # Counter expired between add() and incr()
+            cache.set(counter_key, 1, timeout=None)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            value = joblib.load(path)
+            os.utime(path)
+        except (OSError, EOFError, ValueError):
+            self._count('misses')
+            return None
+        self._count('hits')
+        return value
+
+    def set(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{uuid.uuid4().hex[:8]}.tmp'
+        joblib.dump(value, tmp_path)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _entries(self):
+        entries = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if not filename.endswith('.joblib'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def evict(self):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def stats(self):
+        entries = self._entries()
+        hits = cache.get(f'disk_cache_{self.name}_hits', 0)
+        misses = cache.get(f'disk_cache_{self.name}_misses', 0)
+        lookups = hits + misses
+        return {
+            'name': self.name,
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+        }
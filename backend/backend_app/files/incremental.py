@@ -0,0 +1,315 @@
+"""
+Out-of-core training for estimators with ``partial_fit``.
+
+The dataset is only ever read a chunk at a time, so memory stays flat
+whatever its size. Rows are assigned to the hold-out set per chunk with a
+seeded draw, the same rows on every pass. The passes are:
+
+1. statistics of the training rows: fill values, outlier bounds, column
+   types and the categories the encoders need
+2. ``partial_fit`` of the scaler on the filled, encoded training rows
+3. ``partial_fit`` of the model, once per epoch
+4. metrics accumulated over the hold-out rows
+"""
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn import base, preprocessing
+
+from backend_app.files.streaming_stats import DatasetStats
+from backend_app.files.utils import CategoryEncoder, evaluate_model, feature_importance, infer_feature_types, is_text_dtype, model_map, report_progress, training_columns, TrainedPipeline
+
+
+logger = logging.getLogger(__name__)
+
+
+def supports_partial_fit(model_type):
+    return hasattr(model_map.get(model_type), 'partial_fit')
+
+
+def holdout_mask(chunk_index, rows, test_size, random_state):
+    """The hold-out rows of a chunk: about ``test_size`` of them, the same on every pass."""
+    rng = np.random.default_rng([abs(random_state), chunk_index])
+    return rng.random(rows) < test_size
+
+
+def _mode(counts):
+    # Like Series.mode(): the smallest of the most frequent values
+    top = counts[counts == counts.max()]
+    try:
+        return top.sort_index().index[0]
+    except TypeError:
+        return top.index[0]
+
+
+class StreamingPreprocessor:
+    """
+    The preprocessing ``prepare_split`` fits on a whole frame (mean/mode
+    fill, outlier bounds, feature encoder, scaler, target encoder), fitted
+    from chunked passes over the training rows instead.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.features = config['features']
+        self.target = config['target']
+        self.classification = config.get('problem_type') == 'classification'
+
+    def fit_statistics(self, chunks):
+        """First pass: ``chunks`` yields ``(chunk, test_mask)`` pairs."""
+        columns = training_columns(self.config)
+        numeric_stats = None
+        text_counts = {}
+        target_counts = pd.Series(dtype=np.float64)
+
+        for chunk, test in chunks:
+            if numeric_stats is None:
+                self.text_columns = [col for col in columns if is_text_dtype(chunk[col].dtype)]
+                self.numeric_columns = [col for col in columns if col not in self.text_columns]
+                numeric_stats = DatasetStats.for_frame(chunk[self.numeric_columns])
+                text_counts = {col: pd.Series(dtype=np.float64) for col in self.text_columns}
+
+            train = chunk[~test]
+            numeric_stats.update(train[self.numeric_columns])
+            for col in self.text_columns:
+                text_counts[col] = text_counts[col].add(train[col].value_counts(), fill_value=0)
+            if self.classification:
+                # Every class, including ones only seen in hold-out rows, as LabelEncoder on the full target would
+                target_counts = target_counts.add(chunk[self.target].value_counts(), fill_value=0)
+
+        if numeric_stats is None or numeric_stats.rows == 0:
+            raise ValueError("No training rows; the dataset is empty or test_size is too large")
+        self.train_rows = numeric_stats.rows
+        text_counts = {col: counts[counts > 0] for col, counts in text_counts.items()}
+
+        # Fill values: mean of numeric columns, mode of text columns
+        means = numeric_stats.moments.means()
+        self.fill_values = {col: means[i] for i, col in enumerate(numeric_stats.numeric_columns)}
+        for col, counts in text_counts.items():
+            if len(counts):
+                self.fill_values[col] = _mode(counts)
+
+        self._fit_outlier_bounds(numeric_stats)
+
+        # Column types from the same rules as the in-memory path
+        column_profile = {
+            'cardinality': {**numeric_stats.cardinality(), **{col: len(counts) for col, counts in text_counts.items()}},
+            'dtypes': {**numeric_stats.dtypes, **{col: 'object' for col in text_counts}},
+            'distinct_values': {**numeric_stats.distinct_values(), **{col: list(counts.index) for col, counts in text_counts.items()}}
+        }
+        self.feature_types, self.categorical_values = infer_feature_types(None, self.features, column_profile)
+
+        self._build_encoders(text_counts)
+        self._build_target_encoder(target_counts[target_counts > 0])
+        return self
+
+    def _fit_outlier_bounds(self, numeric_stats):
+        method = self.config.get('outlier_method', 'iqr')
+        self.outlier_columns = [col for col in self.numeric_columns if col != self.target and col in numeric_stats.numeric_columns]
+        self.lower_bound = self.upper_bound = None
+        if method == 'none' or not self.outlier_columns:
+            return
+
+        index = [numeric_stats.numeric_columns.index(col) for col in self.outlier_columns]
+        if method == 'iqr':
+            quartiles = np.array([numeric_stats.sketches[col].quantiles([0.25, 0.75]) for col in self.outlier_columns])
+            q1, q3 = quartiles[:, 0], quartiles[:, 1]
+            self.lower_bound = q1 - 1.5 * (q3 - q1)
+            self.upper_bound = q3 + 1.5 * (q3 - q1)
+        else:
+            n = numeric_stats.moments.counts()[index]
+            mean = numeric_stats.moments.means()[index]
+            # Population std, as safe_remove_outliers uses; constant columns never produce outliers
+            std = np.sqrt(np.diag(numeric_stats.moments.m2)[index] / np.maximum(n, 1))
+            std[std == 0] = np.inf
+            self.lower_bound = mean - 3.0 * std
+            self.upper_bound = mean + 3.0 * std
+
+    def _build_encoders(self, text_counts):
+        self.categorical_features = [col for col in self.features if col in text_counts]
+        categories = {col: np.unique(np.asarray(text_counts[col].index)) for col in self.categorical_features}
+
+        self.feature_encoder = None
+        if self.config['encoder'] == 'LabelEncoder':
+            self.feature_encoder = {col: CategoryEncoder(classes=categories[col]) for col in self.categorical_features}
+        elif self.config['encoder'] == 'OneHotEncoder' and self.categorical_features:
+            self.feature_encoder = preprocessing.OneHotEncoder(
+                categories=[categories[col] for col in self.categorical_features],
+                handle_unknown='ignore', sparse_output=False
+            )
+            # The categories are given; fitting only records the column names
+            self.feature_encoder.fit(pd.DataFrame({col: categories[col][:1] for col in self.categorical_features}))
+
+        self.scaler = None
+        if self.config['scaler'] == 'StandardScaler':
+            self.scaler = preprocessing.StandardScaler()
+        elif self.config['scaler'] == 'MinMaxScaler':
+            self.scaler = preprocessing.MinMaxScaler()
+        self.scaler_fitted = False
+
+    def _build_target_encoder(self, target_counts):
+        self.target_encoder = None
+        self.classes = None
+        if not self.classification:
+            return
+        if len(target_counts) < 2:
+            raise ValueError("Target column must contain at least two unique classes for classification.")
+        if self.target in self.text_columns:
+            self.target_encoder = preprocessing.LabelEncoder()
+            self.target_encoder.classes_ = np.unique(np.asarray(target_counts.index))
+            self.classes = np.arange(len(self.target_encoder.classes_))
+        else:
+            self.classes = np.unique(np.asarray(target_counts.index))
+
+    def transform(self, rows, drop_outliers=False):
+        """Filled, encoded and (once fitted) scaled features of ``rows``, with the encoded target."""
+        rows = rows.fillna(self.fill_values)
+        if drop_outliers and self.lower_bound is not None:
+            values = rows[self.outlier_columns].to_numpy(dtype=np.float64)
+            rows = rows[((values >= self.lower_bound) & (values <= self.upper_bound)).all(axis=1)]
+
+        X = rows.loc[:, self.features]
+        if isinstance(self.feature_encoder, dict):
+            for col, encoder in self.feature_encoder.items():
+                X[col] = encoder.transform(X[col])
+        elif self.feature_encoder is not None:
+            num_cols = [col for col in self.features if col not in self.categorical_features]
+            X = np.hstack([X[num_cols].values, self.feature_encoder.transform(X[self.categorical_features])])
+
+        if self.scaler is not None and self.scaler_fitted:
+            X = self.scaler.transform(X)
+
+        y = rows[self.target].to_numpy()
+        if self.target_encoder is not None:
+            y = self.target_encoder.transform(y)
+        return X, y
+
+
+class StreamingMetrics:
+    """Hold-out metrics accumulated chunk by chunk, in the format of ``evaluate_model``."""
+
+    def __init__(self, problem_type):
+        self.problem_type = problem_type
+        self.pairs = None
+        self.n = 0
+        self.squared_error = 0.0
+        self.absolute_error = 0.0
+        self.y_mean = 0.0
+        self.y_m2 = 0.0
+
+    def update(self, y_true, y_pred):
+        if not len(y_true):
+            return
+        if self.problem_type == 'classification':
+            counts = pd.Series(1.0, index=pd.MultiIndex.from_arrays([y_true, y_pred])).groupby(level=[0, 1]).sum()
+            self.pairs = counts if self.pairs is None else self.pairs.add(counts, fill_value=0)
+            return
+
+        y_true = np.asarray(y_true, dtype=np.float64)
+        error = y_true - np.asarray(y_pred, dtype=np.float64)
+        self.squared_error += float(np.dot(error, error))
+        self.absolute_error += float(np.abs(error).sum())
+        # Chan's merge of the target's mean and sum of squared deviations, for r2
+        n_b = len(y_true)
+        mean_b = y_true.mean()
+        delta = mean_b - self.y_mean
+        total = self.n + n_b
+        self.y_m2 += ((y_true - mean_b) ** 2).sum() + delta ** 2 * self.n * n_b / total
+        self.y_mean += delta * n_b / total
+        self.n = total
+
+    def result(self, features, model):
+        if self.problem_type == 'classification':
+            if self.pairs is None:
+                raise ValueError("No hold-out rows to evaluate; increase test_size")
+            y_true = self.pairs.index.get_level_values(0).to_numpy()
+            y_pred = self.pairs.index.get_level_values(1).to_numpy()
+            return evaluate_model(y_true, y_pred, 'classification', features, model, sample_weight=self.pairs.to_numpy())
+
+        if not self.n:
+            raise ValueError("No hold-out rows to evaluate; increase test_size")
+        mse = self.squared_error / self.n
+        if self.y_m2 > 0:
+            r2 = 1 - self.squared_error / self.y_m2
+        else:
+            # sklearn's r2_score for a constant target
+            r2 = 1.0 if self.squared_error == 0 else 0.0
+        return {
+            'r2_score': r2,
+            'mean_squared_error': mse,
+            'mean_absolute_error': self.absolute_error / self.n,
+            'root_mean_squared_error': np.sqrt(mse),
+            'feature_importance': feature_importance(model, features)
+        }
+
+
+def train_incremental(chunks, config, progress=None):
+    """
+    Train ``config['model_type']`` out of core. ``chunks`` is a callable
+    returning a fresh iterator of DataFrame chunks holding
+    ``training_columns(config)``; it is called once per pass.
+
+    Returns the same tuple as ``preprocess_and_train``. ``config['epochs']``
+    sets the number of passes of ``partial_fit`` over the training rows.
+    """
+    start_time = time.time()
+    model_class = model_map[config['model_type']]
+    if not hasattr(model_class, 'partial_fit'):
+        raise ValueError(f"{config['model_type']} can't be trained incrementally")
+
+    def split_chunks():
+        for i, chunk in enumerate(chunks()):
+            yield chunk, holdout_mask(i, len(chunk), config['test_size'], config['random_state'])
+
+    report_progress(progress, 'Profiling training rows', 15)
+    preprocessor = StreamingPreprocessor(config).fit_statistics(split_chunks())
+
+    if preprocessor.scaler is not None:
+        report_progress(progress, 'Fitting scaler', 30)
+        for chunk, test in split_chunks():
+            X, _ = preprocessor.transform(chunk[~test], drop_outliers=True)
+            if len(X):
+                preprocessor.scaler.partial_fit(X)
+        preprocessor.scaler_fitted = True
+
+    model = model_class(**config.get('parameters', {}))
+    is_classifier = base.is_classifier(model)
+    epochs = config.get('epochs', 1)
+    rng = np.random.default_rng(abs(config['random_state']))
+    fitted = False
+    for epoch in range(epochs):
+        report_progress(progress, f'Training epoch {epoch + 1}/{epochs}', 40 + int(45 * epoch / epochs))
+        for chunk, test in split_chunks():
+            X, y = preprocessor.transform(chunk[~test], drop_outliers=True)
+            if not len(y):
+                continue
+            # partial_fit sees rows in file order otherwise, which can bias SGD
+            order = rng.permutation(len(y))
+            X = X.iloc[order] if isinstance(X, pd.DataFrame) else X[order]
+            if is_classifier:
+                model.partial_fit(X, y[order], classes=preprocessor.classes)
+            else:
+                model.partial_fit(X, y[order])
+            fitted = True
+    if not fitted:
+        raise ValueError("Every training row was removed as an outlier")
+
+    report_progress(progress, 'Evaluating model', 90)
+    streaming_metrics = StreamingMetrics(config['problem_type'])
+    for chunk, test in split_chunks():
+        X, y = preprocessor.transform(chunk[test])
+        if len(y):
+            streaming_metrics.update(y, model.predict(X))
+    accuracy = streaming_metrics.result(config['features'], model)
+
+    training_time = round(time.time() - start_time, 2)
+    logger.info("Incremental training of %s took %.2fs", config['model_type'], training_time)
+
+    pipeline = TrainedPipeline(
+        config['features'], model,
+        encoder=preprocessor.feature_encoder, scaler=preprocessor.scaler, target_encoder=preprocessor.target_encoder,
+        fill_values={col: value for col, value in preprocessor.fill_values.items() if col in config['features']}
+    )
+    return preprocessor.feature_types, preprocessor.categorical_values, training_time, pipeline, accuracy
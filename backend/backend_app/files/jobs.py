@@ -0,0 +1,575 @@
+import json
+import math
+import multiprocessing
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils import timezone
+from joblib import Parallel, delayed
+from rest_framework.utils.encoders import JSONEncoder
+from sklearn import model_selection
+
+from backend_app.models import TrainingJob, UploadedDataset
+from backend_app.files.utils import preprocess_and_train, prepare_split, preprocessing_config, training_columns, clean_parameters, fit_candidate, build_leaderboard, cross_validation_folds, evaluate_fold, summarize_folds, score_candidate, search_candidates, uses_native_preprocessing, TrainedPipeline, LEADERBOARD_METRICS
+from backend_app.files.dataset_cache import load_dataset, iter_dataset_chunks
+from backend_app.files.incremental import train_incremental
+from backend_app.files.profiling import build_dataset_profile, read_profile
+from backend_app.files.disk_cache import DiskCache, content_key
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Jobs this web process queued that haven't finished; kept alive by _heartbeat
+_pending_jobs = set()
+_pending_jobs_lock = threading.Lock()
+_heartbeat_thread = None
+
+# Smallest training sample the first successive-halving round fits on
+SEARCH_MIN_SAMPLES = 50
+
+# Bumped whenever the shape of a cached training result changes
+TRAINING_RESULT_VERSION = 2
+
+# Fitted results of previous runs, keyed by dataset hash + training config
+training_result_cache = DiskCache(
+    'training_results',
+    root=settings.TRAINING_RESULT_CACHE_ROOT,
+    max_bytes=settings.TRAINING_RESULT_CACHE_MAX_BYTES
+)
+
+# Preprocessed train/test splits, keyed by dataset hash + preprocessing settings only
+preprocessed_split_cache = DiskCache(
+    'preprocessed_splits',
+    root=settings.PREPROCESSED_SPLIT_CACHE_ROOT,
+    max_bytes=settings.PREPROCESSED_SPLIT_CACHE_MAX_BYTES
+)
+
+
+def get_executor():
+    """Return the process pool shared by all training jobs of this web process."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Spawned workers inherit DJANGO_SETTINGS_MODULE and configure Django on start-up
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.TRAINING_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=django.setup
+            )
+            _start_heartbeat()
+        return _executor
+
+
+def _start_heartbeat():
+    global _heartbeat_thread
+    if _heartbeat_thread is None:
+        _heartbeat_thread = threading.Thread(target=_heartbeat, name='training-job-heartbeat', daemon=True)
+        _heartbeat_thread.start()
+
+
+def _heartbeat():
+    """
+    Touch ``updated_at`` of the unfinished jobs this process queued, so a job
+    whose process went away (restart, crash) stops being touched and is
+    failed by ``expire_stale_job`` instead of staying queued forever.
+    """
+    while True:
+        time.sleep(settings.TRAINING_JOB_HEARTBEAT_SECONDS)
+        with _pending_jobs_lock:
+            job_ids = list(_pending_jobs)
+        if not job_ids:
+            continue
+        try:
+            TrainingJob.objects.filter(
+                pk__in=job_ids, status__in=[TrainingJob.STATUS_QUEUED, TrainingJob.STATUS_RUNNING]
+            ).update(updated_at=timezone.now())
+        except Exception:
+            traceback.print_exc()
+        finally:
+            close_old_connections()
+
+
+def expire_stale_job(job):
+    """
+    Mark an unfinished ``job`` failed when nothing has touched it for
+    ``TRAINING_JOB_STALE_SECONDS``: the process that queued it is gone and
+    the job will never run or finish. Returns the job as it is now.
+    """
+    if job.is_finished:
+        return job
+    cutoff = timezone.now() - timedelta(seconds=settings.TRAINING_JOB_STALE_SECONDS)
+    if job.updated_at >= cutoff:
+        return job
+    TrainingJob.objects.filter(pk=job.pk, status=job.status, updated_at__lt=cutoff).update(
+        status=TrainingJob.STATUS_FAILED,
+        error="The training worker stopped responding (the server may have restarted); please train again",
+        updated_at=timezone.now()
+    )
+    job.refresh_from_db()
+    return job
+
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=False)
+        _executor = None
+
+
+def submit_job(job, func):
+    """
+    Queue ``func(job_id)`` on the worker pool.
+
+    A pool whose worker died (e.g. OOM-killed during a fit) is unusable, so it
+    is replaced once before giving up.
+    """
+    with _pending_jobs_lock:
+        _pending_jobs.add(job.pk)
+    try:
+        future = submit_task(func, str(job.pk))
+    except Exception:
+        with _pending_jobs_lock:
+            _pending_jobs.discard(job.pk)
+        raise
+    future.add_done_callback(lambda f: _on_job_done(job.pk, f))
+    return future
+
+
+def submit_task(func, *args):
+    """Queue ``func(*args)`` on the worker pool, replacing the pool once if it is broken."""
+    try:
+        return get_executor().submit(func, *args)
+    except BrokenProcessPool:
+        _reset_executor()
+        return get_executor().submit(func, *args)
+
+
+def _on_job_done(job_id, future):
+    # Runs in the web process; only needed when the worker could not record the outcome itself
+    with _pending_jobs_lock:
+        _pending_jobs.discard(job_id)
+    exc = future.exception()
+    if exc is None:
+        return
+    close_old_connections()
+    TrainingJob.objects.filter(pk=job_id).exclude(
+        status__in=[TrainingJob.STATUS_SUCCEEDED, TrainingJob.STATUS_FAILED]
+    ).update(status=TrainingJob.STATUS_FAILED, error=f"Worker crashed: {str(exc)}", updated_at=timezone.now())
+    close_old_connections()
+
+
+def worker_parallel(n_jobs):
+    """
+    joblib ``Parallel`` for fanning out inside a training worker. Idle loky
+    processes exit quickly; with joblib's 300s default they would keep the
+    worker, and with it the web process, from shutting down.
+    """
+    return Parallel(n_jobs=n_jobs, return_as='generator', backend='loky', idle_worker_timeout=10)
+
+
+def profile_dataset_task(dataset_id):
+    """Worker entry point: build the columnar cache and profile of a new dataset."""
+    close_old_connections()
+    try:
+        build_dataset_profile(UploadedDataset.objects.get(pk=dataset_id))
+    except Exception:
+        # The preview computes the profile on demand when this failed
+        traceback.print_exc()
+    finally:
+        close_old_connections()
+
+
+def queue_dataset_profile(dataset):
+    submit_task(profile_dataset_task, dataset.pk)
+
+
+def update_job(job_id, **fields):
+    # QuerySet.update() skips auto_now, and updated_at is what expire_stale_job looks at
+    TrainingJob.objects.filter(pk=job_id).update(updated_at=timezone.now(), **fields)
+
+
+def to_json_safe(value):
+    """Convert numpy scalars/arrays inside training results into plain JSON types."""
+    return json.loads(json.dumps(value, cls=JSONEncoder))
+
+
+def build_training_config(config):
+    """Map the client config onto the keys ``preprocess_and_train`` expects."""
+    return {
+        'features': config['features'],
+        'target': config['target_column'],
+        'encoder': config['encoder'],
+        'scaler': config['scaler'],
+        'test_size': float(config['test_size']),
+        'random_state': int(config['random_state']),
+        'model_type': config['model_type'],
+        'stratify': config.get('stratify', False),
+        'outlier_method': config.get('outlier_method', 'iqr'),
+        'cv_folds': int(config.get('cv_folds') or 0),
+        'streaming': bool(config.get('streaming', False)),
+        'epochs': int(config.get('epochs') or 1),
+        'problem_type': config.get('problem_type'),
+        "parameters": clean_parameters(config.get("parameters", {}))
+    }
+
+
+def cache_trained_components(pipeline):
+    """Store the trained pipeline under the cache key ``SaveModelView`` expects."""
+    cache_keys = {'pipeline_cache_key': f'trained_pipeline_{uuid.uuid4()}'}
+    cache.set(cache_keys['pipeline_cache_key'], pipeline, timeout=3600)
+    return cache_keys
+
+
+def training_cache_key(dataset_hash, config):
+    """Content address of a training run: the dataset bytes plus the normalized config."""
+    return content_key(dataset_hash, {**build_training_config(config), 'result_version': TRAINING_RESULT_VERSION})
+
+
+def holdout_config(config):
+    """
+    ``config`` as the plain /train/ run whose result a comparison or search
+    fit stands in for: one batch fit, no cross-validation. Those jobs never
+    honour cv_folds, streaming or epochs, so their results must not be
+    cached under a key that claims they did.
+    """
+    return dict(config, cv_folds=0, streaming=False, epochs=1)
+
+
+def split_cache_key(dataset_hash, training_config):
+    """Content address of a preprocessed split; ignores model_type and parameters."""
+    return content_key(dataset_hash, preprocessing_config(training_config))
+
+
+def load_prepared_split(dataset, training_config, progress=None):
+    """
+    Return the ``PreparedSplit`` for ``dataset`` and ``training_config``,
+    reading and preprocessing the dataset only on a cache miss.
+    """
+    key = split_cache_key(dataset.dataset_hash, training_config) if dataset.dataset_hash else None
+    split = preprocessed_split_cache.get(key) if key else None
+    if split is not None:
+        # Nothing was preprocessed for this run
+        return split._replace(preprocessing_time=0)
+
+    # Only the selected features and the target are read from the columnar cache
+    df = load_dataset(dataset, columns=training_columns(training_config))
+    if df.empty:
+        raise ValueError("Uploaded file is empty")
+
+    # The profile queued at upload already knows each column's type, when it's ready
+    profile = read_profile(dataset.dataset_hash) if dataset.dataset_hash else None
+    split = prepare_split(df, training_config, progress=progress, profile=profile)
+    if key:
+        preprocessed_split_cache.set(key, split)
+    return split
+
+
+def cross_validate(dataset, training_config, n_jobs=None):
+    """
+    Score ``training_config`` with k-fold cross-validation, fitting the folds
+    in parallel. ``n_jobs`` is capped by ``settings.CV_MAX_JOBS``.
+    """
+    df = load_dataset(dataset, columns=training_columns(training_config))
+    X, y, folds = cross_validation_folds(df, training_config)
+
+    n_jobs = min(len(folds), settings.CV_MAX_JOBS, int(n_jobs or settings.CV_MAX_JOBS))
+    fold_metrics = list(worker_parallel(max(1, n_jobs))(
+        delayed(evaluate_fold)(X, y, train_idx, test_idx, training_config) for train_idx, test_idx in folds
+    ))
+    return summarize_folds(fold_metrics)
+
+
+def build_training_result(job, config, trained):
+    """
+    Turn ``preprocess_and_train`` output into the payload the Playground and
+    ``SaveModelView`` consume, caching the trained objects under fresh keys.
+    """
+    feature_types, categorical_values, training_time, pipeline, accuracy = trained
+    cache_keys = cache_trained_components(pipeline)
+
+    result = {
+        'name': job.name,
+        'dataset': job.dataset_id,
+        'config': {
+            'model_type': config['model_type'],
+            'features': config['features'],
+            'feature_types': feature_types,
+            'categorical_values': categorical_values,
+            'training_time': training_time,
+            'target_column': config['target_column'],
+            'encoder': config['encoder'],
+            'scaler': config['scaler'],
+            'test_size': config['test_size'],
+            'random_state': config['random_state'],
+            'stratify': config.get('stratify', False),
+            'outlier_method': config.get('outlier_method', 'iqr'),
+            'parameters': config.get('parameters', {}),
+            'problem_type': config.get('problem_type', ''),
+            'accuracy': accuracy
+        },
+        'accuracy': accuracy,
+        **cache_keys
+    }
+    return to_json_safe(result)
+
+
+def run_training_job(job_id):
+    """Worker entry point: train the model described by a queued ``TrainingJob``."""
+    close_old_connections()
+    try:
+        job = TrainingJob.objects.select_related('dataset').get(pk=job_id)
+        config = dict(job.config)
+        update_job(job_id, status=TrainingJob.STATUS_RUNNING, stage='Loading dataset', progress=5)
+
+        training_config = build_training_config(config)
+        progress = lambda stage, percent: update_job(job_id, stage=stage, progress=percent)
+
+        if training_config['streaming']:
+            # Out of core: the dataset is read a chunk at a time on every pass
+            chunks = lambda: iter_dataset_chunks(job.dataset, settings.STREAMING_CHUNK_ROWS, columns=training_columns(training_config))
+            trained = train_incremental(chunks, training_config, progress=progress)
+        else:
+            split = load_prepared_split(job.dataset, training_config, progress=progress)
+            trained = preprocess_and_train(None, config=training_config, progress=progress, split=split)
+
+        if training_config['cv_folds']:
+            update_job(job_id, stage=f"Cross-validating ({training_config['cv_folds']} folds)", progress=92)
+            # Reported alongside the hold-out metrics, so it is cached and saved with them
+            trained[-1]['cross_validation'] = cross_validate(job.dataset, training_config, n_jobs=config.get('n_jobs'))
+
+        update_job(job_id, stage='Caching trained model', progress=95)
+        training_result_cache.set(training_cache_key(job.dataset.dataset_hash, config), trained)
+        result = build_training_result(job, config, trained)
+        update_job(job_id, status=TrainingJob.STATUS_SUCCEEDED, stage='Done', progress=100, result=result)
+
+    except Exception as e:
+        traceback.print_exc()
+        update_job(job_id, status=TrainingJob.STATUS_FAILED, error=f"Model training failed: {str(e)}")
+    finally:
+        close_old_connections()
+
+
+def run_comparison_job(job_id):
+    """
+    Worker entry point for a model comparison: preprocess once, then fit every
+    requested model in parallel on the shared split and rank the results.
+    """
+    close_old_connections()
+    try:
+        job = TrainingJob.objects.select_related('dataset').get(pk=job_id)
+        config = dict(job.config)
+        update_job(job_id, status=TrainingJob.STATUS_RUNNING, stage='Loading dataset', progress=5)
+
+        # Per-model client configs; each one is what /train/ would receive for that model
+        model_configs = [
+            dict(config, model_type=entry['model_type'], parameters=entry.get('parameters', {}))
+            for entry in config['models']
+        ]
+        training_configs = [build_training_config(model_config) for model_config in model_configs]
+
+        # One split per preprocessing mode: histogram models train on raw values, the rest share the usual split
+        splits = {}
+        for training_config in training_configs:
+            native = uses_native_preprocessing(training_config['model_type'])
+            if native not in splits:
+                splits[native] = load_prepared_split(
+                    job.dataset, training_config,
+                    progress=lambda stage, percent: update_job(job_id, stage=stage, progress=min(percent, 60))
+                )
+        split_for = lambda training_config: splits[uses_native_preprocessing(training_config['model_type'])]
+
+        update_job(job_id, stage=f'Fitting {len(training_configs)} models', progress=60)
+        n_jobs = max(1, min(len(training_configs), settings.MODEL_COMPARISON_WORKERS))
+        fitted = worker_parallel(n_jobs)(
+            delayed(fit_candidate)(split_for(training_config), training_config) for training_config in training_configs
+        )
+
+        entries = []
+        for i, (model, training_time, accuracy, error) in enumerate(fitted):
+            model_config = model_configs[i]
+            split = split_for(training_configs[i])
+            if model is not None:
+                # Fitted models are cached so training the winner via /train/ is instant
+                trained = (
+                    split.feature_types, split.categorical_values, training_time,
+                    TrainedPipeline.from_split(split, model, training_configs[i]['features']), accuracy
+                )
+                training_result_cache.set(training_cache_key(job.dataset.dataset_hash, holdout_config(model_config)), trained)
+
+            entries.append({
+                'model_type': model_config['model_type'],
+                'parameters': model_config['parameters'],
+                'training_time': training_time,
+                'accuracy': accuracy,
+                'error': error
+            })
+            update_job(job_id, progress=60 + int(35 * (i + 1) / len(training_configs)))
+
+        metric, leaderboard = build_leaderboard(entries, config.get('problem_type'))
+        result = to_json_safe({
+            'name': job.name,
+            'dataset': job.dataset_id,
+            'problem_type': config.get('problem_type', ''),
+            'metric': metric,
+            'preprocessing_time': round(sum(split.preprocessing_time for split in splits.values()), 2),
+            'leaderboard': leaderboard
+        })
+        update_job(job_id, status=TrainingJob.STATUS_SUCCEEDED, stage='Done', progress=100, result=result)
+
+    except Exception as e:
+        traceback.print_exc()
+        update_job(job_id, status=TrainingJob.STATUS_FAILED, error=f"Model comparison failed: {str(e)}")
+    finally:
+        close_old_connections()
+
+
+def _take_rows(X, index):
+    return X.iloc[index] if hasattr(X, 'iloc') else X[index]
+
+
+def successive_halving(split, training_config, candidates, factor, deadline, n_jobs, progress=None):
+    """
+    Successive halving over ``candidates`` on the training part of ``split``.
+
+    Every round fits the surviving candidates in parallel on a larger sample
+    of the training rows (``factor`` times more each round), scores them on a
+    validation slice carved out of the training rows, and keeps the best
+    ``1 / factor``. Stops once one candidate is left, the sample covers all
+    rows, or ``deadline`` (a ``time.monotonic()`` value) passes. The deadline
+    is checked as each fit finishes; a fit already running is not interrupted.
+    """
+    y_train = np.asarray(split.y_train)
+    stratify = y_train if training_config['problem_type'] == 'classification' and training_config.get('stratify') else None
+    fit_index, val_index = model_selection.train_test_split(
+        np.arange(len(y_train)), test_size=0.2,
+        random_state=training_config['random_state'], stratify=stratify
+    )
+    # Nested samples: each round's rows are a prefix of one shuffled order
+    rng = np.random.default_rng(training_config['random_state'])
+    fit_index = rng.permutation(fit_index)
+    X_val, y_val = _take_rows(split.X_train, val_index), y_train[val_index]
+
+    n_rounds = 1 + math.ceil(math.log(len(candidates), factor)) if len(candidates) > 1 else 1
+    min_samples = min(len(fit_index), max(SEARCH_MIN_SAMPLES, len(fit_index) // factor ** (n_rounds - 1)))
+
+    survivors = [{'parameters': parameters} for parameters in candidates]
+    rounds = []
+    best = None
+    timed_out = False
+    for round_number in range(n_rounds):
+        if time.monotonic() >= deadline:
+            timed_out = True
+            break
+
+        n_samples = min(len(fit_index), min_samples * factor ** round_number)
+        sample = fit_index[:n_samples]
+        X_fit, y_fit = _take_rows(split.X_train, sample), y_train[sample]
+        if progress:
+            progress(f'Round {round_number + 1}/{n_rounds}: {len(survivors)} candidates on {n_samples} rows',
+                     10 + int(75 * round_number / n_rounds))
+
+        scored = []
+        results = worker_parallel(n_jobs)(
+            delayed(score_candidate)(X_fit, y_fit, X_val, y_val, training_config, candidate['parameters'], split.feature_encoder)
+            for candidate in survivors
+        )
+        for candidate, (score, error) in zip(survivors, results):
+            candidate.update(score=score, error=error, n_samples=n_samples)
+            if score is not None:
+                scored.append(candidate)
+            if time.monotonic() >= deadline:
+                timed_out = True
+                break
+        # Closing the generator cancels the fits that haven't started
+        results.close()
+
+        if not scored:
+            if best is not None:
+                break
+            errors = [candidate['error'] for candidate in survivors if candidate.get('error')]
+            raise ValueError(f"No candidate could be fitted: {errors[0] if errors else 'time budget exhausted'}")
+
+        scored.sort(key=lambda candidate: candidate['score'], reverse=True)
+        rounds.append({
+            'round': round_number + 1,
+            'n_candidates': len(survivors),
+            'n_samples': n_samples,
+            'best_score': scored[0]['score'],
+            'completed': not timed_out
+        })
+        # A partially evaluated round only wins if no earlier round completed
+        if not timed_out or best is None:
+            best = scored[0]
+        if timed_out or len(scored) == 1 or n_samples == len(fit_index):
+            break
+        survivors = [dict(candidate) for candidate in scored[:max(1, math.ceil(len(scored) / factor))]]
+
+    if best is None:
+        raise ValueError("The time budget ran out before any candidate was scored")
+    return best, rounds, timed_out
+
+
+def run_search_job(job_id):
+    """
+    Worker entry point for a hyperparameter search: successive halving on
+    the shared preprocessed split, then a full fit of the best candidate
+    whose result can be saved like any other training run.
+    """
+    close_old_connections()
+    try:
+        job = TrainingJob.objects.select_related('dataset').get(pk=job_id)
+        config = dict(job.config)
+        update_job(job_id, status=TrainingJob.STATUS_RUNNING, stage='Loading dataset', progress=5)
+        started = time.monotonic()
+        deadline = started + min(float(config.get('time_budget', settings.SEARCH_MAX_TIME_BUDGET)), settings.SEARCH_MAX_TIME_BUDGET)
+
+        training_config = build_training_config(dict(config, parameters={}))
+        candidates = search_candidates(config, settings.SEARCH_MAX_CANDIDATES, random_state=training_config['random_state'])
+        progress = lambda stage, percent: update_job(job_id, stage=stage, progress=percent)
+
+        split = load_prepared_split(job.dataset, training_config)
+        n_jobs = max(1, min(len(candidates), settings.SEARCH_MAX_JOBS, int(config.get('n_jobs', settings.SEARCH_MAX_JOBS))))
+        best, rounds, timed_out = successive_halving(
+            split, training_config, candidates,
+            factor=int(config.get('factor', 3)), deadline=deadline, n_jobs=n_jobs, progress=progress
+        )
+
+        # Refit the winner on the full training rows and evaluate it on the test rows like /train/ does.
+        # Without the refit there is no model to save, so it runs even once the budget is spent,
+        # and the result says so
+        refit_over_budget = time.monotonic() >= deadline
+        update_job(job_id, stage='Fitting best candidate (over time budget)' if refit_over_budget else 'Fitting best candidate', progress=90)
+        best_config = dict(config, parameters=best['parameters'])
+        trained = preprocess_and_train(None, config=build_training_config(best_config), split=split)
+        training_result_cache.set(training_cache_key(job.dataset.dataset_hash, holdout_config(best_config)), trained)
+
+        result = build_training_result(job, best_config, trained)
+        result['search'] = to_json_safe({
+            'best_parameters': best['parameters'],
+            'best_validation_score': best['score'],
+            'metric': LEADERBOARD_METRICS.get(training_config['problem_type'], 'r2_score'),
+            'candidates': len(candidates),
+            'rounds': rounds,
+            'timed_out': timed_out,
+            'refit_over_budget': refit_over_budget,
+            'search_time': round(time.monotonic() - started, 2)
+        })
+        update_job(job_id, status=TrainingJob.STATUS_SUCCEEDED, stage='Done', progress=100, result=result)
+
+    except Exception as e:
+        traceback.print_exc()
+        update_job(job_id, status=TrainingJob.STATUS_FAILED, error=f"Hyperparameter search failed: {str(e)}")
+    finally:
+        close_old_connections()
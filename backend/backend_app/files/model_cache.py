@@ -0,0 +1,277 @@
+import io
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict, namedtuple
+
+import joblib
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+from sklearn import preprocessing
+
+from backend_app.models import SavedModel
+
+from backend_app.files.dataset_cache import load_dataset
+from backend_app.files.utils import CategoryEncoder, InferencePlan, TrainedPipeline, is_text_dtype, uses_native_preprocessing
+
+
+logger = logging.getLogger(__name__)
+
+ModelBundle = namedtuple('ModelBundle', ['pipeline', 'plan', 'size'])
+
+
+def _file_size(field):
+    try:
+        return os.path.getsize(field.path) if field else 0
+    except OSError:
+        return 0
+
+
+def training_fill_values(saved_model):
+    """
+    Recompute the fill values ``prepare_split`` applied when ``saved_model``
+    was trained: the mean of every numeric feature and the mode of every
+    text feature over the whole training dataset.
+    """
+    config = saved_model.config
+    if uses_native_preprocessing(config.model_type):
+        return {}
+
+    df = load_dataset(saved_model.dataset, columns=config.features)
+    fill_values = {}
+    for col in df.columns:
+        if is_text_dtype(df[col].dtype):
+            modes = df[col].mode()
+            if len(modes):
+                fill_values[col] = modes.iloc[0]
+        elif df[col].notna().any():
+            fill_values[col] = df[col].mean()
+    return fill_values
+
+
+def upgrade_legacy_model(saved_model, pipeline):
+    """
+    Store a backfilled pipeline as the model's only artifact, then remove the
+    old model file and the separate encoder/scaler files. The old files are
+    only deleted once the row points at the new artifact. Returns False, and
+    changes nothing, if another process already upgraded the model.
+    """
+    legacy_names = [
+        field.name for field in (saved_model.encoder_file, saved_model.scaler_file, saved_model.target_encoder) if field
+    ]
+    old_name = saved_model.model_file.name
+
+    buffer = io.BytesIO()
+    joblib.dump(pipeline, buffer)
+    new_name = default_storage.save(
+        f'saved_models/{saved_model.name}_{uuid.uuid4().hex[:8]}.joblib', ContentFile(buffer.getvalue())
+    )
+    try:
+        upgraded = SavedModel.objects.filter(pk=saved_model.pk, model_file=old_name).update(
+            model_file=new_name, encoder_file='', scaler_file='', target_encoder='', updated_at=timezone.now()
+        )
+    except Exception:
+        default_storage.delete(new_name)
+        raise
+    if not upgraded:
+        default_storage.delete(new_name)
+        return False
+    for name in [old_name] + legacy_names:
+        default_storage.delete(name)
+    return True
+
+
+def load_pipeline(saved_model):
+    """
+    Unpickle a saved model's ``TrainedPipeline``. Models saved as four
+    separate files (estimator, feature encoder, scaler, target encoder) are
+    assembled into one, without fill values.
+    """
+    pipeline = joblib.load(saved_model.model_file.path)
+    if not isinstance(pipeline, TrainedPipeline):
+        pipeline = TrainedPipeline(
+            saved_model.config.features, pipeline,
+            encoder=joblib.load(saved_model.encoder_file.path) if saved_model.encoder_file else None,
+            scaler=joblib.load(saved_model.scaler_file.path) if saved_model.scaler_file else None,
+            target_encoder=joblib.load(saved_model.target_encoder.path) if saved_model.target_encoder else None
+        )
+    return pipeline
+
+
+def _sklearn_label_encoder(encoder):
+    if not isinstance(encoder, CategoryEncoder):
+        return encoder
+    le = preprocessing.LabelEncoder()
+    le.classes_ = encoder.classes_
+    return le
+
+
+def export_pipeline_files(pipeline):
+    """
+    The parts of a ``TrainedPipeline`` as files that load with nothing but
+    scikit-learn and joblib, for ``ModelDownloadView``: the estimator, the
+    feature encoder (a dict of ``LabelEncoder`` or a ``OneHotEncoder``), the
+    scaler and the target encoder, plus ``preprocessing.json`` with the
+    feature order, fill values and the order to apply them in. The pickled
+    ``TrainedPipeline`` itself is included as ``pipeline.joblib`` for loading
+    back into this app.
+
+    Returns ``{filename: bytes}``.
+    """
+    def dump(obj):
+        buffer = io.BytesIO()
+        joblib.dump(obj, buffer)
+        return buffer.getvalue()
+
+    encoder = pipeline.encoder
+    categorical = [col for col in pipeline.columns if col in pipeline.categorical_columns()]
+    files = {'model.joblib': dump(pipeline.model), 'pipeline.joblib': dump(pipeline)}
+    if isinstance(encoder, dict):
+        files['encoder.joblib'] = dump({col: _sklearn_label_encoder(le) for col, le in encoder.items()})
+    elif encoder is not None:
+        files['encoder.joblib'] = dump(encoder)
+    if pipeline.scaler is not None:
+        files['scaler.joblib'] = dump(pipeline.scaler)
+    if pipeline.target_encoder is not None:
+        files['target_encoder.joblib'] = dump(_sklearn_label_encoder(pipeline.target_encoder))
+
+    if isinstance(encoder, dict):
+        encoding = (
+            "Replace each column in encoder.joblib with its code, encoder[column].transform(values), in place; "
+            "values not in encoder[column].classes_ get the code len(classes_)"
+        )
+        if uses_native_preprocessing(type(pipeline.model).__name__):
+            encoding += " and missing values stay NaN"
+    elif encoder is not None:
+        encoding = "Numeric features in 'features' order, followed by encoder.transform(categorical_features)"
+    else:
+        encoding = None
+    if pipeline.scaler is None:
+        scaling = None
+    elif isinstance(encoder, dict) or encoder is None:
+        scaling = "scaler.transform on the columns in scaler.feature_names_in_ (all columns if it has none)"
+    else:
+        scaling = "scaler.transform on the whole encoded matrix"
+
+    manifest = {
+        'features': pipeline.columns,
+        'categorical_features': categorical,
+        'fill_values': pipeline.fill_values,
+        'steps': [step for step in [
+            "Select the columns in 'features' order; blank categorical values count as missing",
+            "Fill missing values with 'fill_values'" if pipeline.fill_values else None,
+            encoding,
+            scaling,
+            "model.predict on the resulting float matrix",
+            "target_encoder.inverse_transform on the predictions" if pipeline.target_encoder is not None else None,
+        ] if step],
+    }
+    files['preprocessing.json'] = json.dumps(manifest, cls=JSONEncoder, indent=2).encode()
+    return files
+
+
+def load_model_bundle(saved_model):
+    """
+    Load a saved model's ``TrainedPipeline`` and compile its ``InferencePlan``.
+
+    Models saved before fill values were kept impute missing inputs from the
+    rows being predicted until ``manage.py backfill_fill_values`` upgrades
+    them; nothing is written here.
+    """
+    pipeline = load_pipeline(saved_model)
+    if pipeline.fill_values is None:
+        logger.warning(
+            "Saved model %s has no training fill values; run 'manage.py backfill_fill_values' to add them",
+            saved_model.pk
+        )
+
+    size = sum(_file_size(f) for f in (
+        saved_model.model_file, saved_model.encoder_file, saved_model.scaler_file, saved_model.target_encoder
+    ))
+    return ModelBundle(pipeline=pipeline, plan=InferencePlan(pipeline), size=size)
+
+
+class ModelBundleCache:
+    """
+    Per-process LRU cache of loaded model bundles.
+
+    Entries are keyed by ``(SavedModel.pk, SavedModel.updated_at)`` so a model
+    that is saved again is reloaded. The cache is bounded both by entry count
+    and by the on-disk size of the cached artifacts, which is a cheap proxy for
+    their memory footprint.
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, saved_model):
+        key = (saved_model.pk, saved_model.updated_at)
+        with self._lock:
+            bundle = self._entries.get(key)
+            if bundle is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return bundle
+            self.misses += 1
+
+        # Load outside the lock so a slow unpickle doesn't block other models
+        bundle = load_model_bundle(saved_model)
+        self._put(key, bundle)
+        return bundle
+
+    def _put(self, key, bundle):
+        with self._lock:
+            # Drop stale versions of the same model before inserting
+            for stale in [k for k in self._entries if k[0] == key[0]]:
+                self._bytes -= self._entries.pop(stale).size
+            self._entries[key] = bundle
+            self._bytes += bundle.size
+            while len(self._entries) > 1 and (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self.evictions += 1
+
+    def invalidate(self, pk):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == pk]:
+                self._bytes -= self._entries.pop(key).size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'pid': os.getpid(),
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+model_bundle_cache = ModelBundleCache(
+    max_entries=settings.MODEL_BUNDLE_CACHE_SIZE,
+    max_bytes=settings.MODEL_BUNDLE_CACHE_MAX_BYTES
+)
@@ -0,0 +1,174 @@
+import json
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from backend_app.files.dataset_cache import dataset_cache_dir, ensure_dataset_cache, iter_dataset_chunks, dataset_columns
+from backend_app.files.streaming_stats import DatasetStats
+
+
+PROFILE_FILE = 'profile.json'
+PROFILE_VERSION = 2
+
+def profile_path(dataset_hash):
+    return os.path.join(dataset_cache_dir(dataset_hash), PROFILE_FILE)
+
+
+def read_profile(dataset_hash):
+    try:
+        with open(profile_path(dataset_hash)) as f:
+            profile = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return profile if profile.get('version') == PROFILE_VERSION else None
+
+
+def _json_value(value):
+    # NaN/inf aren't valid JSON; the preview shows them as blanks like fillna('')
+    if value is None:
+        return None
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+def column_type(series_dtype, unique_values):
+    """The preview's column type: numeric, or categorical for text and 0/1 flags."""
+    if pd.api.types.is_numeric_dtype(series_dtype):
+        # Treat binary numeric columns (like 0 and 1) as categorical
+        if len(unique_values) == 2 and set(unique_values).issubset({0, 1}):
+            return 'categorical'
+        return 'numeric'
+    return 'categorical'
+
+
+def profile_from_stats(dataset_stats):
+    """The stored/previewed profile fields of a ``DatasetStats``."""
+    distinct_values = dataset_stats.distinct_values()
+    cardinality = dataset_stats.cardinality()
+    column_types = {
+        # Past the exact limit a column has far more than the two values of a 0/1 flag
+        col: column_type(dataset_stats.dtypes[col], distinct_values.get(col, ()))
+        for col in dataset_stats.columns
+    }
+
+    # Same layout the preview got from DataFrame.describe(): count, mean, std, min, 25%, 50%, 75%, max
+    stats = {
+        col: [_json_value(v) for v in row]
+        for col, row in dataset_stats.describe().items()
+    }
+
+    numeric_columns = dataset_stats.numeric_columns
+    corr = dataset_stats.correlation()
+    correlation = {
+        col_j: {col_i: ('' if np.isnan(corr[i, j]) else float(corr[i, j])) for i, col_i in enumerate(numeric_columns)}
+        for j, col_j in enumerate(numeric_columns)
+    }
+
+    return {
+        'rows': dataset_stats.rows,
+        'columns': dataset_stats.columns,
+        'dtypes': dataset_stats.dtypes,
+        'column_types': column_types,
+        'null_counts': dataset_stats.nulls,
+        'cardinality': cardinality,
+        'distinct_values': {
+            col: [v.item() if isinstance(v, np.generic) else v for v in values]
+            for col, values in distinct_values.items()
+        },
+        'stats': stats,
+        'correlation': correlation
+    }
+
+
+def compute_profile(dataset, chunksize=None):
+    """Profile an ``UploadedDataset`` in a single pass over row chunks."""
+    chunksize = chunksize or settings.PROFILE_CHUNK_ROWS
+    chunks = iter_dataset_chunks(dataset, chunksize)
+    first = next(chunks, None)
+    if first is None:
+        first = pd.DataFrame(columns=dataset_columns(dataset))
+
+    dataset_stats = DatasetStats.for_frame(first).update(first)
+    for chunk in chunks:
+        dataset_stats.update(chunk)
+
+    return {'version': PROFILE_VERSION, **profile_from_stats(dataset_stats)}
+
+
+def build_dataset_profile(dataset):
+    """Compute and store the profile of a dataset (once per ``dataset_hash``)."""
+    profile = read_profile(dataset.dataset_hash)
+    if profile is not None:
+        return profile
+    if ensure_dataset_cache(dataset) is None:
+        return None
+
+    profile = compute_profile(dataset)
+    path = profile_path(dataset.dataset_hash)
+    tmp_path = f'{path}.{uuid.uuid4().hex[:8]}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(profile, f)
+    os.replace(tmp_path, path)
+    return profile
+
+
+def reservoir_sample(chunks, size, seed=0):
+    """
+    Uniform random sample of at most ``size`` rows from an iterable of
+    DataFrame chunks, in one pass and bounded memory (Algorithm R, applied a
+    chunk at a time). Returns ``(sample, rows_seen)``.
+    """
+    rng = np.random.default_rng(seed)
+    reservoir = None
+    seen = 0
+    for chunk in chunks:
+        chunk = chunk.reset_index(drop=True)
+        if reservoir is None:
+            reservoir = chunk.iloc[:0]
+        fill = min(size - len(reservoir), len(chunk))
+        if fill > 0:
+            head = chunk.iloc[:fill]
+            reservoir = pd.concat([reservoir, head.set_axis(range(len(reservoir), len(reservoir) + fill))])
+            chunk = chunk.iloc[fill:]
+            seen += fill
+        if chunk.empty:
+            continue
+
+        # Row i (0-based, over the whole stream) replaces slot j ~ U[0, i] when j < size
+        slots = rng.integers(0, np.arange(seen, seen + len(chunk)) + 1)
+        keep = slots < size
+        seen += len(chunk)
+        if not keep.any():
+            continue
+        replacements = chunk[keep].set_axis(slots[keep])
+        # A slot hit twice in one chunk keeps the later row, as a row-by-row pass would
+        replacements = replacements[~replacements.index.duplicated(keep='last')]
+        reservoir = pd.concat([reservoir.drop(index=replacements.index), replacements])
+
+    if reservoir is None:
+        return pd.DataFrame(), 0
+    return reservoir.sort_index().reset_index(drop=True), seen
+
+
+def summarize_frame(df):
+    """Preview stats, correlation and column types of an in-memory frame (or sample)."""
+    try:
+        describe = df.describe()
+        stats = {col: [_json_value(v) for v in describe[col]] for col in describe.columns}
+    except Exception as e:
+        stats = {"error": f"Could not generate stats: {str(e)}"}
+
+    try:
+        correlation = df.corr(numeric_only=True).fillna('').to_dict()
+    except Exception as e:
+        correlation = {"error": f"Could not generate correlation: {str(e)}"}
+
+    column_types = {col: column_type(df[col].dtype, df[col].dropna().unique()) for col in df.columns}
+    return {
+        'column_types': column_types,
+        'stats': stats,
+        'correlation': correlation
+    }
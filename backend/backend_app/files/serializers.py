@@ -3,7 +3,7 @@ import os
 
 # from django.contrib.auth.models import User
 
-from backend_app.models import UploadedDataset, ModelConfig, SavedModel
+from backend_app.models import UploadedDataset, ModelConfig, SavedModel, TrainingJob, UploadSession
 
 class UploadFileSerializer(serializers.ModelSerializer):
 
@@ -44,9 +44,69 @@ class ModelConfigSerializer(serializers.ModelSerializer):
         }
         
 class DatasetPreviewSerializer(serializers.Serializer):
-    dataset = serializers.FileField()
+    dataset = serializers.FileField(required=False)
+    dataset_id = serializers.IntegerField(required=False)
     row_count = serializers.IntegerField()
 
+    def validate(self, data):
+        if 'dataset' not in data and 'dataset_id' not in data:
+            raise serializers.ValidationError("Provide either a dataset file or a dataset_id.")
+        return data
+
+class TrainingJobSerializer(serializers.ModelSerializer):
+    job_id = serializers.UUIDField(source='id', read_only=True)
+
+    class Meta:
+        model = TrainingJob
+        fields = [
+            'job_id',
+            'dataset',
+            'name',
+            'status',
+            'progress',
+            'stage',
+            'error',
+            'created_at',
+            'updated_at'
+        ]
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    upload_id = serializers.UUIDField(source='id', read_only=True)
+    offset = serializers.IntegerField(source='received', read_only=True)
+
+    class Meta:
+        model = UploadSession
+        fields = [
+            'upload_id',
+            'name',
+            'filename',
+            'size',
+            'sha256',
+            'offset',
+            'status',
+            'dataset',
+            'created_at',
+            'updated_at'
+        ]
+        read_only_fields = ['status', 'dataset']
+
+    def validate_filename(self, value):
+        extension = os.path.splitext(value)[1].lower()
+        if extension not in ('.csv', '.xls', '.xlsx'):
+            raise serializers.ValidationError("Only CSV, XLS, and XLSX files are allowed.")
+        return os.path.basename(value)
+
+    def validate_size(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Size must be a positive number of bytes.")
+        return value
+
+    def validate_sha256(self, value):
+        value = value.lower()
+        if value and (len(value) != 64 or any(c not in '0123456789abcdef' for c in value)):
+            raise serializers.ValidationError("sha256 must be a 64 character hex digest.")
+        return value
+
 class SaveModelSerializer(serializers.ModelSerializer):
     # dataset_name = serializers.CharField(source='dataset.name', read_only=True)
     features = serializers.JSONField(source='config.features', read_only=True)
@@ -0,0 +1,311 @@
+"""
+Single-pass, mergeable column statistics for datasets larger than memory.
+
+Every accumulator here takes data a chunk at a time through ``update`` and
+combines with another accumulator of the same kind through ``merge``, so
+chunks can be summarised independently (in other processes, say) and folded
+together afterwards. Memory depends on the number of columns and the sketch
+sizes, never on the number of rows.
+"""
+import numpy as np
+import pandas as pd
+
+
+class QuantileSketch:
+    """
+    KLL quantile sketch. Level ``h`` holds items that each stand for ``2**h``
+    values; a level that outgrows its capacity is sorted and every other item
+    (from a random offset) is promoted a level up. With ``k=200`` quantiles
+    are typically within 1% of their true rank. Until the first compaction the sketch holds every value
+    and quantiles are exact.
+    """
+
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # An odd item out stays behind so total weight is preserved exactly
+                leftover, items = items[len(items) - len(items) % 2:], items[:len(items) - len(items) % 2]
+                promoted = items[self._rng.integers(2)::2]
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+                self.levels[level] = leftover
+            level += 1
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other):
+        self.n += other.n
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self._compress()
+        return self
+
+    def quantiles(self, qs):
+        qs = np.asarray(qs, dtype=np.float64)
+        if self.n == 0:
+            return np.full(len(qs), np.nan)
+        if len(self.levels) == 1:
+            # Nothing was compacted: exact, with the same interpolation as pandas
+            return np.quantile(self.levels[0], qs)
+
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items_), 2 ** level) for level, items_ in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        items, weights = items[order], weights[order]
+        # Each item stands at the middle of the ranks it represents
+        midpoints = np.cumsum(weights) - weights / 2
+        ranks = np.searchsorted(midpoints, qs * self.n, side='left')
+        return items[np.minimum(ranks, len(items) - 1)]
+
+
+class DistinctCounter:
+    """
+    Distinct-value counter: exact (and able to list the values, in order of
+    appearance) up to ``exact_limit`` values, HyperLogLog with ``2**p``
+    registers beyond that (about 1.6% standard error for ``p=12``).
+    """
+
+    def __init__(self, p=12, exact_limit=1000):
+        self.p = p
+        self.exact_limit = exact_limit
+        self.registers = np.zeros(2 ** p, dtype=np.uint8)
+        self.exact = {}
+
+    @staticmethod
+    def _hash(values):
+        if values.dtype.kind in 'iufb':
+            # 1 and 1.0 must hash alike when chunks of one column parse with different dtypes
+            values = values.astype(np.float64)
+        return pd.util.hash_array(values)
+
+    def update(self, values):
+        values = np.asarray(values)
+        if not len(values):
+            return
+
+        hashes = self._hash(values)
+        suffix_bits = 64 - self.p
+        index = (hashes >> np.uint64(suffix_bits)).astype(np.intp)
+        suffix = (hashes & np.uint64((1 << suffix_bits) - 1)).astype(np.float64)
+        # Position of the leftmost 1-bit in the suffix; frexp's exponent is its bit length
+        rank = (suffix_bits - np.frexp(suffix)[1] + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+        if self.exact is not None:
+            uniques = pd.unique(values)
+            if len(self.exact) + len(uniques) > self.exact_limit:
+                uniques = [v for v in uniques if v not in self.exact]
+            self.exact.update(dict.fromkeys(uniques))
+            if len(self.exact) > self.exact_limit:
+                self.exact = None
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        if self.exact is not None and other.exact is not None:
+            self.exact.update(other.exact)
+            if len(self.exact) > self.exact_limit:
+                self.exact = None
+        else:
+            self.exact = None
+        return self
+
+    def values(self):
+        """The distinct values, or None once there were more than ``exact_limit``."""
+        return None if self.exact is None else list(self.exact)
+
+    def count(self):
+        if self.exact is not None:
+            return len(self.exact)
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * m and zeros:
+            # Small-range correction (linear counting)
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+
+class CoMoments:
+    """
+    Pairwise-complete count, mean, sum of squared deviations and co-moment
+    for every pair of numeric columns, merged with Chan et al.'s parallel
+    form of Welford's update. ``[i, j]`` entries describe column ``i`` over
+    the rows where both ``i`` and ``j`` are present, so the diagonal holds
+    the plain per-column statistics and the result matches
+    ``DataFrame.corr()``'s handling of missing values.
+    """
+
+    def __init__(self, k):
+        self.n = np.zeros((k, k))
+        self.mean = np.zeros((k, k))
+        self.m2 = np.zeros((k, k))
+        self.comoment = np.zeros((k, k))
+
+    @classmethod
+    def from_values(cls, values):
+        """Moments of one chunk, given as a 2-D float array with NaN for missing."""
+        moments = cls(values.shape[1])
+        present = ~np.isnan(values)
+        weights = present.astype(np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # Centre on the column means first so the sums below stay well conditioned
+            centre = np.nan_to_num(np.nanmean(values, axis=0)) if len(values) else np.zeros(values.shape[1])
+        centred = np.where(present, values - centre, 0.0)
+
+        n = weights.T @ weights
+        with np.errstate(invalid='ignore', divide='ignore'):
+            shift = np.where(n > 0, (centred.T @ weights) / n, 0.0)
+        moments.n = n
+        moments.mean = shift + centre[:, None]
+        moments.m2 = (centred ** 2).T @ weights - n * shift ** 2
+        moments.comoment = centred.T @ centred - n * shift * shift.T
+        return moments
+
+    def merge(self, other):
+        n = self.n + other.n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            share = np.where(n > 0, other.n / n, 0.0)
+            weight = np.where(n > 0, self.n * other.n / n, 0.0)
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * share
+        self.m2 = self.m2 + other.m2 + delta ** 2 * weight
+        self.comoment = self.comoment + other.comoment + delta * delta.T * weight
+        self.n = n
+        return self
+
+    def update(self, values):
+        return self.merge(CoMoments.from_values(values))
+
+    def counts(self):
+        return np.diag(self.n).copy()
+
+    def means(self):
+        return np.where(self.counts() > 0, np.diag(self.mean), np.nan)
+
+    def variances(self):
+        n = self.counts()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(n > 1, np.diag(self.m2) / (n - 1), np.nan)
+
+    def correlation(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr = self.comoment / np.sqrt(self.m2 * self.m2.T)
+        corr[self.n < 2] = np.nan
+        return np.clip(corr, -1, 1)
+
+
+class DatasetStats:
+    """
+    Every streaming statistic of a table: row and null counts, min/max,
+    moments and correlation of the numeric columns, a quantile sketch per
+    numeric column and a distinct counter per column.
+    """
+
+    def __init__(self, columns, numeric_columns, dtypes, sketch_k=200, exact_limit=1000):
+        self.columns = list(columns)
+        self.numeric_columns = list(numeric_columns)
+        self.dtypes = dict(dtypes)
+        self.rows = 0
+        self.nulls = dict.fromkeys(self.columns, 0)
+        self.minimum = np.full(len(self.numeric_columns), np.inf)
+        self.maximum = np.full(len(self.numeric_columns), -np.inf)
+        self.moments = CoMoments(len(self.numeric_columns))
+        self.sketches = {col: QuantileSketch(k=sketch_k) for col in self.numeric_columns}
+        self.distinct = {col: DistinctCounter(exact_limit=exact_limit) for col in self.columns}
+
+    @classmethod
+    def for_frame(cls, df, **kwargs):
+        """Empty stats with the columns and dtypes of ``df`` (bool columns are treated as categorical)."""
+        numeric_columns = [
+            col for col in df.columns
+            if pd.api.types.is_numeric_dtype(df[col].dtype) and not pd.api.types.is_bool_dtype(df[col].dtype)
+        ]
+        return cls(df.columns, numeric_columns, {col: str(df[col].dtype) for col in df.columns}, **kwargs)
+
+    def update(self, chunk):
+        self.rows += len(chunk)
+        for col, nulls in chunk.isna().sum().items():
+            self.nulls[col] += int(nulls)
+
+        if self.numeric_columns:
+            values = chunk[self.numeric_columns].to_numpy(dtype=np.float64)
+            present = ~np.isnan(values)
+            self.minimum = np.minimum(self.minimum, np.where(present, values, np.inf).min(axis=0, initial=np.inf))
+            self.maximum = np.maximum(self.maximum, np.where(present, values, -np.inf).max(axis=0, initial=-np.inf))
+            self.moments.update(values)
+            for i, col in enumerate(self.numeric_columns):
+                self.sketches[col].update(values[present[:, i], i])
+
+        for col in self.columns:
+            self.distinct[col].update(chunk[col].dropna().to_numpy())
+        return self
+
+    def merge(self, other):
+        if other.columns != self.columns:
+            raise ValueError("Can only merge statistics of the same columns")
+        self.rows += other.rows
+        for col, nulls in other.nulls.items():
+            self.nulls[col] += nulls
+        self.minimum = np.minimum(self.minimum, other.minimum)
+        self.maximum = np.maximum(self.maximum, other.maximum)
+        self.moments.merge(other.moments)
+        for col in self.numeric_columns:
+            self.sketches[col].merge(other.sketches[col])
+        for col in self.columns:
+            self.distinct[col].merge(other.distinct[col])
+        return self
+
+    def describe(self):
+        """``DataFrame.describe()`` rows per numeric column: count, mean, std, min, 25%, 50%, 75%, max."""
+        counts = self.moments.counts()
+        means = self.moments.means()
+        stds = np.sqrt(self.moments.variances())
+        summary = {}
+        for i, col in enumerate(self.numeric_columns):
+            q25, q50, q75 = self.sketches[col].quantiles([0.25, 0.5, 0.75])
+            has_values = counts[i] > 0
+            summary[col] = [
+                counts[i], means[i], stds[i],
+                self.minimum[i] if has_values else np.nan, q25, q50, q75,
+                self.maximum[i] if has_values else np.nan
+            ]
+        return summary
+
+    def correlation(self):
+        return self.moments.correlation()
+
+    def cardinality(self):
+        return {col: self.distinct[col].count() for col in self.columns}
+
+    def distinct_values(self):
+        """Distinct values of every column that has at most ``exact_limit`` of them."""
+        values = {}
+        for col in self.columns:
+            column_values = self.distinct[col].values()
+            if column_values is not None:
+                values[col] = column_values
+        return values
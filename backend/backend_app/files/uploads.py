@@ -0,0 +1,265 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.db import IntegrityError, transaction
+
+from backend_app.models import UploadedDataset
+
+
+DATASET_EXTENSIONS = ('.csv', '.xls', '.xlsx')
+DATASET_UPLOAD_DIR = 'uploads'
+UPLOAD_READ_SIZE = 1024 * 1024
+
+
+def dataset_upload_path(dataset_hash, ext):
+    """Content-addressed storage name of a dataset, relative to MEDIA_ROOT."""
+    return f'{DATASET_UPLOAD_DIR}/{dataset_hash}{ext}'
+
+
+def calculate_dataset_hash(dataset):
+    hasher = hashlib.sha256()
+    for chunk in dataset.chunks():
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class HashedUploadedFile(UploadedFile):
+    """
+    An upload already written to disk next to its final location, with the
+    SHA-256 of its content. The scratch file is removed on close unless
+    ``store_dataset_upload`` moved it into place.
+    """
+
+    def __init__(self, file, name, content_type, size, charset, sha256, content_type_extra=None):
+        super().__init__(file, name, content_type, size, charset, content_type_extra)
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self.file.name
+
+    def close(self):
+        try:
+            self.file.close()
+        finally:
+            try:
+                os.remove(self.file.name)
+            except FileNotFoundError:
+                pass
+
+
+class HashingUploadHandler(FileUploadHandler):
+    """
+    Stream each uploaded file into ``MEDIA_ROOT/uploads`` while hashing it,
+    so the dedupe lookup and the final save need no second pass over the bytes.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        upload_dir = os.path.join(settings.MEDIA_ROOT, DATASET_UPLOAD_DIR)
+        os.makedirs(upload_dir, exist_ok=True)
+        # Same directory as the final path, so storing it is a rename
+        self.file = tempfile.NamedTemporaryFile(dir=upload_dir, prefix='.', suffix='.upload', delete=False)
+        self.hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.file.write(raw_data)
+        self.hasher.update(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.flush()
+        self.file.seek(0)
+        return HashedUploadedFile(
+            file=self.file,
+            name=self.file_name,
+            content_type=self.content_type,
+            size=file_size,
+            charset=self.charset,
+            sha256=self.hasher.hexdigest(),
+            content_type_extra=self.content_type_extra
+        )
+
+
+class HashingUploadMixin:
+    """Use ``HashingUploadHandler`` for the multipart uploads of an ``APIView``."""
+
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers = [HashingUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
+
+def _create_dataset(source_path, dataset_hash, ext, user, name):
+    """Move a fully written file into its content-addressed path and record it."""
+    storage_name = dataset_upload_path(dataset_hash, ext)
+    final_path = os.path.join(settings.MEDIA_ROOT, storage_name)
+    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+    os.replace(source_path, final_path)
+
+    try:
+        with transaction.atomic():
+            return UploadedDataset.objects.create(
+                user=user,
+                name=name,
+                dataset=storage_name,
+                dataset_hash=dataset_hash
+            ), True
+    except IntegrityError:
+        # A concurrent upload of the same content won the race; both wrote identical bytes
+        return UploadedDataset.objects.get(user=user, dataset_hash=dataset_hash), False
+
+
+def link_dataset(shared, user, name):
+    """
+    Return ``user``'s own ``UploadedDataset`` for content that is already
+    stored, pointing at the same file as ``shared`` (usually another user's row).
+    """
+    try:
+        with transaction.atomic():
+            return UploadedDataset.objects.create(
+                user=user,
+                name=name,
+                dataset=shared.dataset.name,
+                dataset_hash=shared.dataset_hash
+            )
+    except IntegrityError:
+        return UploadedDataset.objects.get(user=user, dataset_hash=shared.dataset_hash)
+
+
+def find_dataset(dataset_hash, user):
+    """``(own_row, shared_row)`` for a content hash; at most one of them is set."""
+    own = UploadedDataset.objects.filter(user=user, dataset_hash=dataset_hash).first()
+    if own is not None:
+        return own, None
+    return None, UploadedDataset.objects.filter(dataset_hash=dataset_hash).first()
+
+
+def store_dataset_upload(uploaded, user, name=None):
+    """
+    Return ``(UploadedDataset, created)`` for an uploaded dataset file,
+    reusing the caller's row, or the stored file, when the same content
+    was uploaded before.
+
+    Files received through ``HashingUploadHandler`` are renamed into their
+    content-addressed path; any other upload is hashed and copied.
+    """
+    ext = os.path.splitext(uploaded.name)[1].lower()
+    if ext not in DATASET_EXTENSIONS:
+        raise ValueError("Only CSV, XLS, and XLSX files are allowed.")
+
+    dataset_hash = getattr(uploaded, 'sha256', None) or calculate_dataset_hash(uploaded)
+
+    existing, shared = find_dataset(dataset_hash, user)
+    if existing is not None:
+        return existing, False
+    if shared is not None:
+        # Stored before by another user: share the file, not their row
+        return link_dataset(shared, user, name or uploaded.name), False
+
+    if isinstance(uploaded, HashedUploadedFile):
+        uploaded.file.flush()
+        source_path = uploaded.temporary_file_path()
+    else:
+        upload_dir = os.path.join(settings.MEDIA_ROOT, DATASET_UPLOAD_DIR)
+        os.makedirs(upload_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=upload_dir, prefix='.', suffix='.upload', delete=False) as f:
+            for chunk in uploaded.chunks():
+                f.write(chunk)
+        source_path = f.name
+
+    return _create_dataset(source_path, dataset_hash, ext, user, name or uploaded.name)
+
+
+# SHA-256 state of upload sessions whose chunks all arrived at this process.
+# hashlib objects can't be shared between processes, so a session that was
+# served by several workers is hashed from disk at finalize instead.
+_session_hashers = {}
+_session_hashers_lock = threading.Lock()
+
+
+def upload_session_path(session):
+    return os.path.join(settings.UPLOAD_SESSION_ROOT, f'{session.pk}.part')
+
+
+def start_upload_session(session):
+    """Create the empty partial file of a new ``UploadSession``."""
+    os.makedirs(settings.UPLOAD_SESSION_ROOT, exist_ok=True)
+    open(upload_session_path(session), 'wb').close()
+    with _session_hashers_lock:
+        _session_hashers[session.pk] = (0, hashlib.sha256())
+
+
+def append_upload_chunk(session, stream, length):
+    """
+    Append ``length`` bytes read from ``stream`` at ``session.received`` and
+    return the new offset. Bytes past a failed write are truncated on the
+    next call, so a chunk can simply be retried from the reported offset.
+    """
+    with _session_hashers_lock:
+        position, hasher = _session_hashers.pop(session.pk, (None, None))
+    if position != session.received:
+        hasher = None
+
+    written = 0
+    with open(upload_session_path(session), 'r+b') as f:
+        f.seek(session.received)
+        f.truncate()
+        while written < length:
+            block = stream.read(min(UPLOAD_READ_SIZE, length - written))
+            if not block:
+                break
+            f.write(block)
+            if hasher is not None:
+                hasher.update(block)
+            written += len(block)
+
+    if written != length:
+        raise ValueError(f"Expected {length} bytes but received {written}")
+
+    offset = session.received + written
+    if hasher is not None:
+        with _session_hashers_lock:
+            _session_hashers[session.pk] = (offset, hasher)
+    return offset
+
+
+def upload_session_hash(session):
+    """SHA-256 of a fully received session, re-reading the file only when needed."""
+    with _session_hashers_lock:
+        position, hasher = _session_hashers.pop(session.pk, (None, None))
+    if position == session.received:
+        return hasher.hexdigest()
+
+    hasher = hashlib.sha256()
+    with open(upload_session_path(session), 'rb') as f:
+        for block in iter(lambda: f.read(UPLOAD_READ_SIZE), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def discard_upload_session(session):
+    with _session_hashers_lock:
+        _session_hashers.pop(session.pk, None)
+    try:
+        os.remove(upload_session_path(session))
+    except FileNotFoundError:
+        pass
+
+
+def store_upload_session(session, dataset_hash):
+    """Turn a fully received session into the user's ``UploadedDataset``, deduped on ``dataset_hash``."""
+    existing, shared = find_dataset(dataset_hash, session.user)
+    if existing is not None or shared is not None:
+        discard_upload_session(session)
+    if existing is not None:
+        return existing, False
+    if shared is not None:
+        return link_dataset(shared, session.user, session.name or session.filename), False
+
+    ext = os.path.splitext(session.filename)[1].lower()
+    return _create_dataset(
+        upload_session_path(session), dataset_hash, ext, session.user, session.name or session.filename
+    )
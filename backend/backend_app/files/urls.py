@@ -1,17 +1,28 @@
 from django.urls import path
 
-from backend_app.files.views import UploadFileView, ColumnsView, ModelTrainigView, SaveModelView,SavedModelDetailView, PredictionView, get_all_files, get_all_config, get_user_config, get_user_files, DatasetPreviewAPI, UserTrainedModelsView, ModelFeaturesView, ModelDownloadView, DashboardStats
+from backend_app.files.views import UploadFileView, ColumnsView, ModelTrainigView, SaveModelView,SavedModelDetailView, PredictionView, get_all_files, get_all_config, get_user_config, get_user_files, DatasetPreviewAPI, UserTrainedModelsView, ModelFeaturesView, ModelDownloadView, DashboardStats, TrainingJobStatusView, TrainingJobResultView, ModelCacheStatsView, BatchPredictionView, TrainingCacheStatsView, ModelComparisonView, HyperparameterSearchView, DatasetCheckView, UploadSessionCreateView, UploadSessionView, UploadSessionCompleteView
 
 
 urlpatterns = [
     path('upload/', UploadFileView.as_view(), name='upload-file'),  
+    path('upload/check/', DatasetCheckView.as_view(), name='upload-check'),  
+    path('upload/sessions/', UploadSessionCreateView.as_view(), name='upload-session-create'),  
+    path('upload/sessions/<uuid:upload_id>/', UploadSessionView.as_view(), name='upload-session'),  
+    path('upload/sessions/<uuid:upload_id>/complete/', UploadSessionCompleteView.as_view(), name='upload-session-complete'),  
     path('dataset-preview/', DatasetPreviewAPI.as_view(), name='dataset-preview'),  
     path('columns/', ColumnsView.as_view(), name='upload-file-columns'),  
     path('train/', ModelTrainigView.as_view(), name='train-model'),  
+    path('train/<uuid:job_id>/', TrainingJobStatusView.as_view(), name='train-job-status'),  
+    path('train/<uuid:job_id>/result/', TrainingJobResultView.as_view(), name='train-job-result'),  
+    path('compare/', ModelComparisonView.as_view(), name='compare-models'),  
+    path('search/', HyperparameterSearchView.as_view(), name='hyperparameter-search'),  
     path('save/', SaveModelView.as_view(), name='save-model'),  
     path('saved-model/<int:pk>/', SavedModelDetailView.as_view(), name='save-model-detail'), 
     path('download-model/<int:pk>/', ModelDownloadView.as_view(), name='download-model'), 
     path('predict/<int:pk>/', PredictionView.as_view(), name='predict'),  
+    path('predict/<int:pk>/batch/', BatchPredictionView.as_view(), name='predict-batch'),  
+    path('model-cache/stats/', ModelCacheStatsView.as_view(), name='model-cache-stats'),  
+    path('training-cache/stats/', TrainingCacheStatsView.as_view(), name='training-cache-stats'),  
     path('model-features/<int:pk>/', ModelFeaturesView.as_view(), name='model-features'),  
     path('getfiles/', get_all_files, name='get-file'),  
     path('getconfigs/', get_all_config, name='get-configs'),  
@@ -1,9 +1,14 @@
 import pandas as pd
 import numpy as np
-from sklearn import preprocessing, model_selection, linear_model, neighbors, tree, ensemble, svm, metrics
+from sklearn import preprocessing, model_selection, linear_model, neighbors, tree, ensemble, svm, naive_bayes, metrics
 import joblib
 import traceback
 import time
+import io
+import itertools
+import json
+from collections import namedtuple
+from scipy import stats
 
 
 def read_file(file):
@@ -18,172 +23,649 @@ def read_file(file):
         raise ValueError("Unsupported file type")
 
 
-def preprocess_and_train(df, config):
-    try:
-        df_processed = df.copy()
-        features = config['features']
-        target = config['target']
-        print('Target column:',target)
-        print(df[target].nunique())
-        # Initialize feature type tracking
-        feature_types = {}
-        categorical_values = {}
+def read_file_sample(file, nrows):
+    """The header and first ``nrows`` rows of an uploaded CSV or Excel file."""
+    import os
+    ext = os.path.splitext(file.name)[1].lower()
+    file.seek(0)
+    if ext == '.csv':
+        return pd.read_csv(file, nrows=nrows)
+    elif ext in ('.xls', '.xlsx'):
+        return pd.read_excel(file, nrows=nrows)
+    else:
+        raise ValueError("Unsupported file type")
+
+
+class CategoryEncoder:
+    """
+    Label encoder backed by a precomputed category -> code lookup.
+
+    Codes match ``LabelEncoder`` (sorted classes); categories not seen during
+    fit map to the sentinel ``len(classes_)``. ``transform`` is a single hash
+    lookup over the whole column instead of one sklearn call per value.
+    """
+
+    def __init__(self, classes=None):
+        self.classes_ = None
+        self._index = None
+        if classes is not None:
+            self._set_classes(classes)
+
+    def _set_classes(self, classes):
+        self.classes_ = np.asarray(classes)
+        self._index = pd.Index(self.classes_)
+
+    @classmethod
+    def from_label_encoder(cls, le):
+        return cls(classes=le.classes_)
+
+    @property
+    def unknown_code(self):
+        return len(self.classes_)
+
+    def fit(self, values):
+        self._set_classes(np.unique(np.asarray(values)))
+        return self
+
+    def transform(self, values):
+        codes = self._index.get_indexer(np.asarray(values))
+        codes[codes == -1] = self.unknown_code
+        return codes
+
+    def fit_transform(self, values):
+        return self.fit(values).transform(values)
+
+    def inverse_transform(self, codes):
+        return self.classes_[np.asarray(codes)]
+
+    def __getstate__(self):
+        # The lookup table is rebuilt on load rather than pickled
+        return {'classes_': self.classes_}
+
+    def __setstate__(self, state):
+        self._set_classes(state['classes_'])
+
+
+def upgrade_label_encoders(encoder):
+    """Swap sklearn LabelEncoders in a saved per-column encoder dict for ``CategoryEncoder``."""
+    if not isinstance(encoder, dict):
+        return encoder
+    return {
+        col: le if isinstance(le, CategoryEncoder) else CategoryEncoder.from_label_encoder(le)
+        for col, le in encoder.items()
+    }
+
+
+def report_progress(progress, stage, percent):
+    """Forward a training stage to the optional progress callback."""
+    if progress is not None:
+        progress(stage, percent)
+
+
+# Model training
+model_map = {
+    'LinearRegression': linear_model.LinearRegression,
+    'LogisticRegression': linear_model.LogisticRegression,
+    'KNeighborsRegressor': neighbors.KNeighborsRegressor,
+    'KNeighborsClassifier': neighbors.KNeighborsClassifier,
+    'DecisionTreeRegressor': tree.DecisionTreeRegressor,
+    'DecisionTreeClassifier': tree.DecisionTreeClassifier,
+    'RandomForestRegressor': ensemble.RandomForestRegressor,
+    'RandomForestClassifier': ensemble.RandomForestClassifier,
+    'SVC': svm.SVC,
+    'Ridge': linear_model.Ridge,
+    # Also trainable out of core, chunk by chunk (see incremental.py)
+    'SGDClassifier': linear_model.SGDClassifier,
+    'SGDRegressor': linear_model.SGDRegressor,
+    'PassiveAggressiveClassifier': linear_model.PassiveAggressiveClassifier,
+    'Perceptron': linear_model.Perceptron,
+    'MultinomialNB': naive_bayes.MultinomialNB,
+    # Handle missing values and categories natively (see NATIVE_PREPROCESSING_MODELS)
+    'HistGradientBoostingClassifier': ensemble.HistGradientBoostingClassifier,
+    'HistGradientBoostingRegressor': ensemble.HistGradientBoostingRegressor
+}
+
+# Models trained on raw values: no imputation, one-hot encoding, outlier removal or scaling
+NATIVE_PREPROCESSING_MODELS = ('HistGradientBoostingClassifier', 'HistGradientBoostingRegressor')
+
+# Config keys that change the preprocessed split; model_type and parameters don't
+PREPROCESSING_KEYS = ('features', 'target', 'encoder', 'scaler', 'test_size', 'random_state', 'stratify', 'outlier_method')
+
+
+PreparedSplit = namedtuple('PreparedSplit', [
+    'feature_types', 'categorical_values',
+    'X_train', 'X_test', 'y_train', 'y_test',
+    'feature_encoder', 'scaler', 'target_encoder',
+    'preprocessing_time', 'fill_values'
+], defaults=(None,))
+
+
+def uses_native_preprocessing(model_type):
+    return model_type in NATIVE_PREPROCESSING_MODELS
+
+
+def preprocessing_config(config):
+    """The subset of a training config that determines ``prepare_split``'s output."""
+    return {
+        **{key: config.get(key) for key in PREPROCESSING_KEYS},
+        'native_preprocessing': uses_native_preprocessing(config.get('model_type'))
+    }
+
+
+def training_columns(config):
+    """The only dataset columns training reads: the selected features, then the target."""
+    return list(dict.fromkeys(config['features'] + [config['target']]))
+
+
+TEXT_DTYPES = ['object', 'category']
+
+
+def is_text_dtype(dtype):
+    """Object columns, or text stored as ``category`` (see ``dataset_cache.compact_dtypes``)."""
+    return dtype == 'O' or isinstance(dtype, pd.CategoricalDtype)
+
+
+def native_codes(encoder, values):
+    """``CategoryEncoder`` codes as floats, with missing values left as NaN."""
+    codes = encoder.transform(values).astype(np.float64)
+    codes[pd.isna(np.asarray(values))] = np.nan
+    return codes
+
+
+def fit_native_transforms(X_train, X_test, progress=None):
+    """
+    Preprocessing for ``NATIVE_PREPROCESSING_MODELS``: text columns become
+    ``CategoryEncoder`` codes and everything else is passed through, NaN
+    included. The encoder dict is saved like a LabelEncoder one, so
+    prediction needs no special case; a missing or unseen category gets the
+    unknown code, which the model treats as missing.
+    """
+    report_progress(progress, 'Encoding features', 50)
+    label_encoders = {}
+    for col in X_train.select_dtypes(include=TEXT_DTYPES).columns:
+        le = CategoryEncoder().fit(X_train[col].dropna())
+        X_train[col] = native_codes(le, X_train[col])
+        X_test[col] = native_codes(le, X_test[col])
+        label_encoders[col] = le
+    return X_train.to_numpy(np.float64), X_test.to_numpy(np.float64), label_encoders, None
+
+
+def native_categorical_features(feature_encoder, features, max_bins=255):
+    """
+    Boolean mask of the encoded columns a histogram model should split on as
+    categories, or None. Columns with ``max_bins`` or more categories are
+    left as ordinal codes, which the model can't take as categorical.
+    """
+    if not isinstance(feature_encoder, dict):
+        return None
+    mask = [col in feature_encoder and len(feature_encoder[col].classes_) < max_bins for col in features]
+    return mask if any(mask) else None
+
+
+def build_model(config, parameters=None, feature_encoder=None):
+    """
+    Instantiate ``config['model_type']`` with ``parameters`` (the config's
+    own when None). Histogram gradient boosting models also get the
+    categorical feature mask and early stopping unless they were given.
+    """
+    parameters = dict(config.get('parameters', {}) if parameters is None else parameters)
+    if uses_native_preprocessing(config['model_type']):
+        parameters.setdefault('early_stopping', True)
+        parameters.setdefault('categorical_features', native_categorical_features(
+            feature_encoder, config['features'], parameters.get('max_bins', 255)
+        ))
+    return model_map[config['model_type']](**parameters)
+
+
+def fit_feature_transforms(X_train, X_test, config, progress=None):
+    """
+    Fit the configured encoder and scaler on ``X_train`` and apply them to
+    both frames. Returns ``(X_train, X_test, feature_encoder, scaler)``.
+    """
+    if uses_native_preprocessing(config.get('model_type')):
+        return fit_native_transforms(X_train, X_test, progress=progress)
 
+    feature_encoder = None
+    if config['encoder'] == 'LabelEncoder':
+        feature_encoder = preprocessing.LabelEncoder()
+    elif config['encoder'] == 'OneHotEncoder':
+        feature_encoder = preprocessing.OneHotEncoder(handle_unknown='ignore', sparse_output=False)
+
+    scaler = None
+    if config['scaler'] == 'StandardScaler':
+        scaler = preprocessing.StandardScaler()
+    elif config['scaler'] == 'MinMaxScaler':
+        scaler = preprocessing.MinMaxScaler()
+
+    # Process categorical features
+    report_progress(progress, 'Encoding features', 50)
+    categorical_cols = X_train.select_dtypes(include=TEXT_DTYPES).columns
+    
+    if feature_encoder is not None:
+        if isinstance(feature_encoder, preprocessing.LabelEncoder):
+            label_encoders = {}
+            for col in categorical_cols:
+                le = CategoryEncoder()
+                X_train[col] = le.fit_transform(X_train[col])
+                X_test[col] = le.transform(X_test[col])
+                label_encoders[col] = le
+            feature_encoder = label_encoders
+        else:
+            X_train_cat = feature_encoder.fit_transform(X_train[categorical_cols])
+            X_test_cat = feature_encoder.transform(X_test[categorical_cols])
+            num_cols = X_train.select_dtypes(exclude=TEXT_DTYPES).columns
+            X_train = np.hstack([X_train[num_cols].values, X_train_cat])
+            X_test = np.hstack([X_test[num_cols].values, X_test_cat])
+
+    # Scale features
+    report_progress(progress, 'Scaling features', 60)
+    if scaler is not None:
+        X_train = scaler.fit_transform(X_train)
+        X_test = scaler.transform(X_test)
+
+    return X_train, X_test, feature_encoder, scaler
+
+
+def infer_feature_types(df, features, profile=None):
+    """
+    Split features into categorical (text, or at most 5 distinct values) and
+    numerical, with the categories offered for each categorical feature.
+
+    A dataset profile (see ``profiling.compute_profile``) already holds the
+    streamed dtypes, distinct counts and small distinct-value sets, so with
+    one the columns aren't rescanned.
+    """
+    feature_types = {}
+    categorical_values = {}
+    profile = profile or {}
+    cardinality = profile.get('cardinality', {})
+    dtypes = profile.get('dtypes', {})
+    distinct_values = profile.get('distinct_values', {})
+
+    for col in features:
+        if col in cardinality and col in dtypes:
+            is_categorical = dtypes[col] in TEXT_DTYPES or cardinality[col] <= 5
+            unique_vals = distinct_values.get(col)
+        else:
+            is_categorical = is_text_dtype(df[col].dtype) or df[col].nunique() <= 5
+            unique_vals = None
+
+        if is_categorical:
+            feature_types[col] = 'categorical'
+            if unique_vals is None:
+                unique_vals = df[col].dropna().unique()
+            # Get unique values, exclude NA/blank strings, convert to list
+            unique_vals = [x for x in unique_vals
+                        if not (isinstance(x, str)) or x.strip() != '']
+            categorical_values[col] = unique_vals if unique_vals else None
+        else:
+            feature_types[col] = 'numerical'
+    return feature_types, categorical_values
+
+
+def prepare_split(df, config, progress=None, profile=None):
+    """
+    Run every model-independent step of training: type detection, imputation,
+    outlier removal, train/test split, encoding and scaling. ``profile`` is
+    the stored profile of the dataset, if there is one.
+
+    Missing values are filled in ``df`` itself rather than in a copy, which
+    would double peak memory; pass a frame the caller no longer needs. Only
+    the feature and target columns are imputed or checked for outliers, and
+    for ``NATIVE_PREPROCESSING_MODELS`` only the target is imputed and no
+    rows are dropped as outliers.
+    """
+    columns = training_columns(config)
+    if list(df.columns) != columns:
+        # Copies just the used columns; frames from load_dataset already match
+        df = df.loc[:, columns]
+    df_processed = df
+    features = config['features']
+    target = config['target']
+    print('Target column:',target)
+    print(df[target].nunique())
+
+    start_time = time.time()
+    feature_types, categorical_values = infer_feature_types(df, features, profile)
+    if 'numerical' in feature_types.values():
         start_time = time.time()
+        print("Value counts before preprocessing:", df[config['target']].value_counts())
 
-        for col in features:
-            if df[col].dtype == 'O' or df[col].nunique() <= 5:
-                feature_types[col] = 'categorical'
-                # Get unique values, exclude NA/blank strings, convert to list
-                unique_vals = [x for x in df[col].dropna().unique() 
-                            if not (isinstance(x, str)) or x.strip() != '']
-                categorical_values[col] = unique_vals if unique_vals else None
-            else:
-                feature_types[col] = 'numerical'
-                start_time = time.time()
-                print("Value counts before preprocessing:", df[config['target']].value_counts())
+    native = uses_native_preprocessing(config.get('model_type'))
 
-        
+    # Handle missing values; the feature fill values are kept for prediction
+    report_progress(progress, 'Handling missing values', 20)
+    to_impute = df_processed[[target]] if native else df_processed
+    fill_values = {}
+    for col in to_impute.select_dtypes(exclude=TEXT_DTYPES):
+        fill_values[col] = df_processed[col].mean()
+        df_processed[col] = df_processed[col].fillna(fill_values[col])
+    for col in to_impute.select_dtypes(include=TEXT_DTYPES):
+        fill_values[col] = df_processed[col].mode()[0]
+        df_processed[col] = df_processed[col].fillna(fill_values[col])
+    fill_values.pop(target, None)
 
-        # Initialize preprocessing objects
-        feature_encoder = None
-        if config['encoder'] == 'LabelEncoder':
-            feature_encoder = preprocessing.LabelEncoder()
-        elif config['encoder'] == 'OneHotEncoder':
-            feature_encoder = preprocessing.OneHotEncoder(handle_unknown='ignore', sparse_output=False)
-
-        scaler = None
-        if config['scaler'] == 'StandardScaler':
-            scaler = preprocessing.StandardScaler()
-        elif config['scaler'] == 'MinMaxScaler':
-            scaler = preprocessing.MinMaxScaler()
-
-        # Handle missing values
-        for col in df_processed.select_dtypes(exclude=['object']):
-            df_processed[col] = df_processed[col].fillna(df_processed[col].mean())
-        for col in df_processed.select_dtypes(include=['object']):
-            df_processed[col] = df_processed[col].fillna(df_processed[col].mode()[0])
-
-        # Remove outliers from numerical features
-        numerical_cols = df_processed.select_dtypes(exclude=['object']).columns
-        df_processed = safe_remove_outliers(df_processed, numerical_cols, target_col=config['target'])
-
-        # Split data
-        X = df_processed.loc[:,features]
-        y = df_processed[target]
-
-        # Encode target if categorical
-        target_encoder = None
-        if y.dtype == 'O':
-            target_encoder = preprocessing.LabelEncoder()
-            y = target_encoder.fit_transform(y)
-
-        # ✅ Validate target class count
-        unique_classes = np.unique(y)
-        if len(unique_classes) < 2:
-            raise ValueError("Target column must contain at least two unique classes for classification.")
-
-        # ✅ Apply stratified split only if more than one class exists
-        stratify = y if config.get('stratify', False) and len(unique_classes) > 1 else None
-
-
-        # Train-test split
-        X_train, X_test, y_train, y_test = model_selection.train_test_split(
-            X, y,
-            test_size=config['test_size'],
-            random_state=config['random_state'],
-            stratify=stratify
+    # Remove outliers from numerical features
+    if not native:
+        report_progress(progress, 'Removing outliers', 30)
+        numerical_cols = df_processed.select_dtypes(exclude=TEXT_DTYPES).columns
+        df_processed = safe_remove_outliers(
+            df_processed, numerical_cols,
+            target_col=config['target'],
+            method=config.get('outlier_method', 'iqr')
         )
 
-        print('y_train unique classes:', np.unique(y_train))
-        print('y_train value counts:\n', pd.Series(y_train).value_counts())
+    # Split data
+    X = df_processed.loc[:,features]
+    y = df_processed[target]
 
-        # Process categorical features
-        categorical_cols = X_train.select_dtypes(include=['object']).columns
-        
-        if feature_encoder is not None:
-            if isinstance(feature_encoder, preprocessing.LabelEncoder):
-                label_encoders = {}
-                for col in categorical_cols:
-                    le = preprocessing.LabelEncoder()
-                    X_train[col] = le.fit_transform(X_train[col])
-                    X_test[col] = X_test[col].map(
-                        lambda x: le.transform([x])[0] if x in le.classes_ else len(le.classes_)
-                    )
-                    label_encoders[col] = le
-                feature_encoder = label_encoders
+    # Encode target if categorical
+    target_encoder = None
+    if is_text_dtype(y.dtype):
+        target_encoder = preprocessing.LabelEncoder()
+        y = target_encoder.fit_transform(y)
+
+    # ✅ Validate target class count
+    unique_classes = np.unique(y)
+    if len(unique_classes) < 2:
+        raise ValueError("Target column must contain at least two unique classes for classification.")
+
+    # ✅ Apply stratified split only if more than one class exists
+    stratify = y if config.get('stratify', False) and len(unique_classes) > 1 else None
+
+
+    # Train-test split
+    report_progress(progress, 'Splitting data', 40)
+    X_train, X_test, y_train, y_test = model_selection.train_test_split(
+        X, y,
+        test_size=config['test_size'],
+        random_state=config['random_state'],
+        stratify=stratify
+    )
+
+    print('y_train unique classes:', np.unique(y_train))
+    print('y_train value counts:\n', pd.Series(y_train).value_counts())
+
+    X_train, X_test, feature_encoder, scaler = fit_feature_transforms(X_train, X_test, config, progress=progress)
+
+    return PreparedSplit(
+        feature_types, categorical_values,
+        X_train, X_test, y_train, y_test,
+        feature_encoder, scaler, target_encoder,
+        preprocessing_time=time.time() - start_time,
+        fill_values=fill_values
+    )
+
+
+def train_on_split(split, config, progress=None):
+    """Fit and evaluate ``config['model_type']`` on an already prepared split."""
+    start_time = time.time()
+
+    report_progress(progress, 'Fitting model', 70)
+    model = build_model(config, feature_encoder=split.feature_encoder)
+    model.fit(split.X_train, split.y_train)
+
+    # Evaluation
+    report_progress(progress, 'Evaluating model', 90)
+    predictions = model.predict(split.X_test)
+
+    end_time = time.time()
+
+    training_time = round(end_time - start_time,2)
+    print("\n====================================\nTraining time",training_time)
+
+    accuracy = evaluate_model(split.y_test, predictions, config['problem_type'], config['features'], model)
+    if getattr(model, 'do_early_stopping_', False):
+        accuracy['boosting_iterations'] = {'used': int(model.n_iter_), 'max': model.max_iter}
+
+    return model, training_time, accuracy
+
+
+def cross_validation_folds(df, config):
+    """
+    Features, encoded target and the ``(train_idx, test_idx)`` pairs of a
+    ``config['cv_folds']``-fold split, stratified for classification when
+    ``config['stratify']`` is set.
+    """
+    # Rows without a label can't be scored
+    df = df.loc[df[config['target']].notna(), training_columns(config)]
+    X = df[config['features']]
+    y = df[config['target']]
+    if is_text_dtype(y.dtype):
+        y = pd.Series(preprocessing.LabelEncoder().fit_transform(y), index=y.index)
+
+    if y.nunique() < 2:
+        raise ValueError("Target column must contain at least two unique classes for classification.")
+
+    stratified = config.get('stratify', False) and config.get('problem_type') == 'classification'
+    splitter_class = model_selection.StratifiedKFold if stratified else model_selection.KFold
+    splitter = splitter_class(n_splits=config['cv_folds'], shuffle=True, random_state=config['random_state'])
+    folds = list(splitter.split(X, y))
+    return X, y, folds
+
+
+def evaluate_fold(X, y, train_idx, test_idx, config):
+    """
+    Fit one cross-validation fold. Fill values, outlier bounds, the encoder
+    and the scaler all come from the training rows of the fold only.
+    """
+    X_train, X_test = X.iloc[train_idx], X.iloc[test_idx]
+
+    if not uses_native_preprocessing(config['model_type']):
+        fill_values = {}
+        for col in X_train.columns:
+            if is_text_dtype(X_train[col].dtype):
+                fill_values[col] = X_train[col].mode()[0]
             else:
-                X_train_cat = feature_encoder.fit_transform(X_train[categorical_cols])
-                X_test_cat = feature_encoder.transform(X_test[categorical_cols])
-                num_cols = X_train.select_dtypes(exclude=['object']).columns
-                X_train = np.hstack([X_train[num_cols].values, X_train_cat])
-                X_test = np.hstack([X_test[num_cols].values, X_test_cat])
+                fill_values[col] = X_train[col].mean()
+        X_train = X_train.fillna(fill_values)
+        X_test = X_test.fillna(fill_values)
 
-        # Scale features
-        if scaler is not None:
-            X_train = scaler.fit_transform(X_train)
-            X_test = scaler.transform(X_test)
-
-        # Model training
-        model_map = {
-            'LinearRegression': linear_model.LinearRegression,
-            'LogisticRegression': linear_model.LogisticRegression,
-            'KNeighborsRegressor': neighbors.KNeighborsRegressor,
-            'KNeighborsClassifier': neighbors.KNeighborsClassifier,
-            'DecisionTreeRegressor': tree.DecisionTreeRegressor,
-            'DecisionTreeClassifier': tree.DecisionTreeClassifier,
-            'RandomForestRegressor': ensemble.RandomForestRegressor,
-            'RandomForestClassifier': ensemble.RandomForestClassifier,
-            'SVC': svm.SVC,
-            'Ridge': linear_model.Ridge
-        }
+        # Outliers are dropped from the training rows only; every test row is scored
+        X_train = safe_remove_outliers(
+            X_train, X_train.select_dtypes(exclude=TEXT_DTYPES).columns,
+            method=config.get('outlier_method', 'iqr')
+        )
+    else:
+        # The native transforms write encoded columns back into these frames
+        X_train, X_test = X_train.copy(), X_test.copy()
+    y_train = y.loc[X_train.index].to_numpy()
+    y_test = y.iloc[test_idx].to_numpy()
+
+    X_train, X_test, feature_encoder, _ = fit_feature_transforms(X_train, X_test, config)
+
+    model = build_model(config, feature_encoder=feature_encoder)
+    model.fit(X_train, y_train)
+    accuracy = evaluate_model(y_test, model.predict(X_test), config['problem_type'], config['features'], model)
+
+    # Only the scalar metrics are aggregated across folds
+    return {
+        name: float(value) for name, value in accuracy.items()
+        if isinstance(value, (int, float, np.number))
+    }
+
+
+def summarize_folds(fold_metrics):
+    """Mean and standard deviation of every metric over the cross-validation folds."""
+    frame = pd.DataFrame(fold_metrics)
+    return {
+        'folds': len(fold_metrics),
+        'mean': frame.mean().to_dict(),
+        'std': frame.std(ddof=0).to_dict(),
+        'fold_metrics': fold_metrics
+    }
 
-        
 
-        model = model_map[config['model_type']](**config.get('parameters', {}))
-        model.fit(X_train, y_train)
+# Metric each problem type's leaderboard is ranked by (higher is better)
+LEADERBOARD_METRICS = {'classification': 'accuracy_score', 'regression': 'r2_score'}
 
-        # Evaluation
-        predictions = model.predict(X_test)
 
-        end_time = time.time()
+def fit_candidate(split, config):
+    """
+    ``train_on_split`` for one model of a comparison. Errors are returned
+    rather than raised so one bad model doesn't fail the whole comparison.
+    """
+    try:
+        model, training_time, accuracy = train_on_split(split, config)
+        return model, training_time, accuracy, None
+    except Exception as e:
+        traceback.print_exc()
+        return None, 0, None, str(e)
+
+
+def build_leaderboard(entries, problem_type):
+    """Rank comparison entries by the problem type's metric; failed models go last."""
+    metric = LEADERBOARD_METRICS.get(problem_type, 'r2_score')
+    for entry in entries:
+        entry['score'] = entry['accuracy'][metric] if entry['accuracy'] else None
+
+    ranked = sorted(entries, key=lambda entry: (entry['score'] is None, -(entry['score'] or 0)))
+    for rank, entry in enumerate(ranked, start=1):
+        entry['rank'] = rank
+    return metric, ranked
 
-        training_time = round(end_time - start_time,2)
-        print("\n====================================\nTraining time",training_time)
 
-        accuracy = evaluate_model(y_test, predictions, config['problem_type'], features, model)
+# Distributions accepted in a search's param_distributions, e.g. {"distribution": "loguniform", "low": 0.01, "high": 100}
+SEARCH_DISTRIBUTIONS = {
+    'uniform': lambda low, high: stats.uniform(loc=low, scale=high - low),
+    'loguniform': stats.loguniform,
+    'randint': stats.randint,
+}
+
+
+def search_candidates(search, max_candidates, random_state=None):
+    """
+    Expand a search spec into the list of parameter dicts to try.
+
+    ``search`` holds either ``param_grid`` (lists of values per parameter,
+    every combination is tried) or ``param_distributions`` (lists or
+    distribution specs, ``n_candidates`` samples are drawn).
+    """
+    if ('param_grid' in search) == ('param_distributions' in search):
+        raise ValueError("Provide either param_grid or param_distributions")
+
+    if 'param_grid' in search:
+        grid = search['param_grid']
+        if not isinstance(grid, dict) or not all(isinstance(v, list) and v for v in grid.values()):
+            raise ValueError("param_grid must map each parameter to a non-empty list of values")
+        if len(model_selection.ParameterGrid(grid)) > max_candidates:
+            raise ValueError(f"param_grid has more than {max_candidates} combinations")
+        candidates = list(model_selection.ParameterGrid(grid))
+    else:
+        spec = search['param_distributions']
+        if not isinstance(spec, dict) or not spec:
+            raise ValueError("param_distributions must be a non-empty object")
+        distributions = {}
+        for name, value in spec.items():
+            if isinstance(value, list) and value:
+                distributions[name] = value
+            elif isinstance(value, dict) and value.get('distribution') in SEARCH_DISTRIBUTIONS:
+                try:
+                    distributions[name] = SEARCH_DISTRIBUTIONS[value['distribution']](value['low'], value['high'])
+                except (KeyError, TypeError, ValueError):
+                    raise ValueError(f"Distribution for '{name}' needs numeric 'low' and 'high'")
+            else:
+                raise ValueError(
+                    f"'{name}' must be a list of values or one of the distributions: {', '.join(SEARCH_DISTRIBUTIONS)}"
+                )
+        n_candidates = int(search.get('n_candidates', 20))
+        if not 1 <= n_candidates <= max_candidates:
+            raise ValueError(f"n_candidates must be between 1 and {max_candidates}")
+        candidates = list(model_selection.ParameterSampler(distributions, n_candidates, random_state=random_state))
 
-        return ( feature_types, categorical_values, training_time, model, feature_encoder, scaler, target_encoder, accuracy )
+    # Only string values are parsed; typed JSON values such as True or None are tried as given
+    return [clean_parameters(candidate) for candidate in candidates]
+
+
+def score_candidate(X_fit, y_fit, X_val, y_val, config, parameters, feature_encoder=None):
+    """
+    Fit ``config['model_type']`` with ``parameters`` and return its
+    validation score, or ``(None, error)`` when the fit fails.
+    """
+    try:
+        model = build_model(config, parameters, feature_encoder=feature_encoder)
+        model.fit(X_fit, y_fit)
+        predictions = model.predict(X_val)
+        if config['problem_type'] == 'classification':
+            return metrics.accuracy_score(y_val, predictions), None
+        return metrics.r2_score(y_val, predictions), None
+    except Exception as e:
+        return None, str(e)
+
+
+def preprocess_and_train(df, config, progress=None, split=None):
+    """
+    Train ``config['model_type']`` on ``df``. A ``PreparedSplit`` from an
+    earlier run with the same preprocessing settings can be passed as
+    ``split`` to go straight to ``model.fit``; ``df`` is not used then.
+    """
+    try:
+        if split is None:
+            split = prepare_split(df, config, progress=progress)
+
+        model, training_time, accuracy = train_on_split(split, config, progress=progress)
+        training_time = round(training_time + split.preprocessing_time, 2)
+        pipeline = TrainedPipeline.from_split(split, model, config['features'])
+
+        return ( split.feature_types, split.categorical_values, training_time, pipeline, accuracy )
 
     except Exception as e:
         traceback.print_exc()
         raise ValueError(f"Model training failed: {str(e)}")
 
 
-def evaluate_model(y_test, prediction, problem_type, features, model):
+def clean_parameters(params):
+    # Form fields arrive as strings, blank meaning "use the default"; typed JSON
+    # values (booleans, null, numbers, lists) are already what the estimator expects
+    cleaned = {}
+    for k, v in params.items():
+        if not isinstance(v, str):
+            cleaned[k] = v
+            continue
+        if v == "":
+            continue
+        try:
+            cleaned[k] = int(v) if v.isdigit() else float(v)
+        except ValueError:
+            cleaned[k] = v 
+    return cleaned
+
+
+def evaluate_model(y_test, prediction, problem_type, features, model, sample_weight=None):
+    """
+    Hold-out metrics of a fitted model. ``sample_weight`` lets a streamed
+    evaluation pass its accumulated (label, prediction) pair counts instead
+    of every row.
+    """
     accuracy = {}
     
     if problem_type == 'classification':
-        accuracy['accuracy_score'] = metrics.accuracy_score(y_test, prediction)
-        accuracy['precision'] = metrics.precision_score(y_test, prediction, average='weighted')
-        accuracy['recall'] = metrics.recall_score(y_test, prediction, average='weighted')
-        accuracy['f1_score'] = metrics.f1_score(y_test, prediction, average='weighted')
+        accuracy['accuracy_score'] = metrics.accuracy_score(y_test, prediction, sample_weight=sample_weight)
+        accuracy['precision'] = metrics.precision_score(y_test, prediction, average='weighted', sample_weight=sample_weight)
+        accuracy['recall'] = metrics.recall_score(y_test, prediction, average='weighted', sample_weight=sample_weight)
+        accuracy['f1_score'] = metrics.f1_score(y_test, prediction, average='weighted', sample_weight=sample_weight)
         
         # Confusion matrix with labels
         unique_classes = sorted(np.unique(y_test))
+        matrix = metrics.confusion_matrix(y_test, prediction, labels=unique_classes, sample_weight=sample_weight)
         accuracy['confusion_matrix'] = {
-            'matrix': metrics.confusion_matrix(y_test, prediction, labels=unique_classes).tolist(),
+            'matrix': matrix.round().astype(int).tolist(),
             'labels': [str(cls) for cls in unique_classes]
         }
         accuracy['classification_report'] = metrics.classification_report(
-            y_test, prediction, output_dict=True)
+            y_test, prediction, output_dict=True, sample_weight=sample_weight)
     else:
         accuracy['r2_score'] = metrics.r2_score(y_test, prediction)
         accuracy['mean_squared_error'] = metrics.mean_squared_error(y_test, prediction)
         accuracy['mean_absolute_error'] = metrics.mean_absolute_error(y_test, prediction)
         accuracy['root_mean_squared_error'] = np.sqrt(metrics.mean_squared_error(y_test, prediction))
 
-    # Feature importance
+    accuracy['feature_importance'] = feature_importance(model, features)
+    
+    return accuracy
+
+
+def feature_importance(model, features):
     feature_importance = {
         'labels': features,
         'values': [0]*len(features)  # Default to zeros
@@ -197,142 +679,369 @@ def evaluate_model(y_test, prediction, problem_type, features, model):
     except Exception as e:
         print(f"Couldn't get feature importance: {str(e)}")
 
-    accuracy['feature_importance'] = feature_importance
-    
-    return accuracy
+    return feature_importance
+
+
+OUTLIER_METHODS = ('iqr', 'zscore', 'none')
 
 
 # Remove outliers while maintaining alignment
-def safe_remove_outliers(df, cols, target_col=None):
+def safe_remove_outliers(df, cols, target_col=None, method='iqr', threshold=3.0):
     """
     Remove outliers while maintaining alignment
-    
+
+    Bounds for every column are computed in one vectorized pass over the
+    full frame, and rows are filtered once with a combined mask.
+
     Args:
         df: DataFrame
         cols: List of columns to process
         target_col: (Optional) Name of target column to exclude
+        method: 'iqr' (1.5 * IQR fences), 'zscore' (|z| <= threshold) or 'none'
+        threshold: z-score cut-off used by the 'zscore' method
     """
-    if target_col is not None and target_col in cols:
-        cols = [col for col in cols if col != target_col]
-        
-    for col in cols:
-        q1 = df[col].quantile(0.25)
-        q3 = df[col].quantile(0.75)
+    if method not in OUTLIER_METHODS:
+        raise ValueError(f"Unknown outlier method '{method}'. Use one of: {', '.join(OUTLIER_METHODS)}")
+
+    cols = [col for col in cols if col != target_col]
+    if method == 'none' or not cols:
+        return df
+
+    values = df[cols]
+    if method == 'iqr':
+        quartiles = values.quantile([0.25, 0.75])
+        q1 = quartiles.loc[0.25].to_numpy()
+        q3 = quartiles.loc[0.75].to_numpy()
         iqr = q3 - q1
         lower_bound = q1 - (1.5 * iqr)
         upper_bound = q3 + (1.5 * iqr)
-        df = df[(df[col] >= lower_bound) & (df[col] <= upper_bound)]
-    return df
+    else:
+        mean = values.mean().to_numpy()
+        # Constant columns have no spread and never produce outliers
+        std = values.std(ddof=0).replace(0, np.inf).to_numpy()
+        lower_bound = mean - threshold * std
+        upper_bound = mean + threshold * std
 
+    arr = values.to_numpy()
+    mask = ((arr >= lower_bound) & (arr <= upper_bound)).all(axis=1)
+    return df[mask]
 
-def load_model_and_predict(model_path, features, columns, encoder=None, scaler=None, target_encoder=None):
-    try:
-        print("\n=== PREDICTION DEBUG START ===")
-        print(f"Input features: {features}")
-        print(f"Expected columns: {columns}")
 
-        # Validate columns match exactly
-        if len(features) != len(columns):
-            raise ValueError(f"Expected {len(columns)} features, got {len(features)}")
+def categorical_columns(encoder):
+    """Columns the saved feature encoder was fitted on."""
+    if isinstance(encoder, dict):
+        return set(encoder)
+    if encoder is not None and hasattr(encoder, 'feature_names_in_'):
+        return set(encoder.feature_names_in_)
+    return set()
 
-        # Load model
-        model = joblib.load(model_path)
-        print("Model loaded successfully")
 
-        # Validate input
-        if columns is None:
-            raise ValueError("Expected columns cannot be None")
-        if len(features) != len(columns):
-            raise ValueError(f"Expected {len(columns)} features, got {len(features)}")
-
-        # Create DataFrame
-        input_df = pd.DataFrame([features], columns=columns)
-        print("\n📄 Raw input DataFrame:")
-        print(input_df)
+def transform_features(input_df, columns, encoder=None, scaler=None, fill_values=None):
+    """
+    Apply the saved preprocessing to a frame of raw inputs, column by column
+    rather than row by row, and return the matrix the model expects.
 
-        processed_df = input_df.copy()
+    Mirrors the training path: missing values get the training-time
+    ``fill_values``, LabelEncoder dicts replace categorical columns in
+    place, a shared OneHotEncoder appends its output after the numeric
+    columns, and the scaler runs last.
+    """
+    processed_df = input_df.loc[:, columns].copy()
+    categorical = categorical_columns(encoder)
 
-        for col in processed_df.columns:
-            try:
-                processed_df[col] = pd.to_numeric(processed_df[col])
-            except:
-                pass
+    for col in processed_df.columns:
+        if col in categorical:
+            # A blank field is missing, as it is when read from a CSV
+            processed_df[col] = processed_df[col].where(processed_df[col] != '')
+            continue
+        try:
+            processed_df[col] = pd.to_numeric(processed_df[col])
+        except (ValueError, TypeError):
+            pass
 
-        # Handle missing values
+    # Handle missing values
+    if fill_values is not None:
+        processed_df = processed_df.fillna(fill_values)
+    else:
+        # Models saved without fill values fall back to the statistics of the input itself
         for col in processed_df.select_dtypes(include=['float64', 'int64']):
             processed_df[col] = processed_df[col].fillna(processed_df[col].mean())
 
         for col in processed_df.select_dtypes(include=['object']):
-            processed_df[col] = processed_df[col].fillna(processed_df[col].mode()[0])
-
-        # Encoding categorical variables
-        if encoder is not None:
-            print("Categorical columns before encoding:", processed_df.select_dtypes(include=['object']).columns.tolist())
-
-            if isinstance(encoder, dict):
-                for col in processed_df.select_dtypes(include=['object']):
-                    if col in encoder:
-                        le = encoder[col]
-                        processed_df[col] = processed_df[col].map(
-                            lambda x: le.transform([x])[0] if x in le.classes_ else len(le.classes_)
-                        )
-                        print(f"Encoded '{col}' using LabelEncoder")
-            else:
-                for col in processed_df.select_dtypes(include=['object']):
-                    if col in columns:
-                        processed_df[col] = encoder.transform(processed_df[[col]])
-                        print(f"Encoded '{col}' using shared encoder")
+            if processed_df[col].isna().any():
+                processed_df[col] = processed_df[col].fillna(processed_df[col].mode()[0])
+
+    # Encoding categorical variables
+    if isinstance(encoder, dict):
+        encoder = upgrade_label_encoders(encoder)
+        for col in processed_df.select_dtypes(include=['object']):
+            if col in encoder:
+                processed_df[col] = encoder[col].transform(processed_df[col])
+    elif encoder is not None:
+        cat_cols = [col for col in processed_df.columns if col in categorical]
+        num_cols = [col for col in processed_df.columns if col not in categorical]
+        encoded = encoder.transform(processed_df[cat_cols])
+        processed_df = np.hstack([processed_df[num_cols].values, encoded])
+
+    # Scaling numerical features
+    if scaler is not None:
+        if isinstance(processed_df, pd.DataFrame) and hasattr(scaler, 'feature_names_in_'):
+            numeric_cols = list(scaler.feature_names_in_)
+            processed_df[numeric_cols] = scaler.transform(processed_df[numeric_cols])
+        else:
+            processed_df = scaler.transform(processed_df)
+
+    if isinstance(processed_df, pd.DataFrame):
+        processed_df = processed_df.values
+    return processed_df
+
+
+def decode_predictions(prediction, target_encoder=None):
+    """Map encoded class labels back and round float outputs for display."""
+    # Inverse transform (for classification)
+    if target_encoder is not None:
+        prediction = target_encoder.inverse_transform(prediction)
+
+    # Round float predictions if applicable
+    if isinstance(prediction, (list, np.ndarray)):
+        if np.issubdtype(np.array(prediction).dtype, np.floating):
+            prediction = np.round(prediction, 2)
+    elif isinstance(prediction, float):
+        prediction = round(prediction, 2)
+    return prediction
+
+
+class TrainedPipeline:
+    """
+    A trained model and everything needed to score raw rows with it: the
+    feature columns in training order, the training-time fill values, the
+    feature encoder, the scaler, the estimator and the target encoder.
+    Saved models pickle one of these as a single artifact.
+    """
+
+    # Pipelines pickled before fill values were kept don't have the attribute
+    fill_values = None
+
+    def __init__(self, columns, model, encoder=None, scaler=None, target_encoder=None, fill_values=None):
+        self.columns = list(columns)
+        self.model = model
+        self.encoder = upgrade_label_encoders(encoder)
+        self.scaler = scaler
+        self.target_encoder = target_encoder
+        self.fill_values = fill_values
+
+    @classmethod
+    def from_split(cls, split, model, columns):
+        return cls(
+            columns, model,
+            encoder=split.feature_encoder, scaler=split.scaler,
+            target_encoder=split.target_encoder, fill_values=split.fill_values
+        )
+
+    def categorical_columns(self):
+        return categorical_columns(self.encoder)
+
+    def transform(self, input_df):
+        """The model's input matrix for a frame of raw inputs."""
+        return transform_features(
+            input_df, self.columns,
+            encoder=self.encoder, scaler=self.scaler, fill_values=self.fill_values
+        )
+
+    def predict(self, input_df):
+        """Decoded predictions for every row of ``input_df``, in one ``predict`` call."""
+        return decode_predictions(self.model.predict(self.transform(input_df)), self.target_encoder)
+
+
+def _missing_text(values):
+    """Missing entries of an object array: None, NaN, or a blank field."""
+    return pd.isna(values) | (values == '')
+
+
+class InferencePlan:
+    """
+    A ``TrainedPipeline`` compiled for scoring. Everything that is fixed per
+    model is worked out once: the column order, the positions of the
+    numeric and categorical columns, the numeric fill values as a vector,
+    a lookup index per encoded column (one-hot columns map straight to
+    their output column) and the scaler as a multiply-add per output
+    column. Raw values then go to the model's contiguous float64 input
+    matrix without building a DataFrame.
+
+    Pipelines it can't compile (saved without fill values, or with an
+    encoder or scaler it doesn't know) go through
+    ``TrainedPipeline.transform`` instead.
+    """
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.columns = pipeline.columns
+        self.model = pipeline.model
+        self.target_encoder = pipeline.target_encoder
+        self.compiled = self._compile(pipeline)
 
-        print("\n📊 DataFrame after encoding:")
-        print(processed_df.head())
+    def _compile(self, pipeline):
+        encoder, fill_values = pipeline.encoder, pipeline.fill_values
+        if fill_values is None:
+            return False
+        categorical = pipeline.categorical_columns()
+        positions = {col: i for i, col in enumerate(self.columns)}
 
-        # Scaling numerical features
+        self.numeric_index = np.array([i for i, col in enumerate(self.columns) if col not in categorical], dtype=np.intp)
+        self.numeric_fill = np.array([fill_values.get(self.columns[i], np.nan) for i in self.numeric_index], dtype=np.float64)
+        # (input position, fill value or None, lookup index, output column per code, unknown output)
+        self.categorical = []
+
+        if encoder is None or isinstance(encoder, dict):
+            # Codes replace the categorical columns in place; unknown and missing values get the unknown code
+            self.one_hot = False
+            self.width = len(self.columns)
+            self.numeric_out = self.numeric_index
+            for col, le in (encoder or {}).items():
+                self.categorical.append((positions[col], fill_values.get(col), pd.Index(le.classes_), None, le.unknown_code))
+        elif isinstance(encoder, preprocessing.OneHotEncoder):
+            if encoder.drop_idx_ is not None or getattr(encoder, '_infrequent_enabled', False):
+                return False
+            # Numeric columns first, then one block of indicator columns per categorical column
+            self.one_hot = True
+            self.numeric_out = np.arange(len(self.numeric_index))
+            offset = len(self.numeric_index)
+            # Fitted on no columns when every feature is numeric
+            for col, categories in zip(getattr(encoder, 'feature_names_in_', ()), encoder.categories_):
+                outputs = np.arange(offset, offset + len(categories))
+                self.categorical.append((positions[col], fill_values.get(col), pd.Index(categories), outputs, -1))
+                offset += len(categories)
+            self.width = offset
+        else:
+            return False
+
+        self.scale = self.shift = None
+        scaler = pipeline.scaler
         if scaler is not None:
-            print("\nBefore scaling:")
-            print(processed_df.select_dtypes(include=['float64', 'int64']).head())
+            if isinstance(scaler, preprocessing.StandardScaler):
+                scale = 1 / scaler.scale_ if scaler.with_std else np.ones(scaler.n_features_in_)
+                shift = -scaler.mean_ * scale if scaler.with_mean else np.zeros(scaler.n_features_in_)
+            elif isinstance(scaler, preprocessing.MinMaxScaler) and not scaler.clip:
+                scale, shift = scaler.scale_, scaler.min_
+            else:
+                return False
+            # Fitted on a DataFrame, the scaler names its columns; on an array it covers every output column
+            if hasattr(scaler, 'feature_names_in_') and not self.one_hot:
+                scaled = np.array([positions[col] for col in scaler.feature_names_in_], dtype=np.intp)
+            else:
+                scaled = np.arange(self.width)
+            self.scale, self.shift = np.ones(self.width), np.zeros(self.width)
+            self.scale[scaled], self.shift[scaled] = scale, shift
+        return True
+
+    def categorical_columns(self):
+        return self.pipeline.categorical_columns()
+
+    def _matrix(self, numeric, categorical_values, rows):
+        features = np.empty((rows, self.width), dtype=np.float64)
+
+        try:
+            numeric = numeric.astype(np.float64)
+        except (ValueError, TypeError):
+            # Blank fields or numbers sent as text; anything else still raises
+            numeric = np.column_stack([pd.to_numeric(numeric[:, j]) for j in range(numeric.shape[1])]).astype(np.float64)
+        features[:, self.numeric_out] = np.where(np.isnan(numeric), self.numeric_fill, numeric)
 
-            if hasattr(scaler, 'feature_names_in_'):
-                numeric_cols = scaler.feature_names_in_ 
+        if self.one_hot:
+            features[:, len(self.numeric_out):] = 0
+        for (position, fill, index, outputs, unknown), values in zip(self.categorical, categorical_values):
+            missing = _missing_text(values)
+            if fill is not None and missing.any():
+                values = np.where(missing, fill, values)
+            codes = index.get_indexer(values)
+            if outputs is None:
+                features[:, position] = np.where(codes == -1, unknown, codes)
             else:
-                numeric_cols = processed_df.select_dtypes(include=['float64', 'int64']).columns
+                known = codes != -1
+                features[np.nonzero(known)[0], outputs[codes[known]]] = 1
 
-            scaled_array = scaler.transform(processed_df[numeric_cols])
-            processed_df[numeric_cols] = pd.DataFrame(scaled_array, columns=numeric_cols)
+        if self.scale is not None:
+            features *= self.scale
+            features += self.shift
+        return features
 
-            print("After scaling:")
-            print(processed_df.head())
+    def transform(self, input_df):
+        """The model's input matrix for a frame holding (at least) the feature columns."""
+        if not self.compiled:
+            return self.pipeline.transform(input_df)
+        numeric = input_df[[self.columns[i] for i in self.numeric_index]].to_numpy()
+        categorical_values = [input_df[self.columns[position]].to_numpy(dtype=object) for position, *_ in self.categorical]
+        return self._matrix(numeric, categorical_values, len(input_df))
 
-        # Log dtype info
-        print("\nProcessed DataFrame types:")
-        print(processed_df.dtypes)
+    def transform_rows(self, rows):
+        """The model's input matrix for a list of rows, each a list of values in ``columns`` order."""
+        if not self.compiled:
+            return self.pipeline.transform(pd.DataFrame(rows, columns=self.columns))
+        values = np.array(rows, dtype=object).reshape(len(rows), len(self.columns))
+        categorical_values = [values[:, position] for position, *_ in self.categorical]
+        return self._matrix(values[:, self.numeric_index], categorical_values, len(rows))
+
+    def predict(self, input_df):
+        """Decoded predictions for every row of ``input_df``, in one ``predict`` call."""
+        return decode_predictions(self.model.predict(self.transform(input_df)), self.target_encoder)
+
+
+def iter_input_chunks(file, chunksize, dtype=None):
+    """Yield DataFrame chunks from an uploaded CSV, Excel or JSON-lines file."""
+    import os
+    ext = os.path.splitext(file.name)[1].lower()
+    file.seek(0)
+    if ext == '.csv':
+        yield from pd.read_csv(file, chunksize=chunksize, dtype=dtype)
+    elif ext in ('.jsonl', '.ndjson', '.json'):
+        # Parsed line by line rather than with read_json, which turns integer codes
+        # in a column with gaps into floats before ``dtype`` could be applied
+        lines = (line for line in io.TextIOWrapper(file, encoding='utf-8') if line.strip())
+        while True:
+            records = [json.loads(line) for line in itertools.islice(lines, chunksize)]
+            if not records:
+                break
+            chunk = pd.DataFrame.from_records(records)
+            for col in [col for col in dtype or {} if col in chunk.columns]:
+                # As read_csv does: present values get the dtype, missing values stay missing
+                values = pd.Series([record.get(col) for record in records], index=chunk.index, dtype=object)
+                chunk[col] = values.where(values.isna(), values.astype(dtype[col]))
+            yield chunk
+    elif ext in ('.xls', '.xlsx'):
+        df = pd.read_excel(file, dtype=dtype)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+    else:
+        raise ValueError("Unsupported file type")
+
+
+def load_model_and_predict(plan, features):
+    try:
+        columns = plan.columns
+        print("\n=== PREDICTION DEBUG START ===")
+        print(f"Input features: {features}")
+        print(f"Expected columns: {columns}")
+
+        # Validate input
+        if columns is None:
+            raise ValueError("Expected columns cannot be None")
+        if len(features) != len(columns):
+            raise ValueError(f"Expected {len(columns)} features, got {len(features)}")
 
         # Final features array
-        final_features = processed_df.values
-        if final_features.ndim == 1:
-            final_features = final_features.reshape(1, -1)
-        elif final_features.ndim == 2 and final_features.shape[0] == 1:
-            pass
-        else:
+        final_features = plan.transform_rows([features])
+        if final_features.ndim != 2 or final_features.shape[0] != 1:
             raise ValueError(f"Unexpected features shape: {final_features.shape}")
 
         print("\nFinal features for prediction:")
         print(final_features)
 
         # Predict
-        prediction = model.predict(final_features)
+        prediction = plan.model.predict(final_features)
         print(f"\nRaw prediction: {prediction}")
 
-        # Inverse transform (for classification)
-        if target_encoder is not None:
-            prediction = target_encoder.inverse_transform(prediction)
-            print(f"Decoded prediction: {prediction}")
-
-        # Round float predictions if applicable
-        if isinstance(prediction, (list, np.ndarray)):
-            if np.issubdtype(np.array(prediction).dtype, np.floating):
-                prediction = np.round(prediction, 2)
-        elif isinstance(prediction, float):
-            prediction = round(prediction, 2)
+        prediction = decode_predictions(prediction, plan.target_encoder)
+        print(f"Decoded prediction: {prediction}")
 
         print("=== PREDICTION DEBUG END ===")
         return prediction
@@ -2,20 +2,27 @@ from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django.core.files.storage import default_storage
 
 from django.core.cache import cache
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.conf import settings
 from django.core.files.base import ContentFile
 import uuid
+from django.db import transaction
 from django.db.models import Avg, Count, Case, When, Value, CharField
 from sklearn import logger
 
-from backend_app.models import UploadedDataset, ModelConfig, SavedModel
-from backend_app.files.serializers import UploadFileSerializer, ModelConfigSerializer, SaveModelSerializer, PredictionSerializer, DatasetPreviewSerializer
-from backend_app.files.utils import read_file, preprocess_and_train, load_model_and_predict
+from backend_app.models import UploadedDataset, ModelConfig, SavedModel, TrainingJob, UploadSession
+from backend_app.files.serializers import UploadFileSerializer, ModelConfigSerializer, SaveModelSerializer, PredictionSerializer, DatasetPreviewSerializer, TrainingJobSerializer, UploadSessionSerializer
+from backend_app.files.utils import read_file_sample, load_model_and_predict, clean_parameters, iter_input_chunks, model_map, search_candidates
+from backend_app.files.jobs import submit_job, expire_stale_job, queue_dataset_profile, run_training_job, run_comparison_job, run_search_job, training_result_cache, preprocessed_split_cache, training_cache_key, build_training_result
+from backend_app.files.model_cache import model_bundle_cache, load_pipeline, export_pipeline_files
+from backend_app.files.incremental import supports_partial_fit
+from backend_app.files.dataset_cache import dataset_columns, dataset_memory_usage, load_dataset, iter_dataset_chunks
+from backend_app.files.profiling import read_profile, column_type, reservoir_sample, summarize_frame
+from backend_app.files.uploads import HashingUploadMixin, store_dataset_upload, start_upload_session, append_upload_chunk, upload_session_hash, store_upload_session, discard_upload_session
 from backend_app.files.permissions import IsCreatedUser
 
 import pandas as pd
@@ -25,90 +32,287 @@ import json
 import hashlib
 import zipfile
 import io
+import itertools
+import re
 import os
 from django.utils.text import slugify
 from urllib.parse import quote
 
 
-class UploadFileView(APIView):
+class UploadFileView(HashingUploadMixin, APIView):
 
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
+        if 'dataset' not in request.FILES:
+            return Response({"error": "No file uploaded"}, status=status.HTTP_400_BAD_REQUEST)
 
-        request.data['user'] = request.user.id
-        serializer = UploadFileSerializer(data=request.data)
-
-        if serializer.is_valid():
-            # extension = serializer.validated_data['file_path'].split('.')[-1]
-            file_path = serializer.validated_data['file_path']
-            file_name = file_path.name
-            print(file_name)
-            serializer.save()
+        dataset = request.FILES['dataset']
+        try:
+            file_instance, created = store_dataset_upload(dataset, request.user, request.data.get('name'))
+            if created:
+                # Only the header is parsed here; the columnar cache and profile are built by a worker
+                dataset_columns(file_instance)
+                queue_dataset_profile(file_instance)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except pd.errors.EmptyDataError:
+            return Response({"error": "Uploaded file is empty"}, status=status.HTTP_400_BAD_REQUEST)
 
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        serializer = UploadFileSerializer(file_instance)
+        return Response({
+            **serializer.data,
+            "file_status": "new" if created else "existing",
+            "memory_usage": dataset_memory_usage(file_instance)
+        }, status=status.HTTP_200_OK)
     
+class UploadSessionCreateView(APIView):
+    """Start a resumable upload: ``PUT`` the chunks in order, then complete it."""
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = UploadSessionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        session = serializer.save(user=request.user)
+        start_upload_session(session)
+
+        return Response({
+            **UploadSessionSerializer(session).data,
+            'chunk_size': settings.UPLOAD_CHUNK_MAX_BYTES
+        }, status=status.HTTP_201_CREATED)
+
+
+class UploadSessionView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, upload_id):
+        try:
+            session = UploadSession.objects.get(pk=upload_id, user=request.user)
+        except UploadSession.DoesNotExist:
+            return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response(UploadSessionSerializer(session).data, status=status.HTTP_200_OK)
+
+    def put(self, request, upload_id):
+        """Append the raw request body at ``?offset=``, which must equal the current offset."""
+        try:
+            offset = int(request.query_params.get('offset'))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except (TypeError, ValueError):
+            return Response({"error": "offset query parameter must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if length <= 0:
+            return Response({"error": "Empty chunk"}, status=status.HTTP_400_BAD_REQUEST)
+        if length > settings.UPLOAD_CHUNK_MAX_BYTES:
+            return Response({
+                "error": f"Chunks can be at most {settings.UPLOAD_CHUNK_MAX_BYTES} bytes"
+            }, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        with transaction.atomic():
+            try:
+                session = UploadSession.objects.select_for_update().get(pk=upload_id, user=request.user)
+            except UploadSession.DoesNotExist:
+                return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+
+            if session.status != UploadSession.STATUS_ACTIVE:
+                return Response({"error": "Upload is already complete"}, status=status.HTTP_409_CONFLICT)
+            if offset != session.received:
+                # Tells a resuming client where to continue from
+                return Response({
+                    "error": "Offset does not match the bytes received so far",
+                    "offset": session.received
+                }, status=status.HTTP_409_CONFLICT)
+            if session.received + length > session.size:
+                return Response({"error": "Chunk extends past the declared size"}, status=status.HTTP_400_BAD_REQUEST)
+
+            try:
+                session.received = append_upload_chunk(session, request.stream, length)
+            except (OSError, ValueError) as e:
+                return Response({"error": f"Chunk upload failed: {str(e)}", "offset": offset}, status=status.HTTP_400_BAD_REQUEST)
+            session.save(update_fields=['received', 'updated_at'])
+
+        return Response(UploadSessionSerializer(session).data, status=status.HTTP_200_OK)
+
+    def delete(self, request, upload_id):
+        try:
+            session = UploadSession.objects.get(pk=upload_id, user=request.user)
+        except UploadSession.DoesNotExist:
+            return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        if session.status == UploadSession.STATUS_ACTIVE:
+            discard_upload_session(session)
+        session.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class UploadSessionCompleteView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, upload_id):
+        with transaction.atomic():
+            try:
+                session = UploadSession.objects.select_for_update().get(pk=upload_id, user=request.user)
+            except UploadSession.DoesNotExist:
+                return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+
+            if session.status == UploadSession.STATUS_COMPLETE:
+                return Response({
+                    **UploadFileSerializer(session.dataset).data,
+                    "file_status": "existing"
+                }, status=status.HTTP_200_OK)
+
+            if session.received != session.size:
+                return Response({
+                    "error": "Upload is incomplete",
+                    "offset": session.received,
+                    "size": session.size
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            dataset_hash = upload_session_hash(session)
+            if session.sha256 and session.sha256 != dataset_hash:
+                discard_upload_session(session)
+                session.delete()
+                return Response({
+                    "error": "Checksum mismatch; the upload was discarded and has to be started again"
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            file_instance, created = store_upload_session(session, dataset_hash)
+            session.sha256 = dataset_hash
+            session.dataset = file_instance
+            session.status = UploadSession.STATUS_COMPLETE
+            session.save()
+
+        # Columnar cache and profile for previews and training are built by a worker, as for a direct upload
+        try:
+            if created:
+                dataset_columns(file_instance)
+                queue_dataset_profile(file_instance)
+        except pd.errors.EmptyDataError:
+            return Response({"error": "Uploaded file is empty"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            **UploadFileSerializer(file_instance).data,
+            "file_status": "new" if created else "existing",
+            "memory_usage": dataset_memory_usage(file_instance)
+        }, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+
+class DatasetCheckView(APIView):
+    """
+    Pre-upload handshake: the client sends the SHA-256 and size of a file and
+    learns whether it has already uploaded it, in which case it can pass the
+    returned ``dataset_id`` instead of uploading the file again.
+
+    Only the caller's own datasets are considered. A hash and size are not
+    proof of having the file, so content stored for other users is only
+    shared once the bytes have actually been uploaded and hashed.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        dataset_hash = str(request.data.get('sha256', '')).lower()
+        if not re.fullmatch(r'[0-9a-f]{64}', dataset_hash):
+            return Response({"error": "sha256 must be a 64 character hex digest"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            size = int(request.data.get('size'))
+        except (TypeError, ValueError):
+            return Response({"error": "size must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+        file_instance = UploadedDataset.objects.filter(user=request.user, dataset_hash=dataset_hash).first()
+        try:
+            # The size guards against a stored file that went missing or was truncated
+            stored_size = file_instance.dataset.size if file_instance is not None else None
+        except (OSError, ValueError):
+            stored_size = None
+        if stored_size != size:
+            return Response({"exists": False}, status=status.HTTP_200_OK)
+
+        return Response({
+            "exists": True,
+            "dataset_id": file_instance.id,
+            "name": file_instance.name,
+            "dataset_hash": file_instance.dataset_hash
+        }, status=status.HTTP_200_OK)
+
+
 class DatasetPreviewAPI(APIView):
+    permission_classes = [IsAuthenticated]
+
     def post(self, request):
         serializer = DatasetPreviewSerializer(data=request.data)
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
         dataset_obj = request.FILES.get('dataset')
+        dataset_id = serializer.validated_data.get('dataset_id')
         rows_count = int(request.data.get('row_count', 5))  # Default to 5 rows if not specified
 
-        if not dataset_obj:
-            return Response({"error": "No file uploaded."}, status=status.HTTP_400_BAD_REQUEST)
-        
         try:
-            if dataset_obj.name.endswith('.csv'):
-                df = pd.read_csv(dataset_obj)
-            elif dataset_obj.name.endswith(('.xls', '.xlsx')):
-                df = pd.read_excel(dataset_obj)
+            if dataset_id is not None:
+                # Already uploaded: read from the columnar cache instead of re-parsing the file
+                try:
+                    file_instance = UploadedDataset.objects.get(pk=dataset_id, user=request.user)
+                except UploadedDataset.DoesNotExist:
+                    return Response({"error": "Dataset not found."}, status=status.HTTP_404_NOT_FOUND)
+
+                # Stored profile (computed in the background at upload) plus just the rows shown
+                profile = read_profile(file_instance.dataset_hash) if file_instance.dataset_hash else None
+                if profile is not None:
+                    preview = load_dataset(file_instance, nrows=rows_count)
+                    return Response({
+                        "data": preview.astype(object).fillna('').to_dict(orient='records'),
+                        "columns": profile['columns'],
+                        "column_types": profile['column_types'],
+                        "stats": profile['stats'],
+                        "correlation": profile['correlation'],
+                        "null_counts": profile['null_counts'],
+                        "cardinality": profile['cardinality'],
+                        "rows": profile['rows'],
+                        "sampled": False,
+                        "sample_size": profile['rows'],
+                        "memory_usage": dataset_memory_usage(file_instance)
+                    }, status=status.HTTP_200_OK)
+                # Profile not ready yet: sample the dataset without building anything in the request
+                chunks = iter_dataset_chunks(file_instance, settings.PROFILE_CHUNK_ROWS, build_cache=False)
+            elif not dataset_obj:
+                return Response({"error": "No file uploaded."}, status=status.HTTP_400_BAD_REQUEST)
+            elif dataset_obj.name.endswith(('.csv', '.xls', '.xlsx')):
+                chunks = iter_input_chunks(dataset_obj, settings.PROFILE_CHUNK_ROWS)
             else:
                 return Response(
                     {"error": "Unsupported file format. Only CSV and Excel files are supported"},
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            # Prepare response data in the format expected by frontend
-            if rows_count>df.shape[0]:
-                rows_count = df.shape[0]
-                
-            preview_data = df.head(rows_count).fillna('').to_dict(orient='records')
-            columns = list(df.columns)
-            try:
-                stats = df.describe()
-            except Exception as e:
-                stats = {"error": f"Could not generate stats: {str(e)}"}
-
-            try:
-                correlation = df.corr(numeric_only=True).fillna('').to_dict()
-            except Exception as e:
-                correlation = {"error": f"Could not generate correlation: {str(e)}"}
-            
-            # Simple type detection
-            column_types = {}
-            for col in columns:
-                unique_values = df[col].dropna().unique()
-                
-                if pd.api.types.is_numeric_dtype(df[col]):
-                    # Treat binary numeric columns (like 0 and 1) as categorical
-                    if len(unique_values) == 2 and set(unique_values).issubset({0, 1}):
-                        column_types[col] = 'categorical'
-                    else:
-                        column_types[col] = 'numeric'
-                else:
-                    column_types[col] = 'categorical'
+            # One streaming pass: keep the first rows for the table and a bounded
+            # random sample for the stats, never the whole file
+            head = []
+            def tap(chunks):
+                remaining = rows_count
+                for chunk in chunks:
+                    if remaining > 0:
+                        head.append(chunk.head(remaining))
+                        remaining -= len(head[-1])
+                    yield chunk
+
+            sample, total_rows = reservoir_sample(tap(chunks), settings.PREVIEW_SAMPLE_ROWS)
+            preview = pd.concat(head) if head else sample.iloc[:0]
+            summary = summarize_frame(sample)
 
             return Response({
-                "data": preview_data,
-                "columns": columns,
-                "column_types": column_types,
-                "stats":stats,
-                "correlation":correlation
+                "data": preview.astype(object).fillna('').to_dict(orient='records'),
+                "columns": list(sample.columns),
+                "column_types": summary['column_types'],
+                "stats": summary['stats'],
+                "correlation": summary['correlation'],
+                "rows": total_rows,
+                "sampled": total_rows > len(sample),
+                "sample_size": len(sample)
             }, status=status.HTTP_200_OK)
 
         except Exception as e:
@@ -119,18 +323,35 @@ class DatasetPreviewAPI(APIView):
             
 
 class ColumnsView(APIView):
+    permission_classes = [IsAuthenticated]
 
     def post(self,request):
+        # Only the header and a few rows are read, whatever the size of the dataset
         try:
-            # uploaded_file = UploadedDataset.objects.get(pk=pk)
-            # extension = os.path.splitext(uploaded_file.file_name)[1].lower()
-            # file_path = uploaded_file.file_path.path
-            dataset = request.FILES('dataset')
-            df = read_file(dataset)
-
-            columns = df.columns.tolist()  # Convert Index object to a list
+            dataset_id = request.data.get('dataset_id')
+            if dataset_id:
+                uploaded_file = UploadedDataset.objects.get(pk=dataset_id, user=request.user)
+                profile = read_profile(uploaded_file.dataset_hash) if uploaded_file.dataset_hash else None
+                if profile is not None:
+                    return Response({
+                        'columns': profile['columns'],
+                        'dtypes': profile['dtypes'],
+                        'column_types': profile['column_types'],
+                        'sampled': False
+                    }, status=status.HTTP_200_OK)
+                sample = load_dataset(uploaded_file, nrows=settings.COLUMNS_SAMPLE_ROWS)
+            else:
+                dataset = request.FILES.get('dataset')
+                if not dataset:
+                    return Response({"error": "No file uploaded."}, status=status.HTTP_400_BAD_REQUEST)
+                sample = read_file_sample(dataset, settings.COLUMNS_SAMPLE_ROWS)
 
-            return Response({'columns':columns}, status=status.HTTP_200_OK)
+            return Response({
+                'columns': sample.columns.tolist(),
+                'dtypes': {col: str(dtype) for col, dtype in sample.dtypes.items()},
+                'column_types': {col: column_type(sample[col].dtype, sample[col].dropna().unique()) for col in sample.columns},
+                'sampled': True
+            }, status=status.HTTP_200_OK)
 
         except UploadedDataset.DoesNotExist:
             return Response({"error": "File not found."}, status=status.HTTP_404_NOT_FOUND)
@@ -142,163 +363,319 @@ class ColumnsView(APIView):
             return Response({"error": f"Failed to process the file: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
         
 
-class ModelTrainigView(APIView):
+def parse_training_request(request, required_fields, serializer_overrides=None):
+    """
+    Steps shared by the training endpoints: read the upload and JSON config,
+    store the dataset once per hash and validate the config against it.
+
+    Returns ``(error_response, None)`` or ``(None, (file_instance, created, config))``.
+    """
+    # 1. Validate file exists, or that the dataset_id from the hash check does
+    dataset_id = request.data.get('dataset_id')
+    if 'dataset' not in request.FILES and not dataset_id:
+        return Response({"error": "No file uploaded"}, status=400), None
+
+    dataset = request.FILES.get('dataset')
+    name = request.data.get('name')
+
+    # 2. Validate config exists and is valid JSON
+    if 'config' not in request.data:
+        return Response({"error": "No config provided"}, status=400), None
+
+    try:
+        config = json.loads(request.data.get('config'))
+    except json.JSONDecodeError as e:
+        return Response({"error": f"Invalid JSON config: {str(e)}"}, status=400), None
+
+    # 3. Validate required config fields
+    missing_fields = [field for field in required_fields if field not in config]
+    if missing_fields:
+        return Response({
+            "error": "Missing required fields in config",
+            "missing_fields": missing_fields
+        }, status=400), None
+
+    # 4. Store the upload under its content hash, reusing an existing copy
+    if dataset is None:
+        try:
+            file_instance, created = UploadedDataset.objects.get(pk=dataset_id, user=request.user), False
+        except (UploadedDataset.DoesNotExist, ValueError):
+            return Response({"error": "Dataset not found"}, status=404), None
+    else:
+        try:
+            file_instance, created = store_dataset_upload(dataset, request.user, name)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400), None
+
+    # 5. Prepare data for config serializer
+    serializer_data = {
+        'dataset': file_instance.id,
+        'user': request.user.id,
+        **config,
+        **(serializer_overrides or {})
+    }
+
+    serializer = ModelConfigSerializer(data=serializer_data)
+    if not serializer.is_valid():
+        return Response({
+            "error": "Validation error",
+            "details": serializer.errors
+        }, status=400), None
+
+    # 6. Validate features and target against the header (or the cache schema, if built)
+    try:
+        columns = dataset_columns(file_instance)
+        if created:
+            queue_dataset_profile(file_instance)
+    except pd.errors.EmptyDataError:
+        return Response({"error": "Uploaded file is empty"}, status=400), None
+
+    missing_features = [f for f in config['features'] if f not in columns]
+    if missing_features:
+        return Response({
+            "error": "Some features not found in dataset",
+            "missing_features": missing_features
+        }, status=400), None
+
+    if config['target_column'] not in columns:
+        return Response({
+            "error": f"Target column '{config['target_column']}' not found in dataset"
+        }, status=400), None
+
+    return None, (file_instance, created, config)
+
+
+class ModelTrainigView(HashingUploadMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
         try:
-            # 1. Validate file exists
-            if 'dataset' not in request.FILES:
-                return Response({"error": "No file uploaded"}, status=400)
-
-            dataset = request.FILES['dataset']
+            error, parsed = parse_training_request(request, ['features', 'target_column', 'model_type'])
+            if error is not None:
+                return error
+            file_instance, created, config = parsed
+            dataset_hash = file_instance.dataset_hash
             name = request.data.get('name')
 
-            # 2. Validate config exists and is valid JSON
-            if 'config' not in request.data:
-                return Response({"error": "No config provided"}, status=400)
-
             try:
-                config = json.loads(request.data.get('config'))
-            except json.JSONDecodeError as e:
-                return Response({"error": f"Invalid JSON config: {str(e)}"}, status=400)
-
-            # 3. Validate required config fields
-            required_fields = ['features', 'target_column', 'model_type']
-            missing_fields = [field for field in required_fields if field not in config]
-            if missing_fields:
+                cv_folds = int(config.get('cv_folds') or 0)
+                n_jobs = int(config.get('n_jobs', 1))
+            except (TypeError, ValueError):
+                return Response({"error": "cv_folds and n_jobs must be integers"}, status=400)
+            if cv_folds and not 2 <= cv_folds <= settings.CV_MAX_FOLDS:
+                return Response({"error": f"cv_folds must be between 2 and {settings.CV_MAX_FOLDS}"}, status=400)
+            if n_jobs < 1:
+                return Response({"error": "n_jobs must be at least 1"}, status=400)
+
+            # Streaming (out-of-core) training needs an estimator with partial_fit
+            if config.get('streaming'):
+                if not supports_partial_fit(config['model_type']):
+                    return Response({
+                        "error": f"{config['model_type']} can't be trained in streaming mode",
+                        "streaming_models": [name for name in model_map if supports_partial_fit(name)]
+                    }, status=400)
+                if cv_folds:
+                    return Response({"error": "Cross-validation isn't available in streaming mode"}, status=400)
+                try:
+                    epochs = int(config.get('epochs', 1))
+                except (TypeError, ValueError):
+                    return Response({"error": "epochs must be an integer"}, status=400)
+                if not 1 <= epochs <= settings.STREAMING_MAX_EPOCHS:
+                    return Response({"error": f"epochs must be between 1 and {settings.STREAMING_MAX_EPOCHS}"}, status=400)
+
+            # 7. Reuse the result of an identical earlier run when there is one
+            try:
+                trained = training_result_cache.get(training_cache_key(dataset_hash, config))
+            except (KeyError, TypeError, ValueError):
+                trained = None  # incomplete config; the job reports the error
+
+            if trained is not None:
+                job = TrainingJob(
+                    user=request.user,
+                    dataset=file_instance,
+                    name=name or '',
+                    config=config,
+                    status=TrainingJob.STATUS_SUCCEEDED,
+                    progress=100,
+                    stage='Loaded from training cache'
+                )
+                job.result = build_training_result(job, config, trained)
+                job.save()
+
+                return Response({
+                    'job_id': str(job.pk),
+                    'status': job.status,
+                    'dataset': file_instance.id,
+                    "file_status": "new" if created else "existing",
+                    'cached': True,
+                    'result': job.result
+                }, status=status.HTTP_200_OK)
+
+            # 8. Queue the training job; the worker pool runs preprocess_and_train
+            job = TrainingJob.objects.create(
+                user=request.user,
+                dataset=file_instance,
+                name=name or '',
+                config=config
+            )
+            submit_job(job, run_training_job)
+
+            return Response({
+                'job_id': str(job.pk),
+                'status': job.status,
+                'dataset': file_instance.id,
+                "file_status": "new" if created else "existing",
+            }, status=status.HTTP_202_ACCEPTED)
+
+        except Exception as e:
+            return Response({"error": f"Server error: {str(e)}"}, status=500)
+
+
+class ModelComparisonView(HashingUploadMixin, APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        try:
+            # model_type/parameters live in config['models']; the placeholders only satisfy the serializer
+            error, parsed = parse_training_request(
+                request, ['features', 'target_column', 'models'],
+                serializer_overrides={'model_type': 'comparison', 'parameters': {}}
+            )
+            if error is not None:
+                return error
+            file_instance, created, config = parsed
+
+            models = config['models']
+            if not isinstance(models, list) or not models:
+                return Response({"error": "'models' must be a non-empty list"}, status=400)
+            if len(models) > settings.MODEL_COMPARISON_MAX_MODELS:
                 return Response({
-                    "error": "Missing required fields in config",
-                    "missing_fields": missing_fields
+                    "error": f"At most {settings.MODEL_COMPARISON_MAX_MODELS} models can be compared at once"
                 }, status=400)
 
-            # 4. Compute hash and check if file already exists
-            dataset_hash = calculate_dataset_hash(dataset=dataset)
+            for entry in models:
+                if not isinstance(entry, dict) or entry.get('model_type') not in model_map:
+                    return Response({
+                        "error": "Each model needs a supported 'model_type'",
+                        "supported_models": list(model_map)
+                    }, status=400)
+                if not isinstance(entry.get('parameters', {}), dict):
+                    return Response({"error": f"Parameters for {entry['model_type']} must be an object"}, status=400)
 
-            file_instance, created = UploadedDataset.objects.get_or_create(
-                dataset_hash=dataset_hash,
-                defaults={
-                    'dataset': dataset,
-                    'name': name,
-                    'user': request.user
-                }
+            job = TrainingJob.objects.create(
+                user=request.user,
+                dataset=file_instance,
+                name=request.data.get('name') or '',
+                config=config
             )
+            submit_job(job, run_comparison_job)
 
-            # 5. Prepare data for config serializer
-            serializer_data = {
+            return Response({
+                'job_id': str(job.pk),
+                'status': job.status,
                 'dataset': file_instance.id,
-                'user': request.user.id,
-                **config
-            }
+                "file_status": "new" if created else "existing",
+            }, status=status.HTTP_202_ACCEPTED)
 
-            serializer = ModelConfigSerializer(data=serializer_data)
-            if not serializer.is_valid():
-                return Response({
-                    "error": "Validation error",
-                    "details": serializer.errors
-                }, status=400)
+        except Exception as e:
+            return Response({"error": f"Server error: {str(e)}"}, status=500)
 
-            # 6. Read the dataset from stored file (always use DB version)
-            try:
-                df = pd.read_csv(file_instance.dataset)
 
-                if df.empty:
-                    return Response({"error": "Uploaded file is empty"}, status=400)
+class HyperparameterSearchView(HashingUploadMixin, APIView):
+    permission_classes = [IsAuthenticated]
 
-                # Validate features and target
-                missing_features = [f for f in config['features'] if f not in df.columns]
-                if missing_features:
-                    return Response({
-                        "error": "Some features not found in dataset",
-                        "missing_features": missing_features
-                    }, status=400)
+    def post(self, request):
+        try:
+            # The search spec replaces 'parameters'; the best candidate's parameters end up in the result
+            error, parsed = parse_training_request(
+                request, ['features', 'target_column', 'model_type'],
+                serializer_overrides={'parameters': {}}
+            )
+            if error is not None:
+                return error
+            file_instance, created, config = parsed
 
-                if config['target_column'] not in df.columns:
-                    return Response({
-                        "error": f"Target column '{config['target_column']}' not found in dataset"
-                    }, status=400)
-                
-                print(f"Target Column: {df[config['target_column']].unique()}")
-
-
-                # 7. Train the model
-                feature_types, categorical_values, training_time, model, feature_encoder, scaler, target_encoder, accuracy = preprocess_and_train(df,config={
-                    'features': config['features'],
-                    'target': config['target_column'],
-                    'encoder': config['encoder'],
-                    'scaler': config['scaler'],
-                    'test_size': float(config['test_size']),
-                    'random_state': int(config['random_state']),
-                    'model_type': config['model_type'],
-                    'stratify': config.get('stratify', False),
-                    'problem_type': config.get('problem_type'),
-                    "parameters": clean_parameters(config.get("parameters", {}))
-                })
-
-                config['feature_types'] = feature_types
-                config['categorical_values'] = categorical_values
-                config['training_time'] = training_time
-
-                # Debug log (optional)
-                # print("Training model with config:", config)
-                print('Training Time View: ',training_time)
-                print("Accuracy:", accuracy)
-
-                # 8. Cache trained components
-                model_cache_key = f'trained_model_{uuid.uuid4()}'
-                encoder_cache_key = f'trained_encoder_{uuid.uuid4()}'
-                scaler_cache_key = f'trained_scaler_{uuid.uuid4()}'
-                target_encoder_cache_key = f'target_encoder_{uuid.uuid4()}'
-
-                cache.set(model_cache_key, model, timeout=3600)
-                cache.set(encoder_cache_key, feature_encoder, timeout=3600)
-                cache.set(scaler_cache_key, scaler, timeout=3600)
-                cache.set(target_encoder_cache_key, target_encoder, timeout=3600)
-
-                # 9. Save config to DB
-                serializer.validated_data['accuracy'] = accuracy
-
-                # 10. Return response
+            if config['model_type'] not in model_map:
                 return Response({
-                'name':name,
+                    "error": f"Unsupported model type: {config['model_type']}",
+                    "supported_models": list(model_map)
+                }, status=400)
+
+            try:
+                search_candidates(config, settings.SEARCH_MAX_CANDIDATES)
+                time_budget = float(config.get('time_budget', settings.SEARCH_MAX_TIME_BUDGET))
+                factor = int(config.get('factor', 3))
+                n_jobs = int(config.get('n_jobs', 1))
+            except (TypeError, ValueError) as e:
+                return Response({"error": f"Invalid search config: {str(e)}"}, status=400)
+
+            if not 0 < time_budget <= settings.SEARCH_MAX_TIME_BUDGET:
+                return Response({"error": f"time_budget must be between 0 and {settings.SEARCH_MAX_TIME_BUDGET} seconds"}, status=400)
+            if factor < 2:
+                return Response({"error": "factor must be at least 2"}, status=400)
+            if n_jobs < 1:
+                return Response({"error": "n_jobs must be at least 1"}, status=400)
+
+            job = TrainingJob.objects.create(
+                user=request.user,
+                dataset=file_instance,
+                name=request.data.get('name') or '',
+                config=config
+            )
+            submit_job(job, run_search_job)
+
+            return Response({
+                'job_id': str(job.pk),
+                'status': job.status,
                 'dataset': file_instance.id,
-                'config': {
-                    'model_type': config['model_type'],
-                    'features': config['features'],
-                    'feature_types': config['feature_types'],
-                    'categorical_values': config['categorical_values'],
-                    'training_time':config['training_time'],
-                    'target_column': config['target_column'],
-                    'encoder': config['encoder'],
-                    'scaler': config['scaler'],
-                    'test_size': config['test_size'],
-                    'random_state': config['random_state'],
-                    'stratify': config.get('stratify', False),
-                    'parameters': config.get('parameters', {}),
-                    'problem_type': config.get('problem_type', ''),
-                    'accuracy': accuracy
-                },
                 "file_status": "new" if created else "existing",
-                'accuracy': accuracy,
-                'model_cache_key': model_cache_key,
-                'encoder_cache_key': encoder_cache_key,
-                'scaler_cache_key': scaler_cache_key,
-                'target_encoder_cache_key': target_encoder_cache_key
-                })
-
-            except Exception as e:
-                return Response({"error": f"Model training failed: {str(e)}"}, status=400)
+            }, status=status.HTTP_202_ACCEPTED)
 
         except Exception as e:
             return Response({"error": f"Server error: {str(e)}"}, status=500)
-        
+
+
+class TrainingJobStatusView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id):
+        try:
+            job = TrainingJob.objects.get(pk=job_id, user=request.user)
+        except TrainingJob.DoesNotExist:
+            return Response({"error": "Training job not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        job = expire_stale_job(job)
+        serializer = TrainingJobSerializer(job)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class TrainingJobResultView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id):
+        try:
+            job = TrainingJob.objects.get(pk=job_id, user=request.user)
+        except TrainingJob.DoesNotExist:
+            return Response({"error": "Training job not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        job = expire_stale_job(job)
+        if job.status == TrainingJob.STATUS_FAILED:
+            return Response({"error": job.error}, status=status.HTTP_400_BAD_REQUEST)
+
+        if job.status != TrainingJob.STATUS_SUCCEEDED:
+            serializer = TrainingJobSerializer(job)
+            return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+        return Response(job.result, status=status.HTTP_200_OK)
+
+
 class SaveModelView(APIView):
 
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
         # Validate required fields
-        required_fields = ['name','dataset', 'config','accuracy', 'model_cache_key','encoder_cache_key','scaler_cache_key', 'target_encoder_cache_key']
+        required_fields = ['name','dataset', 'config','accuracy', 'pipeline_cache_key']
         for field in required_fields:
             if field not in request.data:
                 return Response(
@@ -306,11 +683,7 @@ class SaveModelView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-        # Get cache keys with fallbacks
-        model_cache_key = request.data.get('model_cache_key')
-        encoder_cache_key = request.data.get('encoder_cache_key')
-        scaler_cache_key = request.data.get('scaler_cache_key')
-        target_encoder_cache_key = request.data.get('target_encoder_cache_key')
+        pipeline_cache_key = request.data.get('pipeline_cache_key')
 
         config = request.data.get('config')
         dataset = request.data.get('dataset')
@@ -324,30 +697,27 @@ class SaveModelView(APIView):
         except Exception as e:
             return Response({'error': f'Invalid config format: {str(e)}'}, status=400)
 
-        # Retrieve objects from cache
+        # Retrieve the trained pipeline from cache
         try:
-            model = cache.get(model_cache_key)
-            if not model:
+            pipeline = cache.get(pipeline_cache_key)
+            if not pipeline:
                 return Response(
                     {'error': 'Model not found in cache. Please train the model first.'},
                     status=status.HTTP_404_NOT_FOUND
                 )
 
-            encoder = cache.get(encoder_cache_key)
-            scaler = cache.get(scaler_cache_key)
-            target_encoder = cache.get(target_encoder_cache_key)
-
         except Exception as e:
             return Response(
                 {'error': f'Error retrieving from cache: {str(e)}'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+        # Preprocessing and estimator are saved together, as one file
         try:
             model_file_name = f'{name}_{uuid.uuid4().hex[:8]}.joblib'
             model_file_path = os.path.join(settings.MEDIA_ROOT, 'saved_models', model_file_name)
             os.makedirs(os.path.dirname(model_file_path), exist_ok=True)
-            joblib.dump(model, model_file_path)
+            joblib.dump(pipeline, model_file_path)
             with open(model_file_path, 'rb') as f:
                 model_file_content = ContentFile(f.read(), name=model_file_name)
         except Exception as e:
@@ -356,54 +726,6 @@ class SaveModelView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-        # Save encoder file if exists
-        encoder_file_content = None
-        if encoder:
-            try:
-                encoder_file_name = f'{name}_encoder_{uuid.uuid4().hex[:8]}.joblib'
-                encoder_file_path = os.path.join(settings.MEDIA_ROOT, 'saved_encoders', encoder_file_name)
-                os.makedirs(os.path.dirname(encoder_file_path), exist_ok=True)
-                joblib.dump(encoder, encoder_file_path)
-                with open(encoder_file_path, 'rb') as f:
-                    encoder_file_content = ContentFile(f.read(), name=encoder_file_name)
-            except Exception as e:
-                return Response(
-                    {'error': f'Error saving encoder: {str(e)}'},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
-
-        # Save scaler file if exists
-        scaler_file_content = None
-        if scaler:
-            try:
-                scaler_file_name = f'{name}_scaler_{uuid.uuid4().hex[:8]}.joblib'
-                scaler_file_path = os.path.join(settings.MEDIA_ROOT, 'saved_scalers', scaler_file_name)
-                os.makedirs(os.path.dirname(scaler_file_path), exist_ok=True)
-                joblib.dump(scaler, scaler_file_path)
-                with open(scaler_file_path, 'rb') as f:
-                    scaler_file_content = ContentFile(f.read(), name=scaler_file_name)
-            except Exception as e:
-                return Response(
-                    {'error': f'Error saving scaler: {str(e)}'},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
-            
-        # Save target encoder file if exists
-        target_encoder_content = None
-        if target_encoder:
-            try:
-                target_encoder_name = f'{name}_target_encoder_{uuid.uuid4().hex[:8]}.joblib'
-                target_encoder_path = os.path.join(settings.MEDIA_ROOT, 'saved_target_encoders', target_encoder_name)
-                os.makedirs(os.path.dirname(target_encoder_path), exist_ok=True)
-                joblib.dump(target_encoder, target_encoder_path)
-                with open(target_encoder_path, 'rb') as f:
-                    target_encoder_content= ContentFile(f.read(), name=target_encoder_name)
-            except Exception as e:
-                return Response(
-                    {'error': f'Error saving scaler: {str(e)}'},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
-            
         accuracy_val = 0.0  # Initialize with default
         print('Accuracy:',accuracy)
         if config.get('problem_type') == 'regression':
@@ -443,6 +765,7 @@ class SaveModelView(APIView):
                 test_size=float(config.get('test_size')),
                 random_state=config.get('random_state'),
                 stratify=config.get('stratify'),
+                outlier_method=config.get('outlier_method', 'iqr'),
                 accuracy = accuracy_val,
                 parameters=config.get("parameters", {}),
                 problem_type=config.get("problem_type", "")
@@ -458,10 +781,7 @@ class SaveModelView(APIView):
             "algorithm": config_obj.model_type,
             "accuracy": config_obj.accuracy,
             "config": config_obj.id,
-            "model_file": model_file_content,
-            "encoder_file": encoder_file_content,
-            "scaler_file": scaler_file_content,
-            "target_encoder":target_encoder_content
+            "model_file": model_file_content
         }
 
         # Validate and save
@@ -518,7 +838,8 @@ class SavedModelDetailView(APIView):
             if model.target_encoder:
                 model.target_encoder.delete()
 
-            # Delete the model record
+            # Delete the model record and drop its loaded bundle
+            model_bundle_cache.invalidate(pk)
             model.delete()
 
             if config:
@@ -602,21 +923,11 @@ class PredictionView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # 5. Load model and preprocessing objects
-            model = joblib.load(saved_model.model_file.path)
-            encoder = joblib.load(saved_model.encoder_file.path) if saved_model.encoder_file else None
-            scaler = joblib.load(saved_model.scaler_file.path) if saved_model.scaler_file else None
-            target_encoder = joblib.load(saved_model.target_encoder.path) if saved_model.target_encoder else None
+            # 5. Load model and preprocessing objects (served from the per-process LRU cache)
+            bundle = model_bundle_cache.get(saved_model)
             
             # 6. Make prediction
-            prediction = load_model_and_predict(
-                model_path=saved_model.model_file.path,
-                features=features,
-                columns=expected_columns,  # Always use the expected columns from config
-                encoder=encoder,
-                scaler=scaler,
-                target_encoder=target_encoder
-            )
+            prediction = load_model_and_predict(bundle.plan, features)
             
             return Response({
                 'prediction': prediction,
@@ -635,6 +946,104 @@ class PredictionView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
         
+class BatchPredictionView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, pk):
+        try:
+            saved_model = SavedModel.objects.select_related('config').get(pk=pk, user=request.user)
+        except SavedModel.DoesNotExist:
+            return Response(
+                {"error": "Model not found or access denied"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        dataset = request.FILES.get('dataset')
+        if not dataset:
+            return Response({"error": "No file uploaded."}, status=status.HTTP_400_BAD_REQUEST)
+
+        output = request.query_params.get('output', 'csv').lower()
+        if output not in ('csv', 'ndjson'):
+            return Response({"error": "output must be 'csv' or 'ndjson'"}, status=status.HTTP_400_BAD_REQUEST)
+        include_inputs = request.query_params.get('include_inputs', 'false').lower() in ('1', 'true', 'yes')
+
+        expected_columns = saved_model.config.features
+
+        try:
+            bundle = model_bundle_cache.get(saved_model)
+            # Categorical columns must stay strings so they match the fitted encoder
+            dtype = {col: str for col in bundle.pipeline.categorical_columns()} or None
+            chunks = iter_input_chunks(dataset, settings.BATCH_PREDICTION_CHUNK_SIZE, dtype=dtype)
+            first_chunk = next(chunks, None)
+        except Exception as e:
+            return Response({"error": f"Error processing file: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if first_chunk is None or first_chunk.empty:
+            return Response({"error": "Uploaded file is empty"}, status=status.HTTP_400_BAD_REQUEST)
+
+        missing_features = [col for col in expected_columns if col not in first_chunk.columns]
+        if missing_features:
+            return Response(
+                {"error": f"Missing required features: {', '.join(missing_features)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # The first chunk is scored before any byte is sent, so bad input still gets a proper 400
+        try:
+            first_prediction = bundle.plan.predict(first_chunk)
+        except Exception as e:
+            return Response({"error": f"Prediction failed: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        def format_chunk(chunk, prediction, row_offset, header):
+            result = chunk if include_inputs else pd.DataFrame(index=chunk.index)
+            result = result.assign(prediction=prediction)
+            result.insert(0, 'row', range(row_offset, row_offset + len(chunk)))
+            if output == 'csv':
+                return result.to_csv(index=False, header=header)
+            return result.to_json(orient='records', lines=True)
+
+        def stream():
+            """
+            A later chunk that fails to parse or score ends the response early,
+            after the rows already sent: NDJSON output ends with an
+            ``{"error": ..., "row": ...}`` record, CSV output is truncated.
+            """
+            yield format_chunk(first_chunk, first_prediction, 0, header=True)
+            row_offset = len(first_chunk)
+            try:
+                for chunk in chunks:
+                    yield format_chunk(chunk, bundle.plan.predict(chunk), row_offset, header=False)
+                    row_offset += len(chunk)
+            except Exception as e:
+                logger.error(f"Batch prediction failed at row {row_offset}: {str(e)}", exc_info=True)
+                if output == 'ndjson':
+                    yield json.dumps({'error': f"Prediction failed: {str(e)}", 'row': row_offset}) + '\n'
+
+        content_type = 'text/csv' if output == 'csv' else 'application/x-ndjson'
+        response = StreamingHttpResponse(stream(), content_type=content_type)
+        if output == 'csv':
+            filename = f"{slugify(saved_model.name)}_{pk}_predictions.csv"
+            response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class ModelCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(model_bundle_cache.stats(), status=status.HTTP_200_OK)
+
+
+class TrainingCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            'training_results': training_result_cache.stats(),
+            'preprocessed_splits': preprocessed_split_cache.stats()
+        }, status=status.HTTP_200_OK)
+
+
 class UserTrainedModelsView(APIView):
 
     permission_classes = [IsAuthenticated]
@@ -662,18 +1071,12 @@ class ModelDownloadView(APIView):
             from django.utils.text import slugify
             filename = f"{slugify(saved_model.name)}_{pk}.zip" 
             
-            # Create in-memory zip
+            # Create in-memory zip: the estimator and transformers as plain scikit-learn
+            # objects, usable without this codebase, plus the app's own pipeline artifact
             zip_buffer = io.BytesIO()
             with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                # Add model file
-                if saved_model.model_file and os.path.exists(saved_model.model_file.path):
-                    zip_file.write(saved_model.model_file.path, 'model.joblib')
-                if saved_model.encoder_file and os.path.exists(saved_model.encoder_file.path):
-                    zip_file.write(saved_model.encoder_file.path, 'encoder.joblib')
-                if saved_model.scaler_file and os.path.exists(saved_model.scaler_file.path):
-                    zip_file.write(saved_model.scaler_file.path, 'scaler.joblib')
-                if saved_model.target_encoder and os.path.exists(saved_model.target_encoder.path):
-                    zip_file.write(saved_model.target_encoder.path, 'target_encoder.joblib')
+                for name, content in export_pipeline_files(load_pipeline(saved_model)).items():
+                    zip_file.writestr(name, content)
             
             zip_buffer.seek(0)
             response = HttpResponse(zip_buffer, content_type='application/zip')
@@ -770,24 +1173,3 @@ def get_user_config(request, pk):
 
     return Response(serializer.data, status=status.HTTP_200_OK)
 
-
-
-
-#===============Calculate Hash=====================
-def calculate_dataset_hash(dataset):
-    hasher = hashlib.sha256()
-    for chunk in dataset.chunks():
-        hasher.update(chunk)
-    return hasher.hexdigest()
-
-
-def clean_parameters(params):
-    cleaned = {}
-    for k, v in params.items():
-        if v in [None, ""]:
-            continue
-        try:
-            cleaned[k] = int(v) if str(v).isdigit() else float(v)
-        except ValueError:
-            cleaned[k] = v 
-    return cleaned
\ No newline at end of file
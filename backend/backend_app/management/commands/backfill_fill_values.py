@@ -0,0 +1,53 @@
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend_app.models import SavedModel
+from backend_app.files.model_cache import load_pipeline, training_fill_values, upgrade_legacy_model
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Add training fill values to saved models that were stored without them, recomputed from "
+        "their training dataset, and re-save each as a single pipeline artifact. The old files are "
+        "removed only after the model points at the new one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('model_ids', nargs='*', type=int, help="Only these saved models (default: all)")
+        parser.add_argument('--dry-run', action='store_true', help="List the models that need a backfill and stop")
+
+    def handle(self, *args, **options):
+        saved_models = SavedModel.objects.select_related('config', 'dataset').order_by('pk')
+        if options['model_ids']:
+            saved_models = saved_models.filter(pk__in=options['model_ids'])
+
+        upgraded = skipped = 0
+        failed = []
+        for saved_model in saved_models.iterator():
+            try:
+                pipeline = load_pipeline(saved_model)
+                if pipeline.fill_values is not None:
+                    skipped += 1
+                    continue
+                if options['dry_run']:
+                    self.stdout.write(f"Model {saved_model.pk} ({saved_model.name}) needs a backfill")
+                    continue
+
+                pipeline.fill_values = training_fill_values(saved_model)
+                if upgrade_legacy_model(saved_model, pipeline):
+                    upgraded += 1
+                    self.stdout.write(f"Model {saved_model.pk} ({saved_model.name}) upgraded")
+                else:
+                    skipped += 1
+            except Exception:
+                # The model keeps its old files and keeps working with input-based imputation
+                logger.exception("Couldn't backfill fill values of saved model %s", saved_model.pk)
+                failed.append(saved_model.pk)
+
+        self.stdout.write(f"{upgraded} upgraded, {skipped} already current, {len(failed)} failed")
+        if failed:
+            raise CommandError(f"Backfill failed for saved models: {', '.join(map(str, failed))}")
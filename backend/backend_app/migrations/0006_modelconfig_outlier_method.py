@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend_app', '0005_trainingjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='modelconfig',
+            name='outlier_method',
+            field=models.CharField(choices=[('iqr', 'IQR'), ('zscore', 'Z-score'), ('none', 'None')], default='iqr', max_length=20),
+        ),
+    ]
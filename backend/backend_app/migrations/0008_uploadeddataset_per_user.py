@@ -0,0 +1,24 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:34
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend_app', '0007_uploadsession'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploadeddataset',
+            name='dataset_hash',
+            field=models.CharField(db_index=True, max_length=64),
+        ),
+        migrations.AlterUniqueTogether(
+            name='uploadeddataset',
+            unique_together={('user', 'dataset_hash')},
+        ),
+    ]
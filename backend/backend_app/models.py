@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from django.db.models import JSONField
 
@@ -28,9 +30,13 @@ class UploadedDataset(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     name = models.CharField(max_length=250)
     dataset = models.FileField(upload_to='uploads/')
-    dataset_hash = models.CharField(max_length=64, unique=True)
+    dataset_hash = models.CharField(max_length=64, db_index=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # Users uploading the same content share the stored file, each through their own row
+        unique_together = ('user', 'dataset_hash')
+
     def __str__(self):
         return self.name+" | "+self.user.username
 
@@ -48,6 +54,11 @@ class ModelConfig(models.Model):
     test_size = models.FloatField(default=0.2)
     random_state = models.IntegerField(default=4)
     stratify = models.BooleanField(default=False)
+    outlier_method = models.CharField(
+        max_length=20,
+        choices=[('iqr', 'IQR'), ('zscore', 'Z-score'), ('none', 'None')],
+        default='iqr'
+    )
     model_type = models.CharField(max_length=250)
     parameters = JSONField()
     accuracy = JSONField()  
@@ -83,6 +94,69 @@ class SavedModel(models.Model):
         return f"{self.dataset.name} | {self.user.username} | {self.algorithm}"
 
 
+class TrainingJob(models.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    dataset = models.ForeignKey(UploadedDataset, on_delete=models.CASCADE)
+    name = models.CharField(max_length=250, blank=True, default='')
+    config = JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    progress = models.PositiveSmallIntegerField(default=0)
+    stage = models.CharField(max_length=100, blank=True, default='')
+    result = JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_SUCCEEDED, self.STATUS_FAILED)
+
+    def __str__(self):
+        return f"{self.dataset.name} | {self.user.username} | {self.status}"
+
+
+class UploadSession(models.Model):
+    STATUS_ACTIVE = 'active'
+    STATUS_COMPLETE = 'complete'
+    STATUS_CHOICES = [
+        (STATUS_ACTIVE, 'Active'),
+        (STATUS_COMPLETE, 'Complete'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    name = models.CharField(max_length=250, blank=True, default='')
+    filename = models.CharField(max_length=250)
+    size = models.BigIntegerField()
+    received = models.BigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True, default='')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_ACTIVE)
+    dataset = models.ForeignKey(UploadedDataset, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.filename} | {self.user.username} | {self.received}/{self.size}"
+
+
 class Badges(models.Model):
     name = models.CharField(max_length=250)
     description = models.CharField(max_length=250)
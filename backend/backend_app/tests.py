@@ -1,3 +1,1204 @@
-from django.test import TestCase
+import contextlib
+import hashlib
+import io
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import joblib
+import numpy as np
+import pandas as pd
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+from sklearn import preprocessing
+
+from backend_app.models import ModelConfig, SavedModel, TrainingJob, UploadedDataset, UploadSession
+from backend_app.files.jobs import (
+    build_training_config, holdout_config, load_prepared_split, preprocessed_split_cache, split_cache_key,
+    successive_halving, training_cache_key, training_result_cache
+)
+from backend_app.files.dataset_cache import (
+    SCHEMA_FILE, _load_column, compact_dtypes, dataset_memory_usage, iter_dataset_chunks, load_dataset,
+    write_column_store, write_csv_column_store
+)
+from backend_app.files.incremental import train_incremental
+from backend_app.files.model_cache import model_bundle_cache
+from backend_app.files.profiling import reservoir_sample
+from backend_app.files.streaming_stats import DatasetStats, DistinctCounter, QuantileSketch
+from backend_app.files.utils import (
+    CategoryEncoder, InferencePlan, TrainedPipeline, iter_input_chunks, prepare_split, preprocess_and_train, safe_remove_outliers,
+    score_candidate, training_columns, upgrade_label_encoders
+)
+from benchmarks.outlier_removal import legacy_remove_outliers
+
+
+TRAINING_CONFIG = {
+    'features': ['size', 'rooms', 'city'],
+    'target_column': 'label',
+    'encoder': 'LabelEncoder',
+    'scaler': 'StandardScaler',
+    'test_size': 0.25,
+    'random_state': 4,
+    'model_type': 'LogisticRegression',
+    'problem_type': 'classification',
+    'parameters': {},
+}
+
+
+def make_frame(rows=120, seed=0):
+    """A small classification dataset with gaps in a numeric and a text column."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'size': rng.normal(50, 10, rows).round(2),
+        'rooms': rng.integers(1, 6, rows).astype(float),
+        'city': rng.choice(['north', 'south', 'east'], rows),
+    })
+    df['label'] = np.where(df['size'] + 5 * df['rooms'] > 65, 'high', 'low')
+    df.loc[::11, 'size'] = np.nan
+    df.loc[::13, 'city'] = np.nan
+    return df
+
+
+def csv_bytes(df):
+    return df.to_csv(index=False).encode()
+
+
+def train(df, config):
+    # preprocess_and_train reports its progress with print()
+    with contextlib.redirect_stdout(io.StringIO()):
+        return preprocess_and_train(df, build_training_config(config))
+
+
+def create_dataset(user, df, name='houses'):
+    content = csv_bytes(df)
+    return UploadedDataset.objects.create(
+        user=user, name=name, dataset=ContentFile(content, name=f'{name}.csv'),
+        dataset_hash=hashlib.sha256(content).hexdigest()
+    )
+
+
+def create_saved_model(user, dataset, pipeline, config=TRAINING_CONFIG, name='model'):
+    """A ``SavedModel`` for ``pipeline``, stored the way ``SaveModelView`` stores it."""
+    buffer = io.BytesIO()
+    joblib.dump(pipeline, buffer)
+    model_config = ModelConfig.objects.create(
+        user=user, dataset=dataset, target_column=config['target_column'], features=config['features'],
+        encoder=config['encoder'], scaler=config['scaler'], model_type=config['model_type'],
+        problem_type=config['problem_type'], parameters=config['parameters'], accuracy={'accuracy': 0.9}
+    )
+    return SavedModel.objects.create(
+        user=user, dataset=dataset, name=name, algorithm=config['model_type'], accuracy=90,
+        config=model_config, model_file=ContentFile(buffer.getvalue(), name=f'{name}.joblib')
+    )
+
+
+class MediaRootMixin:
+    """
+    Point uploads, dataset caches, the training caches and the Django cache
+    at a temporary directory for the duration of each test.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+        overrides = override_settings(
+            MEDIA_ROOT=self.media_root,
+            DATASET_CACHE_ROOT=os.path.join(self.media_root, 'dataset_cache'),
+            UPLOAD_SESSION_ROOT=os.path.join(self.media_root, 'upload_sessions'),
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        for disk_cache in (training_result_cache, preprocessed_split_cache):
+            patcher = mock.patch.object(disk_cache, 'root', os.path.join(self.media_root, disk_cache.name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        # Dataset profiles are built by the worker pool, which these tests don't start
+        patcher = mock.patch('backend_app.files.views.queue_dataset_profile')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        model_bundle_cache.clear()
+        self.addCleanup(model_bundle_cache.clear)
+
+    def create_user(self, username):
+        user = User.objects.create_user(username=username, password='secret')
+        client = APIClient()
+        client.force_authenticate(user)
+        return user, client
+
+
+def run_inline(job, func):
+    func(str(job.pk))
+
+
+@mock.patch('backend_app.files.views.submit_job', side_effect=run_inline)
+class TrainingJobAPITests(MediaRootMixin, TransactionTestCase):
+    # The jobs call close_old_connections(), which a TestCase transaction doesn't survive
+
+    def setUp(self):
+        super().setUp()
+        self.user, self.client = self.create_user('owner')
+
+    def submit(self, config=TRAINING_CONFIG, client=None):
+        upload = SimpleUploadedFile('houses.csv', csv_bytes(make_frame()), content_type='text/csv')
+        return (client or self.client).post(
+            '/file/train/', {'dataset': upload, 'name': 'houses', 'config': json.dumps(config)}, format='multipart'
+        )
+
+    def test_submit_then_fetch_result(self, submit_job):
+        response = self.submit()
+        self.assertEqual(response.status_code, 202, response.data)
+        self.assertEqual(submit_job.call_count, 1)
+        job_id = response.data['job_id']
+
+        status_response = self.client.get(f'/file/train/{job_id}/')
+        self.assertEqual(status_response.status_code, 200)
+        self.assertEqual(status_response.data['status'], TrainingJob.STATUS_SUCCEEDED)
+        self.assertEqual(status_response.data['progress'], 100)
+
+        result = self.client.get(f'/file/train/{job_id}/result/')
+        self.assertEqual(result.status_code, 200)
+        self.assertIn('accuracy', result.data)
+        self.assertTrue(result.data['pipeline_cache_key'])
+        self.assertEqual(result.data['dataset'], response.data['dataset'])
+
+    def test_identical_run_is_served_from_the_training_cache(self, submit_job):
+        self.assertEqual(self.submit().status_code, 202)
+
+        response = self.submit()
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertTrue(response.data['cached'])
+        self.assertEqual(response.data['file_status'], 'existing')
+        self.assertEqual(submit_job.call_count, 1)
+
+    def test_failed_job_reports_its_error(self, submit_job):
+        response = self.submit({**TRAINING_CONFIG, 'parameters': {'C': 'not a number'}})
+        self.assertEqual(response.status_code, 202, response.data)
+
+        result = self.client.get(f"/file/train/{response.data['job_id']}/result/")
+        self.assertEqual(result.status_code, 400)
+        self.assertTrue(result.data['error'].startswith('Model training failed'))
+
+    def search(self, time_budget):
+        upload = SimpleUploadedFile('houses.csv', csv_bytes(make_frame()), content_type='text/csv')
+        config = {**TRAINING_CONFIG, 'param_grid': {'C': [0.1, 1.0]}, 'time_budget': time_budget}
+        response = self.client.post(
+            '/file/search/', {'dataset': upload, 'name': 'houses', 'config': json.dumps(config)}, format='multipart'
+        )
+        self.assertEqual(response.status_code, 202, response.data)
+        result = self.client.get(f"/file/train/{response.data['job_id']}/result/")
+        self.assertEqual(result.status_code, 200, result.data)
+        return result.data['search']
+
+    def test_search_refit_within_budget(self, submit_job):
+        search = self.search(time_budget=600)
+        self.assertFalse(search['timed_out'])
+        self.assertFalse(search['refit_over_budget'])
+
+    def test_search_refit_after_the_budget_is_flagged(self, submit_job):
+        def slow_search(*args, **kwargs):
+            # Let every candidate finish, then let the real deadline pass before the refit
+            result = successive_halving(*args, **{**kwargs, 'deadline': float('inf')})
+            time.sleep(max(0, kwargs['deadline'] - time.monotonic()) + 0.01)
+            return result
+
+        with mock.patch('backend_app.files.jobs.successive_halving', side_effect=slow_search):
+            search = self.search(time_budget=0.2)
+        self.assertTrue(search['refit_over_budget'])
+
+    def test_pending_job_result_is_accepted_not_ready(self, submit_job):
+        submit_job.side_effect = None
+        response = self.submit()
+
+        result = self.client.get(f"/file/train/{response.data['job_id']}/result/")
+        self.assertEqual(result.status_code, 202)
+        self.assertEqual(result.data['status'], TrainingJob.STATUS_QUEUED)
+
+    @override_settings(TRAINING_JOB_STALE_SECONDS=60)
+    def test_orphaned_job_is_failed(self, submit_job):
+        submit_job.side_effect = None
+        job_id = self.submit().data['job_id']
+        TrainingJob.objects.filter(pk=job_id).update(updated_at=TrainingJob.objects.get(pk=job_id).updated_at - timedelta(minutes=5))
+
+        result = self.client.get(f'/file/train/{job_id}/result/')
+        self.assertEqual(result.status_code, 400)
+        self.assertEqual(TrainingJob.objects.get(pk=job_id).status, TrainingJob.STATUS_FAILED)
+
+    def test_streaming_job_trains_out_of_core(self, submit_job):
+        config = {**TRAINING_CONFIG, 'model_type': 'SGDClassifier', 'streaming': True, 'epochs': 2}
+        response = self.submit(config)
+        self.assertEqual(response.status_code, 202, response.data)
+
+        result = self.client.get(f"/file/train/{response.data['job_id']}/result/")
+        self.assertEqual(result.status_code, 200, result.data)
+        self.assertGreater(result.data['accuracy']['accuracy_score'], 0.8)
+
+    def test_other_users_cannot_see_a_job(self, submit_job):
+        job_id = self.submit().data['job_id']
+        _, other = self.create_user('other')
+
+        self.assertEqual(other.get(f'/file/train/{job_id}/').status_code, 404)
+        self.assertEqual(other.get(f'/file/train/{job_id}/result/').status_code, 404)
+
+
+class UploadSessionAPITests(MediaRootMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user, self.client = self.create_user('owner')
+        self.content = csv_bytes(make_frame())
+        self.sha256 = hashlib.sha256(self.content).hexdigest()
+
+    def start(self, **fields):
+        response = self.client.post('/file/upload/sessions/', {
+            'name': 'houses', 'filename': 'houses.csv', 'size': len(self.content), 'sha256': self.sha256, **fields
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['upload_id']
+
+    def put(self, upload_id, offset, chunk):
+        return self.client.put(
+            f'/file/upload/sessions/{upload_id}/?offset={offset}', chunk, content_type='application/octet-stream'
+        )
+
+    def complete(self, upload_id):
+        return self.client.post(f'/file/upload/sessions/{upload_id}/complete/')
+
+    def test_chunks_are_appended_and_completed_into_a_dataset(self):
+        upload_id = self.start()
+        middle = len(self.content) // 2
+
+        response = self.put(upload_id, 0, self.content[:middle])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['offset'], middle)
+        self.assertEqual(self.put(upload_id, middle, self.content[middle:]).data['offset'], len(self.content))
+
+        response = self.complete(upload_id)
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['file_status'], 'new')
+        dataset = UploadedDataset.objects.get(pk=response.data['id'])
+        self.assertEqual(dataset.user, self.user)
+        self.assertEqual(dataset.dataset_hash, self.sha256)
+        with dataset.dataset.open('rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+        # Completing again (a retried request) returns the same dataset
+        again = self.complete(upload_id)
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.data['id'], dataset.pk)
+        self.assertEqual(self.put(upload_id, len(self.content), b'x').status_code, 409)
+
+    def test_offset_conflict_reports_the_current_offset(self):
+        upload_id = self.start()
+        self.put(upload_id, 0, self.content[:100])
+
+        # A repeated chunk and a skipped chunk are both rejected
+        for offset in (0, 200):
+            response = self.put(upload_id, offset, self.content[offset:offset + 100])
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual(response.data['offset'], 100)
+
+        self.assertEqual(self.client.get(f'/file/upload/sessions/{upload_id}/').data['offset'], 100)
+        self.assertEqual(self.put(upload_id, 100, self.content[100:200]).data['offset'], 200)
+
+    def test_chunk_past_the_declared_size_is_rejected(self):
+        upload_id = self.start(size=10)
+        self.assertEqual(self.put(upload_id, 0, self.content[:11]).status_code, 400)
+
+    def test_incomplete_upload_cannot_be_completed(self):
+        upload_id = self.start()
+        self.put(upload_id, 0, self.content[:100])
+
+        response = self.complete(upload_id)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['offset'], 100)
+        self.assertEqual(UploadedDataset.objects.count(), 0)
+
+    def test_checksum_mismatch_discards_the_upload(self):
+        upload_id = self.start(sha256='0' * 64)
+        self.put(upload_id, 0, self.content)
+
+        self.assertEqual(self.complete(upload_id).status_code, 400)
+        self.assertFalse(UploadSession.objects.filter(pk=upload_id).exists())
+        self.assertEqual(UploadedDataset.objects.count(), 0)
+
+    def test_sessions_are_private(self):
+        upload_id = self.start()
+        _, other = self.create_user('other')
+
+        self.assertEqual(other.put(
+            f'/file/upload/sessions/{upload_id}/?offset=0', self.content[:10], content_type='application/octet-stream'
+        ).status_code, 404)
+        self.assertEqual(other.post(f'/file/upload/sessions/{upload_id}/complete/').status_code, 404)
+
+
+class DatasetOwnershipAPITests(MediaRootMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner, self.owner_client = self.create_user('owner')
+        self.other, self.other_client = self.create_user('other')
+        self.content = csv_bytes(make_frame())
+        upload = SimpleUploadedFile('houses.csv', self.content, content_type='text/csv')
+        response = self.owner_client.post('/file/upload/', {'dataset': upload, 'name': 'houses'}, format='multipart')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.dataset_id = response.data['id']
+
+    def test_preview_and_columns_are_owner_only(self):
+        preview = {'dataset_id': self.dataset_id, 'row_count': 5}
+        self.assertEqual(self.owner_client.post('/file/columns/', {'dataset_id': self.dataset_id}).status_code, 200)
+        self.assertEqual(self.other_client.post('/file/columns/', {'dataset_id': self.dataset_id}).status_code, 404)
+        self.assertEqual(self.owner_client.post('/file/dataset-preview/', preview).status_code, 200)
+        self.assertEqual(self.other_client.post('/file/dataset-preview/', preview).status_code, 404)
+
+    def test_hash_check_only_answers_from_own_datasets(self):
+        check = {'sha256': hashlib.sha256(self.content).hexdigest(), 'size': len(self.content)}
+
+        response = self.owner_client.post('/file/upload/check/', check)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['exists'])
+        self.assertEqual(response.data['dataset_id'], self.dataset_id)
+
+        # Knowing another user's hash and size must not grant access to their file
+        response = self.other_client.post('/file/upload/check/', check)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'exists': False})
+        self.assertFalse(UploadedDataset.objects.filter(user=self.other).exists())
+
+    def test_uploading_known_content_shares_the_stored_file(self):
+        upload = SimpleUploadedFile('copy.csv', self.content, content_type='text/csv')
+        response = self.other_client.post('/file/upload/', {'dataset': upload, 'name': 'mine'}, format='multipart')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertNotEqual(response.data['id'], self.dataset_id)
+
+        linked = UploadedDataset.objects.get(pk=response.data['id'])
+        self.assertEqual(linked.user, self.other)
+        self.assertEqual(linked.name, 'mine')
+        self.assertEqual(linked.dataset.name, UploadedDataset.objects.get(pk=self.dataset_id).dataset.name)
+
+
+class CompactDatasetTests(MediaRootMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='owner', password='secret')
+
+    def test_cached_dataset_loads_with_compact_dtypes(self):
+        df = make_frame()
+        dataset = create_dataset(self.user, df)
+        loaded = load_dataset(dataset)
+
+        self.assertEqual(loaded['rooms'].dtype, np.float32)
+        self.assertIsInstance(loaded['city'].dtype, pd.CategoricalDtype)
+        self.assertEqual(loaded['city'].isna().sum(), df['city'].isna().sum())
+        memory = dataset_memory_usage(dataset)
+        self.assertLess(memory['compact_bytes'], memory['parsed_bytes'])
+
+    @override_settings(DATASET_COMPACT_DTYPES=False)
+    def test_parsed_dtypes_are_kept_when_compaction_is_off(self):
+        loaded = load_dataset(create_dataset(self.user, make_frame()))
+
+        self.assertEqual(loaded['rooms'].dtype, np.float64)
+        self.assertEqual(loaded['city'].dtype, object)
+
+    def test_compact_frame_trains_like_the_parsed_one(self):
+        loaded = load_dataset(create_dataset(self.user, make_frame()))
+        compact = train(loaded.loc[:, ['size', 'rooms', 'city', 'label']], TRAINING_CONFIG)
+        parsed = train(make_frame(), TRAINING_CONFIG)
+
+        self.assertEqual(compact[0], parsed[0])
+        self.assertAlmostEqual(compact[4]['accuracy_score'], parsed[4]['accuracy_score'])
+
+    def test_training_imputes_in_place_instead_of_copying(self):
+        df = make_frame().loc[:, ['size', 'rooms', 'city', 'label']]
+        with contextlib.redirect_stdout(io.StringIO()):
+            prepare_split(df, build_training_config(TRAINING_CONFIG))
+
+        self.assertFalse(df['size'].isna().any())
+        self.assertFalse(df['city'].isna().any())
+
+
+class ColumnPruningTests(MediaRootMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='owner', password='secret')
+        self.df = make_frame()
+        # A wide table: columns training never uses, one of them full of outliers
+        self.df['noise'] = np.where(np.arange(len(self.df)) % 10 == 0, 1e9, 1.0)
+        self.df['notes'] = 'unused'
+        self.dataset = create_dataset(self.user, self.df)
+        self.config = build_training_config(TRAINING_CONFIG)
+
+    def test_training_columns_are_the_features_then_the_target(self):
+        self.assertEqual(training_columns(self.config), ['size', 'rooms', 'city', 'label'])
+        self.assertEqual(training_columns({'features': ['label', 'size'], 'target': 'label'}), ['label', 'size'])
+
+    def test_cached_reads_return_only_the_requested_columns(self):
+        self.assertEqual(list(load_dataset(self.dataset, columns=['label', 'size']).columns), ['label', 'size'])
+        chunks = list(iter_dataset_chunks(self.dataset, 50, columns=['city', 'label']))
+        self.assertEqual([len(chunk) for chunk in chunks], [50, 50, 20])
+        self.assertTrue(all(list(chunk.columns) == ['city', 'label'] for chunk in chunks))
+        with self.assertRaises(KeyError):
+            load_dataset(self.dataset, columns=['size', 'missing'])
+
+    def test_uncached_file_reads_return_only_the_requested_columns(self):
+        chunks = list(iter_dataset_chunks(self.dataset, 50, columns=['size', 'label'], build_cache=False))
+        self.assertEqual(sum(len(chunk) for chunk in chunks), len(self.df))
+        self.assertTrue(all(list(chunk.columns) == ['size', 'label'] for chunk in chunks))
+
+    def test_training_reads_and_preprocesses_only_the_used_columns(self):
+        with mock.patch('backend_app.files.jobs.load_dataset', wraps=load_dataset) as loader:
+            with contextlib.redirect_stdout(io.StringIO()):
+                split = load_prepared_split(self.dataset, self.config)
+
+        self.assertEqual(loader.call_args.kwargs['columns'], ['size', 'rooms', 'city', 'label'])
+        self.assertEqual(set(split.fill_values), {'size', 'rooms', 'city'})
+        # The outliers in 'noise' don't cost any rows
+        with contextlib.redirect_stdout(io.StringIO()):
+            without_noise = prepare_split(make_frame(), self.config)
+        self.assertEqual(len(split.X_train) + len(split.X_test), len(without_noise.X_train) + len(without_noise.X_test))
+
+
+@override_settings(PREVIEW_SAMPLE_ROWS=50)
+class DatasetPreviewAPITests(MediaRootMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user, self.client = self.create_user('owner')
+        self.content = csv_bytes(make_frame())
+
+    def test_large_upload_is_previewed_from_a_sample(self):
+        upload = SimpleUploadedFile('houses.csv', self.content, content_type='text/csv')
+        response = self.client.post('/file/dataset-preview/', {'dataset': upload, 'row_count': 5}, format='multipart')
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['rows'], 120)
+        self.assertTrue(response.data['sampled'])
+        self.assertEqual(response.data['sample_size'], 50)
+        self.assertEqual(len(response.data['data']), 5)
+
+    @override_settings(PREVIEW_SAMPLE_ROWS=500)
+    def test_small_dataset_is_previewed_whole(self):
+        dataset = create_dataset(self.user, make_frame())
+        response = self.client.post('/file/dataset-preview/', {'dataset_id': dataset.pk, 'row_count': 5})
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['rows'], 120)
+        self.assertFalse(response.data['sampled'])
+        self.assertEqual(response.data['sample_size'], 120)
+
+
+class ReservoirSampleTests(SimpleTestCase):
+
+    def chunks(self, rows, chunksize):
+        df = pd.DataFrame({'row': np.arange(rows)})
+        return (df.iloc[start:start + chunksize] for start in range(0, rows, chunksize))
+
+    def test_sample_size_is_bounded(self):
+        sample, seen = reservoir_sample(self.chunks(1000, 37), 50)
+
+        self.assertEqual(seen, 1000)
+        self.assertEqual(len(sample), 50)
+        self.assertTrue(sample['row'].is_unique)
+        self.assertTrue(sample['row'].between(0, 999).all())
+
+    def test_short_stream_is_returned_whole(self):
+        sample, seen = reservoir_sample(self.chunks(30, 7), 50)
+
+        self.assertEqual(seen, 30)
+        self.assertEqual(sample['row'].tolist(), list(range(30)))
+        self.assertEqual(reservoir_sample(iter([]), 50)[1], 0)
+
+    def test_same_seed_gives_the_same_sample(self):
+        first = reservoir_sample(self.chunks(500, 64), 20, seed=3)[0]
+        pd.testing.assert_frame_equal(first, reservoir_sample(self.chunks(500, 64), 20, seed=3)[0])
+
+    def test_every_row_is_equally_likely(self):
+        rows, size, runs = 100, 10, 400
+        counts = np.zeros(rows)
+        for seed in range(runs):
+            counts[reservoir_sample(self.chunks(rows, 7), size, seed=seed)[0]['row']] += 1
+
+        # Each row is kept with probability size / rows: 40 of 400 runs, sd 6
+        expected = runs * size / rows
+        self.assertLess(np.abs(counts - expected).max(), 30)
+        # Rows of the first chunk, which fill the reservoir, aren't favoured over later ones
+        self.assertAlmostEqual(counts[:7].mean(), counts[-7:].mean(), delta=15)
+class TrainingCacheKeyTests(SimpleTestCase):
+    dataset_hash = 'a' * 64
+
+    def test_key_depends_on_the_dataset_and_training_settings(self):
+        key = training_cache_key(self.dataset_hash, TRAINING_CONFIG)
+        self.assertEqual(key, training_cache_key(self.dataset_hash, dict(TRAINING_CONFIG)))
+        self.assertNotEqual(key, training_cache_key('b' * 64, TRAINING_CONFIG))
+
+        for change in (
+            {'cv_folds': 5},
+            {'streaming': True},
+            {'epochs': 3},
+            {'parameters': {'C': '0.5'}},
+            {'model_type': 'RandomForestClassifier'},
+            {'scaler': 'MinMaxScaler'},
+        ):
+            with self.subTest(change=change):
+                self.assertNotEqual(key, training_cache_key(self.dataset_hash, {**TRAINING_CONFIG, **change}))
+
+    def test_unused_keys_and_blank_parameters_share_a_key(self):
+        key = training_cache_key(self.dataset_hash, TRAINING_CONFIG)
+        self.assertEqual(key, training_cache_key(self.dataset_hash, {**TRAINING_CONFIG, 'n_jobs': 4}))
+        self.assertEqual(key, training_cache_key(self.dataset_hash, {**TRAINING_CONFIG, 'parameters': {'C': ''}}))
+
+    def test_holdout_fits_use_the_plain_train_key(self):
+        comparison = {**TRAINING_CONFIG, 'cv_folds': 5, 'streaming': True, 'epochs': 3}
+        self.assertEqual(
+            training_cache_key(self.dataset_hash, holdout_config(comparison)),
+            training_cache_key(self.dataset_hash, TRAINING_CONFIG)
+        )
+
+    def test_split_key_ignores_the_model(self):
+        training_config = build_training_config(TRAINING_CONFIG)
+        key = split_cache_key(self.dataset_hash, training_config)
+        self.assertEqual(key, split_cache_key(self.dataset_hash, {
+            **training_config, 'model_type': 'RandomForestClassifier', 'parameters': {'n_estimators': 10}
+        }))
+        self.assertNotEqual(key, split_cache_key(self.dataset_hash, {**training_config, 'encoder': 'OneHotEncoder'}))
+
+
+
+class CategoryEncoderTests(SimpleTestCase):
+    values = ['south', 'north', 'east', 'north', 'west', 'east']
+
+    def test_codes_match_label_encoder(self):
+        encoder = CategoryEncoder().fit(self.values)
+        label_encoder = preprocessing.LabelEncoder().fit(self.values)
+
+        np.testing.assert_array_equal(encoder.classes_, label_encoder.classes_)
+        np.testing.assert_array_equal(encoder.transform(self.values), label_encoder.transform(self.values))
+        np.testing.assert_array_equal(encoder.inverse_transform([0, 3]), ['east', 'west'])
+
+    def test_unknown_and_missing_values_get_the_sentinel_code(self):
+        encoder = CategoryEncoder().fit(self.values)
+        codes = encoder.transform(['north', 'nowhere', None, np.nan])
+
+        self.assertEqual(encoder.unknown_code, 4)
+        np.testing.assert_array_equal(codes, [1, 4, 4, 4])
+
+    def test_only_the_classes_are_pickled(self):
+        encoder = CategoryEncoder().fit(self.values)
+        self.assertEqual(list(encoder.__getstate__()), ['classes_'])
+
+        restored = pickle.loads(pickle.dumps(encoder))
+        np.testing.assert_array_equal(restored.classes_, encoder.classes_)
+        np.testing.assert_array_equal(restored.transform(['west', 'up']), [3, 4])
+
+    def test_saved_label_encoders_are_upgraded(self):
+        label_encoder = preprocessing.LabelEncoder().fit(self.values)
+        upgraded = upgrade_label_encoders({'city': label_encoder, 'kept': CategoryEncoder(['a'])})
+
+        self.assertIsInstance(upgraded['city'], CategoryEncoder)
+        np.testing.assert_array_equal(upgraded['city'].transform(self.values), label_encoder.transform(self.values))
+        self.assertEqual(list(upgraded['kept'].classes_), ['a'])
+        # OneHotEncoders and missing encoders are left alone
+        one_hot = preprocessing.OneHotEncoder()
+        self.assertIs(upgrade_label_encoders(one_hot), one_hot)
+        self.assertIsNone(upgrade_label_encoders(None))
+class InferencePlanTests(SimpleTestCase):
+
+    def inputs(self):
+        df = make_frame(rows=40, seed=1)[TRAINING_CONFIG['features']]
+        df.loc[:4, 'city'] = 'never seen'
+        df.loc[5:7, 'city'] = ''
+        df.loc[8:9, 'rooms'] = np.nan
+        return df
+
+    def test_plan_matches_the_pipeline(self):
+        train_df = make_frame()
+        for encoder in ('LabelEncoder', 'OneHotEncoder'):
+            for scaler in ('StandardScaler', 'MinMaxScaler', 'None'):
+                with self.subTest(encoder=encoder, scaler=scaler):
+                    pipeline = train(train_df.copy(), {**TRAINING_CONFIG, 'encoder': encoder, 'scaler': scaler})[3]
+                    self.assertIsInstance(pipeline, TrainedPipeline)
+                    plan = InferencePlan(pipeline)
+                    self.assertTrue(plan.compiled)
+
+                    df = self.inputs()
+                    expected = pipeline.transform(df.copy()).astype(float)
+                    np.testing.assert_allclose(plan.transform(df.copy()), expected)
+                    np.testing.assert_array_equal(plan.predict(df.copy()), pipeline.predict(df.copy()))
+
+    def test_plan_matches_a_native_model(self):
+        pipeline = train(make_frame(), {**TRAINING_CONFIG, 'model_type': 'HistGradientBoostingClassifier'})[3]
+        plan = InferencePlan(pipeline)
+
+        df = self.inputs()
+        np.testing.assert_allclose(
+            plan.transform(df.copy()), pipeline.transform(df.copy()).astype(float), equal_nan=True
+        )
+        np.testing.assert_array_equal(plan.predict(df.copy()), pipeline.predict(df.copy()))
+
+
+
+class NativeModelTests(SimpleTestCase):
+    config = {**TRAINING_CONFIG, 'model_type': 'HistGradientBoostingClassifier'}
+
+    def test_missing_values_reach_the_model(self):
+        df = make_frame()
+        with contextlib.redirect_stdout(io.StringIO()):
+            split = prepare_split(df.copy(), build_training_config(self.config))
+
+        # Nothing is imputed and no outlier rows are dropped
+        self.assertEqual(len(split.X_train) + len(split.X_test), len(df))
+        X = np.vstack([split.X_train, split.X_test])
+        self.assertEqual(np.isnan(X[:, 0]).sum(), df['size'].isna().sum())
+        self.assertEqual(np.isnan(X[:, 2]).sum(), df['city'].isna().sum())
+        self.assertIsNone(split.scaler)
+        self.assertEqual(split.fill_values, {})
+
+    def test_text_columns_are_native_categories(self):
+        _, _, _, pipeline, accuracy = train(make_frame(), self.config)
+
+        np.testing.assert_array_equal(pipeline.model.is_categorical_, [False, False, True])
+        self.assertEqual(list(pipeline.encoder['city'].classes_), ['east', 'north', 'south'])
+        iterations = accuracy['boosting_iterations']
+        self.assertLessEqual(iterations['used'], iterations['max'])
+        self.assertEqual(iterations['max'], pipeline.model.max_iter)
+
+    def test_predicts_rows_with_missing_and_unseen_values(self):
+        pipeline = train(make_frame(), self.config)[3]
+        df = pd.DataFrame({
+            'size': [np.nan, 70.0, 30.0],
+            'rooms': [3.0, np.nan, 1.0],
+            'city': ['north', 'never seen', None],
+        })
+
+        features = InferencePlan(pipeline).transform(df.copy())
+        self.assertTrue(np.isnan(features[0, 0]))
+        self.assertTrue(np.isnan(features[1, 1]))
+        # Unseen and missing categories share the unknown code, which the model treats as missing
+        unknown = len(pipeline.encoder['city'].classes_)
+        self.assertEqual(features[1, 2], unknown)
+        self.assertEqual(features[2, 2], unknown)
+        predictions = pipeline.predict(df.copy())
+        self.assertEqual(len(predictions), 3)
+        self.assertTrue(set(predictions) <= {'high', 'low'})
+
+class BackfillFillValuesTests(MediaRootMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='owner', password='secret')
+        self.df = make_frame()
+        self.dataset = create_dataset(self.user, self.df)
+        self.pipeline = train(self.df.copy(), TRAINING_CONFIG)[3]
+        self.saved_model = self.create_legacy_model()
+
+    def create_legacy_model(self):
+        """A model as saved before fill values were kept: four separate joblib files."""
+        def dump(obj, name):
+            buffer = io.BytesIO()
+            joblib.dump(obj, buffer)
+            return ContentFile(buffer.getvalue(), name=name)
+
+        config = ModelConfig.objects.create(
+            user=self.user, dataset=self.dataset, target_column=TRAINING_CONFIG['target_column'],
+            features=TRAINING_CONFIG['features'], encoder=TRAINING_CONFIG['encoder'],
+            scaler=TRAINING_CONFIG['scaler'], model_type=TRAINING_CONFIG['model_type'],
+            problem_type=TRAINING_CONFIG['problem_type'], parameters=TRAINING_CONFIG['parameters'], accuracy={'accuracy': 0.9}
+        )
+        return SavedModel.objects.create(
+            user=self.user, dataset=self.dataset, name='legacy', algorithm=TRAINING_CONFIG['model_type'],
+            accuracy=90, config=config,
+            model_file=dump(self.pipeline.model, 'legacy.joblib'),
+            encoder_file=dump(self.pipeline.encoder, 'legacy_encoder.joblib'),
+            scaler_file=dump(self.pipeline.scaler, 'legacy_scaler.joblib'),
+            target_encoder=dump(self.pipeline.target_encoder, 'legacy_target.joblib')
+        )
+
+    def legacy_paths(self):
+        return [f.path for f in (
+            self.saved_model.model_file, self.saved_model.encoder_file,
+            self.saved_model.scaler_file, self.saved_model.target_encoder
+        )]
+
+    def test_backfill_upgrades_legacy_models(self):
+        legacy_paths = self.legacy_paths()
+        out = io.StringIO()
+        call_command('backfill_fill_values', stdout=out)
+        self.assertIn('1 upgraded, 0 already current, 0 failed', out.getvalue())
+
+        self.saved_model.refresh_from_db()
+        self.assertFalse(self.saved_model.encoder_file)
+        self.assertFalse(self.saved_model.scaler_file)
+        self.assertFalse(self.saved_model.target_encoder)
+        self.assertFalse(any(os.path.exists(path) for path in legacy_paths))
+
+        upgraded = joblib.load(self.saved_model.model_file.path)
+        self.assertIsInstance(upgraded, TrainedPipeline)
+        # The columnar cache may hold a column as float32, hence the tolerance
+        self.assertAlmostEqual(upgraded.fill_values['size'], self.df['size'].mean(), places=4)
+        self.assertAlmostEqual(upgraded.fill_values['rooms'], self.df['rooms'].mean(), places=4)
+        self.assertEqual(upgraded.fill_values['city'], self.df['city'].mode().iloc[0])
+
+        # A second run finds nothing to do
+        out = io.StringIO()
+        call_command('backfill_fill_values', stdout=out)
+        self.assertIn('0 upgraded, 1 already current, 0 failed', out.getvalue())
+
+    def test_dry_run_changes_nothing(self):
+        out = io.StringIO()
+        call_command('backfill_fill_values', '--dry-run', stdout=out)
+        self.assertIn(f'Model {self.saved_model.pk} (legacy) needs a backfill', out.getvalue())
+        self.assertTrue(all(os.path.exists(path) for path in self.legacy_paths()))
+
+    def test_failed_backfill_keeps_the_legacy_files(self):
+        legacy_paths = self.legacy_paths()
+        with mock.patch(
+            'backend_app.management.commands.backfill_fill_values.training_fill_values',
+            side_effect=ValueError('dataset unreadable')
+        ), self.assertLogs('backend_app.management.commands.backfill_fill_values', 'ERROR'):
+            with self.assertRaisesMessage(CommandError, str(self.saved_model.pk)):
+                call_command('backfill_fill_values', stdout=io.StringIO())
+
+        self.saved_model.refresh_from_db()
+        self.assertEqual([f.path for f in (
+            self.saved_model.model_file, self.saved_model.encoder_file,
+            self.saved_model.scaler_file, self.saved_model.target_encoder
+        )], legacy_paths)
+        self.assertTrue(all(os.path.exists(path) for path in legacy_paths))
+
+
+class BatchPredictionAPITests(MediaRootMixin, TestCase):
+    config = {**TRAINING_CONFIG, 'features': ['size', 'rooms', 'zip']}
+
+    def setUp(self):
+        super().setUp()
+        self.user, self.client = self.create_user('owner')
+        # A categorical column of numeric-looking codes, which must stay strings
+        df = make_frame(rows=200).drop(columns='city')
+        df['zip'] = np.where(df['label'] == 'high', '10001', '20002')
+        df.loc[::17, 'zip'] = '30003'
+        self.df = df
+        self.pipeline = train(df.copy(), self.config)[3]
+        self.saved_model = create_saved_model(self.user, create_dataset(self.user, df), self.pipeline, self.config)
+        self.url = f'/file/predict/{self.saved_model.pk}/batch/'
+        self.expected = list(self.pipeline.predict(df[self.config['features']].copy()))
+
+        overrides = override_settings(BATCH_PREDICTION_CHUNK_SIZE=30)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def predict(self, name, content, output='csv'):
+        upload = SimpleUploadedFile(name, content)
+        response = self.client.post(f'{self.url}?output={output}', {'dataset': upload}, format='multipart')
+        body = b''.join(response.streaming_content).decode() if response.streaming else None
+        return response, body
+
+    def jsonl(self, df):
+        return df.to_json(orient='records', lines=True).encode()
+
+    def test_csv_predictions_span_chunks(self):
+        response, body = self.predict('inputs.csv', csv_bytes(self.df[self.config['features']]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+
+        result = pd.read_csv(io.StringIO(body))
+        self.assertEqual(list(result.columns), ['row', 'prediction'])
+        self.assertEqual(list(result['row']), list(range(len(self.df))))
+        self.assertEqual(list(result['prediction']), self.expected)
+
+    def test_ndjson_output_has_one_record_per_line(self):
+        response, body = self.predict('inputs.csv', csv_bytes(self.df[self.config['features']]), output='ndjson')
+        self.assertEqual(response.status_code, 200)
+
+        lines = body.split('\n')
+        self.assertEqual(lines[-1], '')
+        records = [json.loads(line) for line in lines[:-1]]
+        self.assertEqual([record['row'] for record in records], list(range(len(self.df))))
+        self.assertEqual([record['prediction'] for record in records], self.expected)
+
+    def test_json_lines_codes_are_read_as_strings(self):
+        inputs = self.df[self.config['features']].copy()
+        inputs['zip'] = inputs['zip'].astype(int)
+        response, body = self.predict('inputs.jsonl', self.jsonl(inputs), output='ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([json.loads(line)['prediction'] for line in body.splitlines()], self.expected)
+
+    def test_missing_feature_is_rejected(self):
+        response, _ = self.predict('inputs.csv', csv_bytes(self.df[['size', 'rooms']]))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('zip', response.data['error'])
+
+    def test_bad_first_chunk_is_a_400_not_an_empty_200(self):
+        inputs = self.df[self.config['features']].astype(object)
+        inputs.loc[3, 'rooms'] = 'three'
+        response, _ = self.predict('inputs.csv', csv_bytes(inputs))
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.data['error'].startswith('Prediction failed'))
+
+    def test_bad_later_chunk_ends_the_stream_with_an_error_record(self):
+        inputs = self.df[self.config['features']].astype(object)
+        inputs.loc[100, 'rooms'] = 'three'
+        response, body = self.predict('inputs.csv', csv_bytes(inputs), output='ndjson')
+        self.assertEqual(response.status_code, 200)
+
+        records = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(records[-1]['row'], 90)
+        self.assertIn('error', records[-1])
+        self.assertEqual([record['prediction'] for record in records[:-1]], self.expected[:90])
+
+    def test_other_users_model_is_not_found(self):
+        _, other = self.create_user('other')
+        upload = SimpleUploadedFile('inputs.csv', csv_bytes(self.df[self.config['features']]))
+        self.assertEqual(other.post(self.url, {'dataset': upload}, format='multipart').status_code, 404)
+
+
+class InputChunkTests(SimpleTestCase):
+
+    def test_json_lines_apply_the_dtype_and_keep_missing_values(self):
+        content = b'{"zip": 10001, "size": 1.5}\n{"zip": null, "size": 2}\n{"zip": 20002, "size": null}\n'
+        file = SimpleUploadedFile('inputs.jsonl', content)
+        chunks = list(iter_input_chunks(file, 2, dtype={'zip': str, 'absent': str}))
+
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 1])
+        df = pd.concat(chunks)
+        self.assertEqual(df['zip'].iloc[0], '10001')
+        self.assertTrue(pd.isna(df['zip'].iloc[1]))
+        self.assertEqual(df['zip'].iloc[2], '20002')
+        self.assertTrue(pd.api.types.is_numeric_dtype(df['size']))
+
+
+class StreamingStatsTests(SimpleTestCase):
+
+    def frame(self, rows=5000):
+        rng = np.random.default_rng(7)
+        x = rng.normal(10, 3, rows)
+        df = pd.DataFrame({
+            'x': x,
+            'y': 2 * x + rng.normal(0, 1, rows),
+            'z': rng.integers(0, 50, rows).astype(float),
+            'group': rng.choice(['a', 'b', 'c', 'd'], rows),
+        })
+        df.loc[rng.random(rows) < 0.1, 'x'] = np.nan
+        df.loc[rng.random(rows) < 0.2, 'y'] = np.nan
+        df.loc[rng.random(rows) < 0.05, 'group'] = None
+        return df
+
+    def rank_error(self, data, qs, estimates):
+        data = np.sort(data)
+        ranks = np.searchsorted(data, estimates, side='right') / len(data)
+        return np.max(np.abs(ranks - qs))
+
+    def test_merged_chunks_match_a_single_pass(self):
+        df = self.frame()
+        single = DatasetStats.for_frame(df).update(df)
+        merged = DatasetStats.for_frame(df)
+        for start in range(0, len(df), 700):
+            merged.merge(DatasetStats.for_frame(df).update(df.iloc[start:start + 700]))
+
+        self.assertEqual(merged.rows, single.rows)
+        self.assertEqual(merged.nulls, single.nulls)
+        self.assertEqual(merged.cardinality(), single.cardinality())
+        np.testing.assert_array_equal(merged.minimum, single.minimum)
+        np.testing.assert_array_equal(merged.maximum, single.maximum)
+        np.testing.assert_allclose(merged.moments.means(), single.moments.means())
+        np.testing.assert_allclose(merged.moments.variances(), single.moments.variances())
+        np.testing.assert_allclose(merged.correlation(), single.correlation())
+
+        numeric = df[merged.numeric_columns]
+        np.testing.assert_allclose(merged.moments.means(), numeric.mean())
+        np.testing.assert_allclose(np.sqrt(merged.moments.variances()), numeric.std())
+        np.testing.assert_array_equal(merged.moments.counts(), numeric.count())
+
+    def test_correlation_with_missing_values_matches_pandas(self):
+        df = self.frame()
+        stats = DatasetStats.for_frame(df)
+        for start in range(0, len(df), 999):
+            stats.update(df.iloc[start:start + 999])
+        np.testing.assert_allclose(stats.correlation(), df[stats.numeric_columns].corr(), atol=1e-12)
+
+    def test_quantiles_are_exact_until_the_first_compaction(self):
+        values = np.random.default_rng(1).normal(size=150)
+        sketch = QuantileSketch(k=200)
+        sketch.update(values)
+        np.testing.assert_allclose(sketch.quantiles([0.1, 0.5, 0.9]), np.quantile(values, [0.1, 0.5, 0.9]))
+
+    def test_quantile_rank_error_is_bounded(self):
+        values = np.random.default_rng(2).exponential(size=100_000)
+        qs = np.linspace(0.01, 0.99, 99)
+
+        single = QuantileSketch(k=200, seed=0)
+        single.update(values)
+        merged = QuantileSketch(k=200, seed=0)
+        for start in range(0, len(values), 7_000):
+            part = QuantileSketch(k=200, seed=start)
+            part.update(values[start:start + 7_000])
+            merged.merge(part)
+
+        for sketch in (single, merged):
+            self.assertEqual(sketch.n, len(values))
+            # Memory stays bounded by k; ranks are typically within 1%, the worst of 99 within 2%
+            self.assertLess(sum(len(level) for level in sketch.levels), 1_000)
+            self.assertLess(self.rank_error(values, qs, sketch.quantiles(qs)), 0.02)
+
+    def test_distinct_counter_switches_to_hyperloglog_past_the_exact_limit(self):
+        counter = DistinctCounter(exact_limit=100)
+        counter.update(np.arange(100))
+        counter.update(np.arange(50))
+        self.assertEqual(counter.count(), 100)
+        self.assertEqual(counter.values(), list(range(100)))
+
+        counter.update(np.array([100]))
+        self.assertIsNone(counter.values())
+        self.assertAlmostEqual(counter.count(), 101, delta=5)
+
+    def test_merging_exact_counters_past_the_limit_switches_too(self):
+        left, right = DistinctCounter(exact_limit=100), DistinctCounter(exact_limit=100)
+        left.update(np.arange(60))
+        right.update(np.arange(40, 100))
+        self.assertEqual(left.merge(right).values(), list(range(100)))
+
+        extra = DistinctCounter(exact_limit=100)
+        extra.update(np.array([100.0, 101.0]))
+        self.assertIsNone(left.merge(extra).values())
+
+    def test_hyperloglog_estimate_is_close(self):
+        counter = DistinctCounter()
+        for start in range(0, 200_000, 10_000):
+            counter.update(np.arange(start, start + 10_000) % 50_000)
+        self.assertIsNone(counter.values())
+        self.assertAlmostEqual(counter.count(), 50_000, delta=50_000 * 0.05)
+
+        # Integer and float chunks of one column count the same values once
+        mixed = DistinctCounter(exact_limit=10)
+        mixed.update(np.arange(1000))
+        mixed.update(np.arange(1000, dtype=np.float64))
+        self.assertAlmostEqual(mixed.count(), 1000, delta=50)
+
+
+class IncrementalTrainingTests(SimpleTestCase):
+    config = build_training_config({**TRAINING_CONFIG, 'model_type': 'SGDClassifier', 'epochs': 3})
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, 'houses.csv')
+        self.df = make_frame(rows=600)
+        self.df.to_csv(self.path, index=False)
+        self.passes = 0
+
+    def chunks(self):
+        self.passes += 1
+        return pd.read_csv(self.path, chunksize=64, usecols=self.config['features'] + [self.config['target']])
+
+    def test_sgd_trained_from_csv_chunks_predicts_through_the_plan(self):
+        for encoder in ('LabelEncoder', 'OneHotEncoder'):
+            with self.subTest(encoder=encoder):
+                self.passes = 0
+                config = {**self.config, 'encoder': encoder}
+                feature_types, _, _, pipeline, accuracy = train_incremental(self.chunks, config)
+
+                # Statistics, scaler, one pass per epoch and the evaluation
+                self.assertEqual(self.passes, 3 + config['epochs'])
+                self.assertEqual(feature_types['city'], 'categorical')
+                self.assertGreater(accuracy['accuracy_score'], 0.8)
+                self.assertEqual(set(pipeline.fill_values), set(config['features']))
+
+                plan = InferencePlan(pipeline)
+                self.assertTrue(plan.compiled)
+                inputs = make_frame(rows=50, seed=3)[config['features']]
+                inputs.loc[:2, 'city'] = 'never seen'
+                inputs.loc[3:4, 'city'] = ''
+                np.testing.assert_allclose(plan.transform(inputs.copy()), pipeline.transform(inputs.copy()).astype(float))
+                np.testing.assert_array_equal(plan.predict(inputs.copy()), pipeline.predict(inputs.copy()))
+                self.assertTrue(set(plan.predict(inputs.copy())) <= {'high', 'low'})
+
+    def test_training_is_reproducible(self):
+        # The hold-out rows and the shuffling follow config['random_state'], SGD's own draws its parameter
+        config = {**self.config, 'parameters': {'random_state': 0}}
+        first = train_incremental(self.chunks, config)[3]
+        second = train_incremental(self.chunks, config)[3]
+        np.testing.assert_array_equal(first.model.coef_, second.model.coef_)
+
+    def test_estimators_without_partial_fit_are_rejected(self):
+        with self.assertRaises(ValueError):
+            train_incremental(self.chunks, {**self.config, 'model_type': 'RandomForestClassifier'})
+
+
+class ColumnStoreTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def frame(self, rows=40):
+        rng = np.random.default_rng(5)
+        df = pd.DataFrame({
+            'count': rng.integers(0, 100, rows),
+            'big': rng.integers(0, 10, rows) * 1_000_000_000,
+            'count_gaps': rng.integers(0, 100, rows).astype(float),
+            'half': rng.integers(0, 8, rows) / 2,
+            'price': rng.normal(10, 3, rows),
+            'flag': rng.random(rows) < 0.5,
+            'flag_gaps': pd.Series(rng.random(rows) < 0.5, dtype=object),
+            'city': rng.choice(['north', 'south', 'east'], rows),
+            'name': [f'person {i}' for i in range(rows)],
+            'empty': np.nan,
+        })
+        df.loc[rows - 5, 'count_gaps'] = np.nan
+        df.loc[rows - 3, 'flag_gaps'] = None
+        # Numbers in the first rows and text further down
+        df['code'] = [str(i) for i in range(rows - 4)] + ['A1', 'B2', 'C3', 'D4']
+        return df
+
+    def write(self, df, name, chunksize, compact=True):
+        csv_path = os.path.join(self.directory, f'{name}.csv')
+        df.to_csv(csv_path, index=False)
+        chunked, whole = os.path.join(self.directory, f'{name}_chunked'), os.path.join(self.directory, f'{name}_whole')
+        os.makedirs(chunked)
+        os.makedirs(whole)
+        write_csv_column_store(csv_path, chunked, chunksize, compact=compact)
+        parsed = pd.read_csv(csv_path)
+        write_column_store(compact_dtypes(parsed) if compact else parsed, whole)
+        return chunked, whole
+
+    def load(self, path):
+        with open(os.path.join(path, SCHEMA_FILE)) as f:
+            schema = json.load(f)
+        df = pd.DataFrame({entry['name']: _load_column(path, entry) for entry in schema['columns']})
+        return schema, df
+
+    def test_chunked_csv_store_matches_the_whole_frame_store(self):
+        df = self.frame()
+        for compact in (True, False):
+            for chunksize in (3, 7, 1000):
+                with self.subTest(compact=compact, chunksize=chunksize):
+                    chunked, whole = self.write(df, f'{compact}_{chunksize}', chunksize, compact=compact)
+                    chunked_schema, chunked_df = self.load(chunked)
+                    whole_schema, whole_df = self.load(whole)
+
+                    self.assertEqual(chunked_schema['rows'], len(df))
+                    self.assertEqual(
+                        [(entry['name'], entry['dtype']) for entry in chunked_schema['columns']],
+                        [(entry['name'], entry['dtype']) for entry in whole_schema['columns']]
+                    )
+                    pd.testing.assert_frame_equal(chunked_df, whole_df)
+
+    def test_compact_dtypes_are_chosen_per_column(self):
+        chunked, _ = self.write(self.frame(), 'dtypes', 7)
+        dtypes = {entry['name']: entry['dtype'] for entry in self.load(chunked)[0]['columns']}
+        self.assertEqual(dtypes['count'], 'int8')
+        self.assertEqual(dtypes['big'], 'int64')
+        self.assertEqual(dtypes['count_gaps'], 'float32')
+        self.assertEqual(dtypes['half'], 'float32')
+        self.assertEqual(dtypes['price'], 'float64')
+        self.assertEqual(dtypes['flag'], 'bool')
+        self.assertEqual(dtypes['city'], 'category')
+        self.assertEqual(dtypes['name'], 'object')
+        self.assertEqual(dtypes['code'], 'object')
+
+    def test_compaction_can_be_turned_off(self):
+        chunked, _ = self.write(self.frame(), 'parsed', 7, compact=False)
+        dtypes = {entry['name']: entry['dtype'] for entry in self.load(chunked)[0]['columns']}
+        self.assertEqual(dtypes['count'], 'int64')
+        self.assertEqual(dtypes['count_gaps'], 'float64')
+        self.assertEqual(dtypes['city'], 'object')
+
+
+class OutlierRemovalTests(SimpleTestCase):
+
+    def frame(self, rows=400, seed=0):
+        rng = np.random.default_rng(seed)
+        df = pd.DataFrame(rng.uniform(0, 1, size=(rows, 4)), columns=['a', 'b', 'c', 'd'])
+        df['target'] = rng.integers(0, 2, rows) * 1000.0
+        # A few rows far outside the fences in each column
+        for i, col in enumerate(['a', 'b', 'c', 'd']):
+            df.loc[rng.choice(rows, 5, replace=False), col] = 50.0 * (i + 1)
+        return df
+
+    def test_iqr_keeps_the_rows_the_per_column_loop_kept(self):
+        for seed in range(5):
+            with self.subTest(seed=seed):
+                df = self.frame(seed=seed)
+                cols = list(df.columns)
+                kept = safe_remove_outliers(df, cols, target_col='target', method='iqr')
+                self.assertTrue(kept.index.equals(legacy_remove_outliers(df, cols, target_col='target').index))
+                self.assertEqual(kept['target'].nunique(), 2)
+
+    def test_iqr_matches_the_per_column_loop_on_one_column(self):
+        # With several columns the loop took later quartiles from an already filtered
+        # frame, so only clear outliers are removed the same way; one column is exact
+        df = pd.DataFrame({'value': np.random.default_rng(1).standard_cauchy(1000)})
+        self.assertTrue(
+            safe_remove_outliers(df, ['value']).index.equals(legacy_remove_outliers(df, ['value']).index)
+        )
+
+    def test_zscore_ignores_constant_columns(self):
+        df = self.frame()
+        df['constant'] = 7.0
+        kept = safe_remove_outliers(df, ['a', 'b', 'c', 'd', 'constant'], method='zscore')
+
+        self.assertEqual(len(kept), len(safe_remove_outliers(df, ['a', 'b', 'c', 'd'], method='zscore')))
+        self.assertFalse(kept.empty)
+        self.assertTrue(safe_remove_outliers(df, ['constant'], method='zscore').index.equals(df.index))
+
+    def test_none_and_unknown_methods(self):
+        df = self.frame()
+        self.assertIs(safe_remove_outliers(df, list(df.columns), method='none'), df)
+        with self.assertRaises(ValueError):
+            safe_remove_outliers(df, list(df.columns), method='mad')
+
+
+class SuccessiveHalvingTests(SimpleTestCase):
+    candidates = [{'C': c} for c in (0.01, 0.03, 0.1, 0.3, 1.0, 3.0, 10.0, 30.0)]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.config = build_training_config(TRAINING_CONFIG)
+        with contextlib.redirect_stdout(io.StringIO()):
+            cls.split = prepare_split(make_frame(rows=2000), cls.config)
+
+    def run_search(self, deadline, factor=2):
+        return successive_halving(self.split, self.config, self.candidates, factor=factor, deadline=deadline, n_jobs=1)
+
+    def test_factor_two_halves_the_candidates_each_round(self):
+        best, rounds, timed_out = self.run_search(time.monotonic() + 600)
+
+        self.assertFalse(timed_out)
+        self.assertEqual([r['n_candidates'] for r in rounds], [8, 4, 2, 1])
+        samples = [r['n_samples'] for r in rounds]
+        self.assertEqual(samples, [samples[0] * 2 ** i for i in range(4)])
+        self.assertTrue(all(r['completed'] for r in rounds))
+        self.assertIn(best['parameters'], self.candidates)
+
+    def test_spent_budget_raises(self):
+        with self.assertRaises(ValueError):
+            self.run_search(time.monotonic() - 1)
+
+    def test_budget_running_out_mid_round_keeps_the_partial_best(self):
+        def slow_score(*args, **kwargs):
+            time.sleep(0.1)
+            return score_candidate(*args, **kwargs)
+
+        with mock.patch('backend_app.files.jobs.score_candidate', side_effect=slow_score):
+            best, rounds, timed_out = self.run_search(time.monotonic() + 0.25)
+
+        self.assertTrue(timed_out)
+        self.assertEqual(len(rounds), 1)
+        self.assertFalse(rounds[0]['completed'])
+        self.assertIsNotNone(best['score'])
@@ -21,6 +21,7 @@ import Heatmap from 'react-heatmap-grid';
 import Navbar from '../../components/Navbar';
 import Footer from '../../components/Footer';
 import { Toaster,toast } from 'sonner';
+import { hashFile } from '../../utils/hashFile';
 
 Chart.register(...registerables);
 
@@ -36,6 +37,9 @@ const visualizationOptions = [
   // { value: 'heatmap', label: 'Heatmap', icon: <HeatmapIcon className="w-4 h-4 mr-2" /> }
 ];
 
+// Files above this size skip the "already uploaded?" check and are uploaded directly
+const HASH_CHECK_MAX_BYTES = 2 * 1024 * 1024 * 1024;
+
 // Row count options for preview
 const rowCountOptions = [
   { value: 5, label: '5 rows' },
@@ -91,6 +95,16 @@ const modelOptions = {
         kernel: { type: 'select', value: 'rbf', options: ['linear', 'poly', 'rbf', 'sigmoid'] },
         gamma: { type: 'select', value: 'scale', options: ['scale', 'auto'] }
       },
+    },
+    'HistGradientBoostingClassifier': {
+      displayName: 'Histogram Gradient Boosting Classifier',
+      parameters: {
+        max_iter: { type: 'number', value: 100, min: 10, max: 1000 },
+        learning_rate: { type: 'number', value: 0.1, min: 0.01, max: 1, step: 0.01 },
+        max_leaf_nodes: { type: 'number', value: 31, min: 2, max: 255 },
+        max_depth: { type: 'number', value: '', min: 1, max: 20, placeholder: 'None' },
+        l2_regularization: { type: 'number', value: 0, min: 0, max: 10, step: 0.1 }
+      },
     }
   },
   regression: {
@@ -136,6 +150,16 @@ const modelOptions = {
         kernel: { type: 'select', value: 'rbf', options: ['linear', 'poly', 'rbf', 'sigmoid'] },
         epsilon: { type: 'number', value: 0.1, min: 0.01, max: 1, step: 0.01 }
       },
+    },
+    'HistGradientBoostingRegressor': {
+      displayName: 'Histogram Gradient Boosting Regressor',
+      parameters: {
+        max_iter: { type: 'number', value: 100, min: 10, max: 1000 },
+        learning_rate: { type: 'number', value: 0.1, min: 0.01, max: 1, step: 0.01 },
+        max_leaf_nodes: { type: 'number', value: 31, min: 2, max: 255 },
+        max_depth: { type: 'number', value: '', min: 1, max: 20, placeholder: 'None' },
+        l2_regularization: { type: 'number', value: 0, min: 0, max: 10, step: 0.1 }
+      },
     }
   }
 };
@@ -215,6 +239,8 @@ const Playground = () => {
     test_size: 0.25,
     random_state: 42,
     stratify: false,
+    outlier_method: 'iqr',
+    cv_folds: 0,
     model_type: null,
     parameters: {},
   });
@@ -238,6 +264,7 @@ const Playground = () => {
       
       const response = await axios.post(`${API_URL}/file/dataset-preview/`, formData, {
         headers: {
+          'Authorization': `Bearer ${accessToken}`,
           'Content-Type': 'multipart/form-data'
         }
       });
@@ -724,6 +751,44 @@ if (uniqueLabels.size < 2) {
     return {};
   };
 
+// Give up polling after 30 minutes; the server fails jobs whose worker went away well before that
+const JOB_POLL_INTERVAL_MS = 1500;
+const JOB_POLL_MAX_ATTEMPTS = 1200;
+
+const waitForTrainingJob = async (jobId) => {
+  for (let attempt = 0; attempt < JOB_POLL_MAX_ATTEMPTS; attempt++) {
+    const response = await axios.get(`${API_URL}/file/train/${jobId}/result/`, {
+      headers: {
+        'Authorization': `Bearer ${accessToken}`,
+      }
+    });
+    if (response.status === 200) {
+      return response;
+    }
+    await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+  }
+  throw new Error('Training is taking too long to finish. Please try again later.');
+};
+
+// Ask the server whether it already has this file, so a repeat upload can be skipped
+const findExistingDataset = async (file) => {
+  // Hashing a very large file takes longer than it's worth; just upload it
+  if (file.size > HASH_CHECK_MAX_BYTES) return null;
+  try {
+    const sha256 = await hashFile(file);
+    const response = await axios.post(`${API_URL}/file/upload/check/`, { sha256, size: file.size }, {
+      headers: {
+        'Authorization': `Bearer ${accessToken}`,
+      }
+    });
+    return response.data.exists ? response.data.dataset_id : null;
+  } catch (err) {
+    // Fall back to a normal upload
+    console.warn('Dataset check failed:', err);
+    return null;
+  }
+};
+
 const handleSubmit = async (e) => {
   e.preventDefault();
   setIsLoading(true);
@@ -736,7 +801,12 @@ const handleSubmit = async (e) => {
 
   try {
     const formDataToSend = new FormData();
-    formDataToSend.append('dataset', dataset);
+    const existingDatasetId = await findExistingDataset(dataset);
+    if (existingDatasetId) {
+      formDataToSend.append('dataset_id', existingDatasetId);
+    } else {
+      formDataToSend.append('dataset', dataset);
+    }
     formDataToSend.append('name', fileDisplayName);
     
     const config = {
@@ -760,13 +830,19 @@ const handleSubmit = async (e) => {
 
     console.log('Sending config:', config);
 
-    const response = await axios.post(`${API_URL}/file/train/`, formDataToSend, {
+    const jobResponse = await axios.post(`${API_URL}/file/train/`, formDataToSend, {
       headers: {
         'Content-Type': 'multipart/form-data',
         'Authorization': `Bearer ${accessToken}`,
       }
     });
 
+    // Training runs in a background job; poll until the result is ready
+    // (identical earlier runs come back from the training cache straight away)
+    const response = jobResponse.data.result ?
+      { data: jobResponse.data.result } :
+      await waitForTrainingJob(jobResponse.data.job_id);
+
     console.log('Training results:', response.data);
 
     // Set complete results first
@@ -833,10 +909,7 @@ const handleSaveModel = async () => {
     // };
     const payload = {
       name: results.name,
-      model_cache_key: results.model_cache_key,
-      encoder_cache_key: results.encoder_cache_key,
-      scaler_cache_key: results.scaler_cache_key,
-      target_encoder_cache_key: results.target_encoder_cache_key,
+      pipeline_cache_key: results.pipeline_cache_key,
       dataset: results.dataset,
       accuracy: results.accuracy,
       config: results.config // Stringify the config object
@@ -1407,6 +1480,39 @@ const handleSaveModel = async () => {
                       <option value="None">None</option>
                     </select>
                   </div>
+
+                  <div>
+                    <label className="block text-sm font-medium text-[var(--color-gray-700)] mb-1">
+                      Outlier Removal
+                    </label>
+                    <select
+                      name="outlier_method"
+                      value={formData.outlier_method}
+                      onChange={handleChange}
+                      className="mt-1 block w-full pl-3 pr-10 py-2 text-base border border-[var(--color-gray-300)] focus:outline-none focus:ring-[var(--color-primary-500)] focus:border-[var(--color-primary-500)] sm:text-sm rounded-md"
+                    >
+                      <option value="iqr">IQR (1.5x)</option>
+                      <option value="zscore">Z-score (|z| &gt; 3)</option>
+                      <option value="none">None</option>
+                    </select>
+                  </div>
+
+                  <div>
+                    <label className="block text-sm font-medium text-[var(--color-gray-700)] mb-1">
+                      Cross-Validation
+                    </label>
+                    <select
+                      name="cv_folds"
+                      value={formData.cv_folds}
+                      onChange={handleChange}
+                      className="mt-1 block w-full pl-3 pr-10 py-2 text-base border border-[var(--color-gray-300)] focus:outline-none focus:ring-[var(--color-primary-500)] focus:border-[var(--color-primary-500)] sm:text-sm rounded-md"
+                    >
+                      <option value={0}>Off (single split)</option>
+                      <option value={3}>3 folds</option>
+                      <option value={5}>5 folds</option>
+                      <option value={10}>10 folds</option>
+                    </select>
+                  </div>
                   
                   <div>
                     <label className="block text-sm font-medium text-[var(--color-gray-700)] mb-1">